@@ -0,0 +1,210 @@
+# Benchmarks of the hot paths of the application on synthetic databases of several sizes.
+# Every benchmark is timed several times, then run once more under tracemalloc to record the peak memory.
+# The results are written as JSON, a previous result file can be compared with the current run:
+#   python benchmarks/run_benchmarks.py --scales 10k 1M --output bench.json
+#   python benchmarks/run_benchmarks.py --scales 10k 1M --compare bench.json
+# Qt models are created with the "offscreen" platform, so no display is needed.
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import closing
+from os.path import abspath, dirname, join
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from PyQt5.QtWidgets import QApplication
+
+from src.drivers.aggregate_cache import load_banners_with_aggregates
+from src.drivers.data_generator import *
+from src.models.banner_editor import BannerEditor, SortedMode
+from src.models.forecaster import Forecaster
+from src.models.promotion_analyzer import PromotionAnalyser
+
+# Number of shows of the synthetic database for the scale names
+SCALES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+# Approximate number of shows per banner with the generator settings below
+SHOWS_PER_BANNER = 216
+GENERATION_DAYS = 60
+INSERT_BATCH_SIZE = 10_000
+
+
+def measure(function, repeats: int) -> dict:
+    times = []
+    for _ in range(repeats):
+        time_start = perf_counter()
+        function()
+        times.append(perf_counter() - time_start)
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'repeats': repeats, 'min_s': min(times), 'median_s': median(times), 'mean_s': mean(times),
+            'peak_memory_bytes': peak_memory}
+
+
+def generate_database(db_file_name: str, showings: int, seed: int) -> dict:
+    first_day = today() - GENERATION_DAYS
+    settings = GeneratorSettings(banners=max(1, round(showings / SHOWS_PER_BANNER)), first_day=first_day,
+                                 days=GENERATION_DAYS, seed=seed)
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        time_start = perf_counter()
+        banners, generated_showings = DataGenerator(settings).generate(driver)
+        elapsed = perf_counter() - time_start
+    return {'banners': banners, 'showings': generated_showings, 'generation_s': elapsed}
+
+
+# Copy of the database for the benchmarks changing the data, so the other benchmarks run on the generated data
+def copy_database(db_file_name: str, copy_file_name: str):
+    with closing(sqlite3.connect(db_file_name)) as source, closing(sqlite3.connect(copy_file_name)) as copy:
+        source.backup(copy)
+
+
+def skipped(benchmark_names: str, reason: str):
+    print(f'{benchmark_names} skipped: {reason}', flush=True)
+
+
+def run_scale(db_file_name: str, repeats: int) -> dict:
+    results = {}
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        banners = driver.get_all_banners()
+        results['AdvertisDriver.get_all_banners'] = measure(driver.get_all_banners, repeats)
+        # Loading with the cache of the aggregates (the cache is built by the first call)
+        load_banners_with_aggregates(driver)
+        results['load_banners_with_aggregates'] = measure(lambda: load_banners_with_aggregates(driver), repeats)
+        if banners:
+            run_driver_benchmarks(db_file_name, driver, banners, repeats, results)
+        else:
+            skipped('The insert and page benchmarks', 'the database has no banners')
+
+    analyser = PromotionAnalyser()
+    results['PromotionAnalyser.set_banners'] = measure(lambda: analyser.set_banners(banners), repeats)
+    display_day = today() - GENERATION_DAYS // 2
+    results['PromotionAnalyser.set_banners_to_display'] = measure(
+        lambda: analyser.set_banners_to_display(display_day), repeats)
+    results['PromotionAnalyser.get_alltime_data'] = measure(analyser.get_alltime_data, repeats)
+
+    results['Forecaster.set_banners'] = measure(lambda: Forecaster().set_banners(banners), repeats)
+
+    editor = BannerEditor(db_file_name=db_file_name)
+    try:
+        results['BannerEditor.sort_banners'] = measure(lambda: (editor.sort_banners(SortedMode.by_date_end),
+                                                                editor.sort_banners(SortedMode.by_date_start)),
+                                                       repeats)
+        if editor.rowCount() > 0:
+            run_editor_benchmarks(editor, repeats, results)
+        else:
+            skipped('The benchmarks of the shows of the banner editor', 'the database has no banners')
+    finally:
+        editor.close()
+    return results
+
+
+def run_driver_benchmarks(db_file_name: str, driver: AdvertisDriver, banners: list[Banner], repeats: int,
+                          results: dict):
+    banner = banners[0]
+    showing = ShowingShortData('website1.com', banner.date_start * MINUTES_PER_DAY + 12 * 60)
+    copy_file_name = db_file_name + '.insert.db'
+    copy_database(db_file_name, copy_file_name)
+    with closing(AdvertisDriver(copy_file_name)) as copy_driver:
+        results['AdvertisDriver.insert_showings'] = measure(
+            lambda: copy_driver.insert_showings((showing for _ in range(INSERT_BATCH_SIZE)), banner.id), repeats)
+    os.remove(copy_file_name)
+    # Page following the first half of the shows of the first banner with shows
+    banner = next((banner for banner in banners if banner.total_showings() > 0), None)
+    if banner is None:
+        skipped('AdvertisDriver.get_showings_page', 'the banners have no shows')
+        return
+    middle = driver.get_showings_page(banner.id, None, max(1, banner.total_showings() // 2))[-1]
+    results['AdvertisDriver.get_showings_page'] = measure(
+        lambda: driver.get_showings_page(banner.id, (middle.ts, middle.id)), repeats)
+
+
+def run_editor_benchmarks(editor: BannerEditor, repeats: int, results: dict):
+    # Opening the banner with the most shows in the editor (only the first page of the shows is read)
+    heaviest = max(range(editor.rowCount()), key=lambda row: editor.get_banners()[row].total_showings())
+    results['BannerEditor.get_banner_short_data'] = measure(lambda: editor.get_banner_short_data(heaviest), repeats)
+    # Shows are added to the last day of the banner with the largest limit of shows per day
+    index, banner = max(enumerate(editor.get_banners()), key=lambda item: item[1].max_showings)
+    new_showing = ShowingShortData('website1.com', banner.date_end * MINUTES_PER_DAY + 12 * 60)
+    free_showings = banner.max_showings - banner.count_showings_for_day(banner.date_end) - 1
+    if free_showings <= 0:
+        skipped('BannerEditor.add_showing', 'the last day of the banner has no free shows')
+        return
+    add_repeats = max(1, min(repeats, free_showings))
+    results['BannerEditor.add_showing'] = measure(lambda: editor.add_showing(new_showing, index), add_repeats)
+
+
+def compare(previous: dict, current: dict, threshold: float) -> bool:
+    regressions = False
+    print(f'\n{"scale":>6} {"benchmark":<42} {"previous":>10} {"current":>10} {"ratio":>7}')
+    for scale, scale_results in current['scales'].items():
+        previous_scale = previous['scales'].get(scale, {}).get('benchmarks', {})
+        for name, result in scale_results['benchmarks'].items():
+            if name not in previous_scale:
+                continue
+            ratio = result['median_s'] / max(previous_scale[name]['median_s'], 1e-9)
+            mark = '  REGRESSION' if ratio > threshold else ''
+            regressions = regressions or ratio > threshold
+            print(f'{scale:>6} {name:<42} {previous_scale[name]["median_s"]:>10.4f} '
+                  f'{result["median_s"]:>10.4f} {ratio:>7.2f}{mark}')
+    return regressions
+
+
+def print_results(results: dict):
+    print(f'\n{"scale":>6} {"benchmark":<42} {"median, s":>10} {"min, s":>10} {"peak, MiB":>10}')
+    for scale, scale_results in results['scales'].items():
+        for name, result in scale_results['benchmarks'].items():
+            print(f'{scale:>6} {name:<42} {result["median_s"]:>10.4f} {result["min_s"]:>10.4f} '
+                  f'{result["peak_memory_bytes"] / 2 ** 20:>10.1f}')
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Benchmarks of the driver, analyser, forecaster and Qt models.')
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['10k', '1M'],
+                        help='sizes of the synthetic databases (number of shows)')
+    parser.add_argument('--repeats', type=int, default=5, help='number of timed runs of each benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the data generator')
+    parser.add_argument('--output', default='benchmark_results.json', help='file for the results (JSON)')
+    parser.add_argument('--compare', default=None, help='results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='ratio of the median times reported as a regression')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    app = QApplication(sys.argv[:1])
+    results = {'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                           'numpy': np.__version__, 'sqlite': sqlite3.sqlite_version},
+               'repeats': args.repeats, 'seed': args.seed, 'scales': {}}
+    with TemporaryDirectory() as work_dir:
+        for scale in args.scales:
+            db_file_name = join(work_dir, f'benchmark_{scale}.db')
+            print(f'Scale {scale}: generating the database...', flush=True)
+            database = generate_database(db_file_name, SCALES[scale], args.seed)
+            benchmarks = run_scale(db_file_name, args.repeats)
+            results['scales'][scale] = {'database': database, 'benchmarks': benchmarks}
+    # Max resident set size of the process (KiB on Linux)
+    results['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del app
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print_results(results)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            if compare(json.load(file), results, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# Read-only HTTP API with the results of the promotion analysis and the forecasts (JSON), for example:
+# python api_server.py --db advertisement.db --port 8080
+# curl http://127.0.0.1:8080/banners
+# curl http://127.0.0.1:8080/banners/1/forecast
+# curl "http://127.0.0.1:8080/completion?date=2024-01-15"
+# curl http://127.0.0.1:8080/totals
+# The server uses only the standard library (asyncio), the results are cached until the database is changed
+# The database is opened read-only, it must be created (or migrated) by the application first
+import asyncio
+import json
+import re
+import secrets
+import sys
+from argparse import ArgumentParser
+from http import HTTPStatus
+from os.path import abspath, dirname, join
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from src.models.analysis_cache import *
+
+# Max size of the request line and headers
+MAX_REQUEST_HEAD_SIZE = 16 * 1024
+# Time in seconds a persistent connection waits for the next request before it is closed
+IDLE_TIMEOUT = 15.0
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# region Calculation of the responses (called in the worker thread of the cache, return JSON bytes)
+def _to_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _banner_json(banner: ReportBanner) -> dict:
+    return {'id': banner.id, 'name': banner.name, 'company_name': banner.company_name,
+            'date_start': day_to_iso(banner.first_day), 'date_end': day_to_iso(banner.last_day),
+            'min_shows': banner.min_showings, 'max_shows': banner.max_showings,
+            'fact_shows': sum(banner.day_counts.values())}
+
+
+def banners_response(snapshot: AnalysisSnapshot) -> bytes:
+    return _to_json([_banner_json(banner) for banner in snapshot.banners.values()])
+
+
+def banner_response(snapshot: AnalysisSnapshot, banner_id: int) -> bytes:
+    return _to_json(_banner_json(snapshot.banners[banner_id]))
+
+
+# Completion of the min number of shows for the day by the banners acting on this day
+def completion_response(snapshot: AnalysisSnapshot, day: int) -> bytes:
+    banners = (banner for banner in snapshot.banners.values() if banner.first_day <= day <= banner.last_day)
+    return _to_json(list(completion_rows(banners, day, day)))
+
+
+def totals_response(snapshot: AnalysisSnapshot) -> bytes:
+    return _to_json(totals_row(snapshot.banners.values()))
+
+
+def forecasts(snapshot: AnalysisSnapshot, current_day: int) -> dict[int, list[tuple[int, int]]]:
+    return forecast_for_banners(list(snapshot.banners.values()), snapshot.days, snapshot.counts, current_day)
+
+
+def forecast_response(snapshot: AnalysisSnapshot, banner_id: int, banner_forecast: list[tuple[int, int]]) -> bytes:
+    banner = snapshot.banners[banner_id]
+    return _to_json({'banner_id': banner_id,
+                     'forecast': [{'date': day_to_iso(day), 'forecast_shows': showings,
+                                   'min_shows': banner.min_showings, 'max_shows': banner.max_showings}
+                                  for day, showings in banner_forecast]})
+
+
+# endregion
+
+
+class ApiServer:
+    # idle_timeout - seconds a connection waits for the next request
+    def __init__(self, cache: AnalysisCache, idle_timeout: float = IDLE_TIMEOUT):
+        self._cache = cache
+        self._idle_timeout = idle_timeout
+        # The data version is counted by the connection of the cache from its opening, so the ETags of
+        # a restarted server must differ from the ETags of the previous one
+        self._etag_prefix = secrets.token_hex(8)
+        # (path pattern, handler) - the handler gets the snapshot, the query and the groups of the pattern
+        self._routes = [(re.compile(r'/banners/?'), self._banners),
+                        (re.compile(r'/banners/(\d+)/?'), self._banner),
+                        (re.compile(r'/banners/(\d+)/forecast/?'), self._forecast),
+                        (re.compile(r'/completion/?'), self._completion),
+                        (re.compile(r'/totals/?'), self._totals)]
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle_connection, host, port, limit=MAX_REQUEST_HEAD_SIZE)
+
+    # region Handlers of the endpoints, return JSON bytes
+    async def _banners(self, snapshot: AnalysisSnapshot, query: dict) -> bytes:
+        return await self._cache.compute(snapshot, 'banners', banners_response, snapshot)
+
+    async def _banner(self, snapshot: AnalysisSnapshot, query: dict, banner_id: str) -> bytes:
+        banner_id = self._existing_banner_id(snapshot, banner_id)
+        return await self._cache.compute(snapshot, ('banner', banner_id), banner_response, snapshot, banner_id)
+
+    async def _completion(self, snapshot: AnalysisSnapshot, query: dict) -> bytes:
+        try:
+            day = iso_to_day(query['date'][0])
+        except (KeyError, ValueError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'The "date" parameter (YYYY-MM-DD) is required.')
+        return await self._cache.compute(snapshot, ('completion', day), completion_response, snapshot, day)
+
+    async def _totals(self, snapshot: AnalysisSnapshot, query: dict) -> bytes:
+        return await self._cache.compute(snapshot, 'totals', totals_response, snapshot)
+
+    # The forecast is calculated for all banners at once and cached for the current day
+    async def _forecast(self, snapshot: AnalysisSnapshot, query: dict, banner_id: str) -> bytes:
+        banner_id = self._existing_banner_id(snapshot, banner_id)
+        current_day = today()
+        all_forecasts = await self._cache.compute(snapshot, ('forecasts', current_day), forecasts,
+                                                  snapshot, current_day)
+        return await self._cache.compute(snapshot, ('forecast', current_day, banner_id), forecast_response,
+                                         snapshot, banner_id, all_forecasts.get(banner_id, []))
+
+    @staticmethod
+    def _existing_banner_id(snapshot: AnalysisSnapshot, banner_id: str) -> int:
+        banner_id = int(banner_id)
+        if banner_id not in snapshot.banners:
+            raise HttpError(HTTPStatus.NOT_FOUND, f'Banner {banner_id} was not found.')
+        return banner_id
+
+    # endregion
+
+    # region HTTP/1.1 protocol (GET and HEAD requests, persistent connections)
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self._idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._write_response(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                               _to_json({'error': 'The request head is too large.'}), False)
+                    break
+                except asyncio.IncompleteReadError:
+                    break
+                method, target, keep_alive, headers = self._parse_head(head)
+                content_length = headers.get('content-length', '0') or '0'
+                if not (content_length.isascii() and content_length.isdigit()):
+                    await self._write_response(writer, HTTPStatus.BAD_REQUEST,
+                                               _to_json({'error': 'The Content-Length header is not valid.'}), False)
+                    break
+                if int(content_length) > 0:
+                    await asyncio.wait_for(reader.readexactly(int(content_length)), self._idle_timeout)
+                status, body, etag = await self._respond(method, target, headers)
+                await self._write_response(writer, status, body, keep_alive, etag, method == 'HEAD')
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> tuple[str, str, bool, dict[str, str]]:
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        method, target, version = parts if len(parts) == 3 else ('', '', 'HTTP/1.0')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method, target, keep_alive, headers
+
+    async def _respond(self, method: str, target: str, headers: dict[str, str]) -> tuple[HTTPStatus, bytes, str]:
+        try:
+            if method not in ('GET', 'HEAD'):
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, 'Only GET and HEAD requests are supported.')
+            url = urlsplit(target)
+            for pattern, handler in self._routes:
+                match = pattern.fullmatch(url.path)
+                if match is not None:
+                    snapshot = await self._cache.snapshot()
+                    # The responses do not change until the database is changed (and the forecast - until tomorrow)
+                    etag = f'"{self._etag_prefix}-{snapshot.data_version}-{today()}"'
+                    if headers.get('if-none-match') == etag:
+                        return HTTPStatus.NOT_MODIFIED, b'', etag
+                    return HTTPStatus.OK, await handler(snapshot, parse_qs(url.query), *match.groups()), etag
+            raise HttpError(HTTPStatus.NOT_FOUND, f'Unknown path: {url.path}')
+        except HttpError as ex:
+            return ex.status, _to_json({'error': str(ex)}), ''
+        except Exception as ex:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, _to_json({'error': str(ex.args[0]) if ex.args else repr(ex)}), ''
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, body: bytes, keep_alive: bool,
+                              etag: str = '', head_only: bool = False):
+        head = [f'HTTP/1.1 {status.value} {status.phrase}',
+                'Content-Type: application/json; charset=utf-8',
+                f'Content-Length: {len(body)}',
+                f'Connection: {"keep-alive" if keep_alive else "close"}']
+        if etag:
+            head.append(f'ETag: {etag}')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if not head_only and status != HTTPStatus.NOT_MODIFIED:
+            writer.write(body)
+        await writer.drain()
+
+    # endregion
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Read-only HTTP API with the results of the promotion analysis (JSON).')
+    parser.add_argument('--db', default=DEFAULT_DB_FILE_NAME, help='database file (default: the application database)')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--check-interval', type=float, default=DEFAULT_CHECK_INTERVAL,
+                        help='min interval in seconds between the checks of the database for changes')
+    return parser.parse_args(args)
+
+
+async def serve(args):
+    cache = AnalysisCache(args.db, args.check_interval)
+    server = await ApiServer(cache).start(args.host, args.port)
+    print(f'Serving on {", ".join(str(sock.getsockname()) for sock in server.sockets)}', flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await cache.close()
+
+
+def main(args=None):
+    try:
+        asyncio.run(serve(parse_args(args)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
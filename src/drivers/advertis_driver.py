@@ -1,25 +1,261 @@
 import sqlite3
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from itertools import groupby, islice
+from operator import itemgetter
 from os.path import dirname, join
 from random import randint
 
+import numpy as np
+
+from src.drivers.connection_pool import *
 from src.models.banner import *
 from src.models.showing import *
+from src.models.tracing import *
+
+# Version of the database schema, stored in "PRAGMA user_version"
+SCHEMA_VERSION = 2
+# Rollup of the number of shows per banner per day (day - day ordinal of the show time, see date_ordinals)
+DAILY_SHOWINGS_TABLE_SQL = """ CREATE TABLE IF NOT EXISTS "daily_showings"(
+                           "banner_id" INTEGER NOT NULL,
+                           "day" INTEGER NOT NULL,
+                           "count" INTEGER NOT NULL,
+                           PRIMARY KEY("banner_id", "day") ) WITHOUT ROWID;
+                           """
+# Change counters of the banners for the caches of the aggregates (see aggregate_cache).
+# The counter of a banner is incremented by the triggers when the dates of the banner or its numbers of shows
+# per day change. The counters are never reset (the table is kept when the other tables are recreated)
+AGGREGATE_CHANGES_TABLE_SQL = """ CREATE TABLE IF NOT EXISTS "aggregate_changes"(
+                              "banner_id" INTEGER NOT NULL,
+                              "counter" INTEGER NOT NULL,
+                              PRIMARY KEY("banner_id") ) WITHOUT ROWID;
+                              """
+# Triggers suspended by the running bulk insert (see AdvertisDriver._suspend_triggers). The rows are inserted
+# and deleted inside the transaction of the insert, so the other connections never see them
+# and an interrupted insert leaves no rows
+SUSPENDED_TRIGGERS_TABLE_SQL = """ CREATE TABLE IF NOT EXISTS "suspended_triggers"(
+                               "name" TEXT NOT NULL,
+                               PRIMARY KEY("name") ) WITHOUT ROWID;
+                               """
+# Triggers of the change counters suspended by the bulk inserts of the shows
+ROLLUP_CHANGES_TRIGGERS = ('daily_showings_insert_changes', 'daily_showings_update_changes')
+# Number of banner ids in one "IN (...)" list
+IN_LIST_CHUNK_SIZE = 500
+# Number of rows written by one "executemany" call of the bulk insert methods
+BULK_CHUNK_SIZE = 10000
+# Default number of shows read by one get_showings_page call
+SHOWINGS_PAGE_SIZE = 256
+# Number of rows fetched at once by the streaming reads of the exports
+EXPORT_FETCH_SIZE = 10000
+DEFAULT_DB_FILE_NAME = join(dirname(__file__), '../resources/advertisement.db')
+
+
+# SQL expression converting the "dd.MM.yyyy" date of the banners table to the day ordinal
+# (2440587.5 - Julian day of 01.01.1970 00:00)
+def _text_date_to_day_sql(column: str) -> str:
+    return (f"CAST(julianday(substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' "
+            f"|| substr({column}, 1, 2)) - 2440587.5 AS INTEGER)")
+
+
+# Escaping the special characters of the LIKE pattern (the escape character is the backslash)
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Condition of a trigger that may be suspended by the bulk inserts
+def _not_suspended_sql(trigger_name: str) -> str:
+    return f"WHEN NOT EXISTS (SELECT 1 FROM suspended_triggers WHERE name = '{trigger_name}')"
+
+
+# " WHERE ..." clause of the conditions joined by AND ('' - no conditions)
+def _where_sql(conditions: list[str]) -> str:
+    return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+# The methods of AdvertisDriver changing the database hold the writer connection of the pool
+def _writing(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._pool.writing():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
+# The drivers of one database file share the connections (see ConnectionPool): the data is changed by the writer
+# connection (self._con), the reads use the read-only connection of the calling thread (self._read_con),
+# so a driver may be used by several threads
 class AdvertisDriver:
-    def __init__(self):
-        self.__db_file_name = join(dirname(__file__), '../resources/advertisement.db')
-        self._con = sqlite3.connect(self.__db_file_name)
-        self.create_banners_table()
-        self.create_showings_table()
+    # settings - settings of the connections, applied if there are no other drivers of the file.
+    # A read-only driver (settings.read_only) does not change the schema, the schema version of the file
+    # must be SCHEMA_VERSION
+    def __init__(self, db_file_name: str = DEFAULT_DB_FILE_NAME, settings: ConnectionSettings = None):
+        self.__db_file_name = db_file_name
+        self._pool = ConnectionPool.acquire(db_file_name, settings)
+        self._con = self._pool.writer
+        if settings is not None and settings.read_only:
+            self._check_schema_version()
+            return
+        with self._pool.writing():
+            self._migrate_schema()
+            self.create_banners_table()
+            self.create_showings_table()
+            self.create_daily_showings_table()
+            self.create_aggregate_changes_table()
+
+    def close(self):
+        self._pool.release()
+
+    @property
+    def _read_con(self) -> sqlite3.Connection:
+        return self._pool.reader()
 
+    # Counter changed by the commits of other connections to the database file (used to invalidate caches)
+    def get_data_version(self) -> int:
+        return self._read_con.execute("PRAGMA data_version").fetchone()[0]
+
+    @traced(category='sqlite')
+    @_writing
     def recreate_tables(self):
         self.drop_banners_table()
         self.drop_showings_table()
+        self.drop_daily_showings_table()
         self.create_banners_table()
         self.create_showings_table()
+        self.create_daily_showings_table()
+        self.create_aggregate_changes_table()
+
+    def get_db_file_name(self) -> str:
+        return self.__db_file_name
+
+    # All reads inside see the same state of the database
+    @contextmanager
+    def read_transaction(self):
+        connection = self._read_con
+        connection.execute("BEGIN")
+        try:
+            yield
+        finally:
+            connection.rollback()
+
+    # The changes made by the methods inside are committed in one transaction
+    # (a batch inside a batch is a part of the outer one)
+    @contextmanager
+    def batch(self):
+        with self._pool.writing():
+            if self._pool.in_batch:
+                yield
+                return
+            self._pool.in_batch = True
+            try:
+                with self._transaction():
+                    yield
+            finally:
+                self._pool.in_batch = False
+
+    def _commit(self):
+        if not self._pool.in_batch:
+            self._con.commit()
+
+    # Transaction of the writer connection, it is begun and committed (or rolled back) here only if the writer
+    # is not in a transaction yet, otherwise the changes are a part of the running transaction (see batch).
+    # immediate - the database is locked for writing at the beginning, so the rows read inside are not changed
+    # by other connections before the transaction ends
+    @contextmanager
+    def _transaction(self, immediate: bool = False):
+        if self._con.in_transaction:
+            yield
+            return
+        self._con.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield
+            self._con.commit()
+        except Exception:
+            self._con.rollback()
+            raise
+
+    # First of count ids of the rows of the table inserted later (see EditQueue). The ids are reserved
+    # in sqlite_sequence at once in a short write transaction, so the rows inserted meanwhile by other connections
+    # get other ids (the AUTOINCREMENT ids are never reused, the unused reserved ids are just skipped)
+    @_writing
+    def reserve_ids(self, table_name: str, count: int) -> int:
+        if count <= 0:
+            raise ValueError('The number of reserved ids must be positive.')
+        cur = self._con.cursor()
+        try:
+            with self._transaction(immediate=True):
+                first_id = cur.execute(f"""SELECT max(coalesce((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                                       coalesce((SELECT max(id) FROM "{table_name}"), 0)) + 1""",
+                                       (table_name,)).fetchone()[0]
+                last_id = first_id + count - 1
+                cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (last_id, table_name))
+                if cur.rowcount == 0:
+                    cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table_name, last_id))
+        finally:
+            cur.close()
+        return first_id
+
+    # region Schema migrations
+    # Bringing the database file to the current schema version.
+    # Each migration is applied in its own transaction together with the version number
+    def _migrate_schema(self):
+        migrations = [self._migrate_showings_to_timestamps, self._migrate_add_daily_showings]
+        version = self._con.execute("PRAGMA user_version").fetchone()[0]
+        for new_version in range(version + 1, SCHEMA_VERSION + 1):
+            with self._transaction():
+                migrations[new_version - 1]()
+                self._con.execute(f"PRAGMA user_version = {new_version}")
+
+    def _check_schema_version(self):
+        try:
+            version = self._read_con.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.Error:
+            self.close()
+            raise
+        if version != SCHEMA_VERSION:
+            self.close()
+            raise ValueError(f'The schema version of the database is {version} instead of {SCHEMA_VERSION}, '
+                             f'the database must be opened by the application first.')
+
+    def _table_columns(self, table_name: str) -> list[str]:
+        return [col[1] for col in self._con.execute(f'PRAGMA table_info("{table_name}")')]
+
+    # Version 1: the show time is stored as an integer number of minutes ("ts")
+    # instead of the "dd.MM.yyyy hh:mm" text, which does not sort by time
+    def _migrate_showings_to_timestamps(self):
+        if 'datetime' not in self._table_columns('showings'):
+            return
+        self._con.execute(""" CREATE TABLE "showings_new"(
+                          "id" INTEGER NOT NULL UNIQUE,
+                          "site_name" TEXT NOT NULL,
+                          "ts" INTEGER NOT NULL,
+                          "banner_id" INTEGER NOT NULL,
+                          PRIMARY KEY("id" AUTOINCREMENT) );
+                          """)
+        self._con.execute("""INSERT INTO showings_new (id, site_name, ts, banner_id)
+                          SELECT id, site_name,
+                                 CAST(strftime('%s', substr(datetime, 7, 4) || '-' || substr(datetime, 4, 2) || '-'
+                                      || substr(datetime, 1, 2) || ' ' || substr(datetime, 12, 5)) AS INTEGER) / 60,
+                                 banner_id
+                          FROM showings""")
+        self._con.execute("""UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = 'showings')
+                          WHERE name = 'showings_new' AND EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'showings')""")
+        self._con.execute("DROP TABLE showings")
+        self._con.execute("ALTER TABLE showings_new RENAME TO showings")
+
+    # Version 2: the "daily_showings" rollup is filled from the existing shows
+    # (the table itself and the triggers maintaining it are created on every start)
+    def _migrate_add_daily_showings(self):
+        if not self._table_columns('showings'):
+            return
+        self._con.execute(DAILY_SHOWINGS_TABLE_SQL)
+        self._fill_daily_showings()
+
+    # endregion
 
     # region Banner table
+    @_writing
     def create_banners_table(self):
         cur = self._con.cursor()
         cur.execute(""" CREATE TABLE IF NOT EXISTS "banners"(
@@ -32,33 +268,40 @@ class AdvertisDriver:
                     "max_showings" INTEGER NOT NULL,
                     PRIMARY KEY("id" AUTOINCREMENT) );
                     """)
-        self._con.commit()
+        self._commit()
         cur.close()
 
+    @_writing
     def drop_banners_table(self):
         cur = self._con.cursor()
         cur.execute("DROP TABLE banners")
-        self._con.commit()
+        self._commit()
         cur.close()
 
+    # The banners are ordered by id. The shows are not loaded,
+    # only their numbers per day from the "daily_showings" rollup
+    @traced(category='sqlite')
     def get_all_banners(self) -> list[Banner]:
         b_list = self._get_all_banners_as_list()
+        daily_showings = self.get_daily_showings()
         banners = []
         for b_el in b_list:
-            showings = self.get_showings_for_banner(b_el[0])
             banners.append(Banner(id=b_el[0], name=b_el[1], company_name=b_el[2],
-                                  date_start=QDate.fromString(b_el[3], DATE_FORMAT),
-                                  date_end=QDate.fromString(b_el[4], DATE_FORMAT),
-                                  min_showings=b_el[5], max_showings=b_el[6], showings=showings))
+                                  date_start=b_el[3], date_end=b_el[4], min_showings=b_el[5], max_showings=b_el[6],
+                                  day_counts=daily_showings.get(b_el[0], {})))
         return banners
 
+    # The dates are converted to day ordinals by SQLite
     def _get_all_banners_as_list(self) -> list:
-        cur = self._con.cursor()
-        cur.execute("SELECT * FROM banners")
+        cur = self._read_con.cursor()
+        cur.execute(f"""SELECT id, name, company_name, {_text_date_to_day_sql('date_start')},
+                    {_text_date_to_day_sql('date_end')}, min_showings, max_showings FROM banners ORDER BY id""")
         banners = cur.fetchall()
         cur.close()
         return banners
 
+    @traced(category='sqlite')
+    @_writing
     def update_banner(self, banner: Banner):
         cur = self._con.cursor()
         cur.execute("""UPDATE banners SET name = ?, company_name = ?, date_start = ?, date_end = ?, 
@@ -70,139 +313,541 @@ class AdvertisDriver:
                      banner.min_showings,
                      banner.max_showings,
                      banner.id))
-        self._con.commit()
+        self._commit()
         cur.close()
 
+    @traced(category='sqlite')
+    @_writing
     def delete_banner(self, uid: int):
         cur = self._con.cursor()
         cur.execute(f"DELETE FROM banners WHERE id = {uid}")
         cur.execute(f"DELETE FROM showings WHERE banner_id = {uid}")
-        self._con.commit()
+        self._commit()
         cur.close()
 
-    def insert_banner(self, banner: BannerShortData):
+    # uid - id of the new banner (None - the next id)
+    @traced(category='sqlite')
+    @_writing
+    def insert_banner(self, banner: BannerShortData, uid: int = None):
         cur = self._con.cursor()
-        cur.execute("""INSERT INTO banners (name, company_name, date_start, date_end, min_showings, max_showings)
-                    VALUES (?, ?, ?, ?, ?, ?)""",
-                    (banner.name, banner.company_name, banner.date_start_str(),
+        cur.execute("""INSERT INTO banners (id, name, company_name, date_start, date_end, min_showings,
+                    max_showings) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (uid, banner.name, banner.company_name, banner.date_start_str(),
                      banner.date_end_str(), banner.min_showings, banner.max_showings))
-        self._con.commit()
+        self._commit()
         last_row_id = cur.lastrowid
         cur.close()
         return last_row_id
 
-    def insert_banners(self, banners: list[BannerShortData]):
-        cur = self._con.cursor()
-        for banner in banners:
-            cur.execute("""INSERT INTO banners (name, company_name, date_start, date_end, min_showings, max_showings)
-                        VALUES (?, ?, ?, ?, ?, ?)""",
-                        (banner.name, banner.company_name, banner.date_start_str(),
-                         banner.date_end_str(), banner.min_showings, banner.max_showings))
-        self._con.commit()
-        cur.close()
+    # Inserting banners in one transaction, return the ids of the inserted banners
+    @traced(category='sqlite')
+    def insert_banners(self, banners: Iterable[BannerShortData], chunk_size: int = BULK_CHUNK_SIZE) -> list[int]:
+        rows = ((banner.name, banner.company_name, banner.date_start_str(), banner.date_end_str(),
+                 banner.min_showings, banner.max_showings) for banner in banners)
+        return self._insert_many("""INSERT INTO banners (name, company_name, date_start, date_end,
+                                 min_showings, max_showings) VALUES (?, ?, ?, ?, ?, ?)""", rows, chunk_size)
 
     # endregion
 
     # region Table of records about banner shows
+    @_writing
     def create_showings_table(self):
         cur = self._con.cursor()
         cur.execute(""" CREATE TABLE IF NOT EXISTS "showings"(
                     "id" INTEGER NOT NULL UNIQUE,
                     "site_name" TEXT NOT NULL,
-                    "datetime" TEXT NOT NULL,
+                    "ts" INTEGER NOT NULL,
                     "banner_id" INTEGER NOT NULL,
                     PRIMARY KEY("id" AUTOINCREMENT) );
                     """)
-        self._con.commit()
+        cur.execute('CREATE INDEX IF NOT EXISTS "showings_banner_ts_idx" ON "showings"("banner_id", "ts")')
+        cur.execute('CREATE INDEX IF NOT EXISTS "showings_banner_site_idx" ON "showings"("banner_id", "site_name", "ts")')
+        cur.execute(SUSPENDED_TRIGGERS_TABLE_SQL)
+        self._create_daily_showings_triggers(cur)
+        self._commit()
         cur.close()
 
+    # Triggers keeping the "daily_showings" rollup in sync with the shows table
+    # (the insert trigger is suspended by the bulk inserts counting the rollup themselves)
+    @staticmethod
+    def _create_daily_showings_triggers(cur: sqlite3.Cursor):
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "showings_daily_insert" AFTER INSERT ON "showings"
+                    {_not_suspended_sql('showings_daily_insert')}
+                    BEGIN
+                        INSERT INTO daily_showings (banner_id, day, count)
+                        VALUES (NEW.banner_id, NEW.ts / {MINUTES_PER_DAY}, 1)
+                        ON CONFLICT (banner_id, day) DO UPDATE SET count = count + 1;
+                    END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "showings_daily_delete" AFTER DELETE ON "showings"
+                    BEGIN
+                        UPDATE daily_showings SET count = count - 1
+                        WHERE banner_id = OLD.banner_id AND day = OLD.ts / {MINUTES_PER_DAY};
+                        DELETE FROM daily_showings
+                        WHERE banner_id = OLD.banner_id AND day = OLD.ts / {MINUTES_PER_DAY} AND count <= 0;
+                    END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "showings_daily_update" AFTER UPDATE OF ts, banner_id ON "showings"
+                    BEGIN
+                        UPDATE daily_showings SET count = count - 1
+                        WHERE banner_id = OLD.banner_id AND day = OLD.ts / {MINUTES_PER_DAY};
+                        DELETE FROM daily_showings
+                        WHERE banner_id = OLD.banner_id AND day = OLD.ts / {MINUTES_PER_DAY} AND count <= 0;
+                        INSERT INTO daily_showings (banner_id, day, count)
+                        VALUES (NEW.banner_id, NEW.ts / {MINUTES_PER_DAY}, 1)
+                        ON CONFLICT (banner_id, day) DO UPDATE SET count = count + 1;
+                    END;
+                    """)
+
+    @_writing
     def drop_showings_table(self):
         cur = self._con.cursor()
         cur.execute("DROP TABLE showings")
-        self._con.commit()
+        self._commit()
         cur.close()
 
-    def get_showings_for_banner(self, banner_id: int):
-        cur = self._con.cursor()
-        cur.execute(f"SELECT * FROM showings WHERE banner_id = {banner_id}")
+    @traced(category='sqlite')
+    def get_showings_for_banner(self, banner_id: int) -> list[Showing]:
+        cur = self._read_con.cursor()
+        cur.execute("SELECT * FROM showings WHERE banner_id = ?", (banner_id,))
+        sh_list = cur.fetchall()
+        cur.close()
+        return [self._showing_from_row(sh_el) for sh_el in sh_list]
+
+    # Getting the shows of the banner for one day (range scan over the (banner_id, ts) index)
+    @traced(category='sqlite')
+    def get_showings_for_banner_on_day(self, banner_id: int, day: int) -> list[Showing]:
+        day_start = day * MINUTES_PER_DAY
+        cur = self._read_con.cursor()
+        cur.execute("SELECT * FROM showings WHERE banner_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (banner_id, day_start, day_start + MINUTES_PER_DAY))
+        sh_list = cur.fetchall()
+        cur.close()
+        return [self._showing_from_row(sh_el) for sh_el in sh_list]
+
+    # Page of the shows of the banner in the order of the query: up to limit shows following the show
+    # with the key after (ShowingQuery.sort_key), or the first shows if after is None.
+    # Keyset pagination - every page is a range scan over the (banner_id, ts) or (banner_id, site_name, ts) index
+    # (the id is the rowid, so it is a part of the indexes too), its cost does not depend on the page number.
+    # Filtered out shows are skipped inside the scan
+    @traced(category='sqlite')
+    def get_showings_page(self, banner_id: int, after: tuple = None, limit: int = SHOWINGS_PAGE_SIZE,
+                          query: ShowingQuery = None) -> list[Showing]:
+        query = query if query is not None else ShowingQuery()
+        columns = ('site_name', 'ts', 'id') if query.order == ShowingOrder.by_site else ('ts', 'id')
+        direction = ' DESC' if query.descending else ''
+        conditions = ['banner_id = ?']
+        params = [banner_id]
+        if query.site_substring:
+            conditions.append("site_name LIKE ? ESCAPE '\\'")
+            params.append('%' + _escape_like(query.site_substring) + '%')
+        if query.ts_from is not None:
+            conditions.append('ts >= ?')
+            params.append(query.ts_from)
+        if query.ts_to is not None:
+            conditions.append('ts <= ?')
+            params.append(query.ts_to)
+        if after is not None:
+            conditions.append(f"({', '.join(columns)}) {'<' if query.descending else '>'} "
+                              f"({', '.join('?' * len(columns))})")
+            params.extend(after)
+        cur = self._read_con.cursor()
+        cur.execute(f"""SELECT * FROM showings WHERE {' AND '.join(conditions)}
+                    ORDER BY {', '.join(column + direction for column in columns)} LIMIT ?""", (*params, limit))
         sh_list = cur.fetchall()
         cur.close()
-        showings = []
-        for sh_el in sh_list:
-            showings.append(Showing(id=sh_el[0], site_name=sh_el[1],
-                                    datetime=QDateTime().fromString(sh_el[2], DATETIME_FORMAT),
-                                    banner_id=sh_el[3]))
-        return showings
+        return [self._showing_from_row(sh_el) for sh_el in sh_list]
 
+    @staticmethod
+    def _showing_from_row(sh_el) -> Showing:
+        return Showing(id=sh_el[0], site_name=sh_el[1], ts=sh_el[2], banner_id=sh_el[3])
+
+    @traced(category='sqlite')
+    @_writing
     def update_showing(self, showing: Showing):
         cur = self._con.cursor()
-        cur.execute("""UPDATE showings SET site_name = ?, datetime = ? WHERE id = ?;""",
-                    (showing.site_name, showing.datetime_str(), showing.id))
-        self._con.commit()
+        cur.execute("""UPDATE showings SET site_name = ?, ts = ? WHERE id = ?;""",
+                    (showing.site_name, showing.ts, showing.id))
+        self._commit()
         cur.close()
 
+    @traced(category='sqlite')
+    @_writing
     def delete_showing(self, uid: int):
         cur = self._con.cursor()
         cur.execute(f"DELETE FROM showings WHERE id = {uid}")
-        self._con.commit()
+        self._commit()
         cur.close()
 
-    def insert_showing(self, showing: ShowingShortData, banner_id: int):
+    # uid - id of the new show (None - the next id)
+    @traced(category='sqlite')
+    @_writing
+    def insert_showing(self, showing: ShowingShortData, banner_id: int, uid: int = None):
         cur = self._con.cursor()
-        cur.execute("""INSERT INTO showings (site_name, datetime, banner_id) VALUES (?, ?, ?)""",
-                    (showing.site_name, showing.datetime.toString(DATETIME_FORMAT), banner_id))
-        self._con.commit()
+        cur.execute("""INSERT INTO showings (id, site_name, ts, banner_id) VALUES (?, ?, ?, ?)""",
+                    (uid, showing.site_name, showing.ts, banner_id))
+        self._commit()
         last_row_id = cur.lastrowid
         cur.close()
         return last_row_id
 
-    def insert_showings(self, showings: list[ShowingShortData], banner_id: int):
+    # Inserting shows of one banner in one transaction, return the ids of the inserted shows
+    def insert_showings(self, showings: Iterable[ShowingShortData], banner_id: int,
+                        chunk_size: int = BULK_CHUNK_SIZE) -> list[int]:
+        rows = ((showing.site_name, showing.ts, banner_id) for showing in showings)
+        return self.insert_showing_rows(rows, chunk_size)
+
+    # Inserting raw show records (site_name, ts, banner_id) in one transaction,
+    # return the ids of the inserted shows
+    # rebuild_rollup - the "daily_showings" rollup is rebuilt once at the end of the transaction
+    # instead of being updated by the trigger for every row (faster for loading into an empty table)
+    @traced(category='sqlite')
+    def insert_showing_rows(self, rows: Iterable[tuple[str, int, int]], chunk_size: int = BULK_CHUNK_SIZE,
+                            rebuild_rollup: bool = False) -> list[int]:
+        query = "INSERT INTO showings (site_name, ts, banner_id) VALUES (?, ?, ?)"
+        if not rebuild_rollup:
+            # The change counters are incremented once per banner instead of once per row
+            banner_ids = set()
+            rows = self._remember_banner_ids(rows, banner_ids)
+            return self._insert_many(query, rows, chunk_size, self._suspend_rollup_changes_triggers,
+                                     lambda cur: self._increment_aggregate_changes(cur, banner_ids))
+        return self._insert_many(query, rows, chunk_size, self._suspend_daily_insert_trigger,
+                                 self._rebuild_daily_showings_in_transaction)
+
+    # Inserting raw show records (site_name, ts, banner_id) whose numbers per banner per day are known
+    # to the caller, return the ids of the inserted shows.
+    # daily_counts - rows (banner_id, day, count) of the inserted shows, it is iterated after the rows are inserted
+    # (so it may be counted while the rows are generated). The rollup is incremented once per banner and day
+    # instead of once per row by the trigger
+    @traced(category='sqlite')
+    def insert_counted_showing_rows(self, rows: Iterable[tuple[str, int, int]],
+                                    daily_counts: Iterable[tuple[int, int, int]],
+                                    chunk_size: int = BULK_CHUNK_SIZE) -> list[int]:
+        return self._insert_many("INSERT INTO showings (site_name, ts, banner_id) VALUES (?, ?, ?)", rows, chunk_size,
+                                 self._suspend_daily_insert_trigger,
+                                 lambda cur: self._increment_daily_showings(cur, daily_counts))
+
+    @staticmethod
+    def _remember_banner_ids(rows: Iterable[tuple[str, int, int]], banner_ids: set[int]) -> Iterator[tuple]:
+        for row in rows:
+            banner_ids.add(row[2])
+            yield row
+
+    def _suspend_daily_insert_trigger(self, cur: sqlite3.Cursor):
+        self._suspend_triggers(cur, 'showings_daily_insert')
+
+    def _rebuild_daily_showings_in_transaction(self, cur: sqlite3.Cursor):
+        self._fill_daily_showings()
+        self._resume_triggers(cur, 'showings_daily_insert')
+
+    # Adding the counts to the rollup and resuming the suspended trigger
+    # (the change counters of the banners are incremented by the triggers of the rollup)
+    def _increment_daily_showings(self, cur: sqlite3.Cursor, daily_counts: Iterable[tuple[int, int, int]]):
+        cur.executemany("""INSERT INTO daily_showings (banner_id, day, count) VALUES (?, ?, ?)
+                        ON CONFLICT (banner_id, day) DO UPDATE SET count = count + excluded.count""", daily_counts)
+        self._resume_triggers(cur, 'showings_daily_insert')
+
+    # The triggers do nothing until they are resumed by _resume_triggers in the same transaction.
+    # Unlike dropping and creating the triggers again, the schema is not changed (the prepared statements
+    # of the other connections stay valid) and the triggers are never lost if the process stops
+    @staticmethod
+    def _suspend_triggers(cur: sqlite3.Cursor, *trigger_names: str):
+        cur.executemany("INSERT INTO suspended_triggers (name) VALUES (?)", ((name,) for name in trigger_names))
+
+    @staticmethod
+    def _resume_triggers(cur: sqlite3.Cursor, *trigger_names: str):
+        cur.executemany("DELETE FROM suspended_triggers WHERE name = ?", ((name,) for name in trigger_names))
+
+    # endregion
+
+    # region Rollup table of the number of shows per banner per day
+    @_writing
+    def create_daily_showings_table(self):
         cur = self._con.cursor()
-        for showing in showings:
-            cur.execute("""INSERT INTO showings (site_name, datetime, banner_id) VALUES (?, ?, ?)""",
-                        (showing.site_name, showing.datetime.toString(DATETIME_FORMAT), banner_id))
-        self._con.commit()
+        cur.execute(DAILY_SHOWINGS_TABLE_SQL)
+        self._commit()
+        cur.close()
+
+    @_writing
+    def drop_daily_showings_table(self):
+        cur = self._con.cursor()
+        cur.execute("DROP TABLE daily_showings")
+        self._commit()
+        cur.close()
+
+    # Rebuilding the rollup from scratch from the shows table
+    @traced(category='sqlite')
+    @_writing
+    def rebuild_daily_showings(self):
+        with self._transaction():
+            self._fill_daily_showings()
+
+    def _fill_daily_showings(self):
+        self._con.execute("DELETE FROM daily_showings")
+        self._con.execute(f"""INSERT INTO daily_showings (banner_id, day, count)
+                          SELECT banner_id, ts / {MINUTES_PER_DAY}, COUNT(*) FROM showings
+                          GROUP BY banner_id, ts / {MINUTES_PER_DAY}""")
+
+    # Getting the number of shows per day for all banners
+    # return { banner_id : { day : count } }
+    @traced(category='sqlite')
+    def get_daily_showings(self) -> dict[int, dict[int, int]]:
+        cur = self._read_con.cursor()
+        cur.execute("SELECT banner_id, day, count FROM daily_showings ORDER BY banner_id, day")
+        daily_showings = {}
+        for banner_id, day_rows in groupby(cur, key=itemgetter(0)):
+            daily_showings[banner_id] = {day: count for _, day, count in day_rows}
         cur.close()
+        return daily_showings
+
+    # Getting the number of shows per day for one banner, return { day : count }
+    @traced(category='sqlite')
+    def get_daily_showings_for_banner(self, banner_id: int) -> dict[int, int]:
+        cur = self._read_con.cursor()
+        cur.execute("SELECT day, count FROM daily_showings WHERE banner_id = ? ORDER BY day", (banner_id,))
+        day_counts = dict(cur.fetchall())
+        cur.close()
+        return day_counts
+
+    # Number of shows of the banner for the given day (one primary key lookup)
+    @traced(category='sqlite')
+    def count_showings_for_day(self, banner_id: int, day: int) -> int:
+        cur = self._read_con.cursor()
+        cur.execute("SELECT count FROM daily_showings WHERE banner_id = ? AND day = ?", (banner_id, day))
+        row = cur.fetchone()
+        cur.close()
+        return row[0] if row is not None else 0
 
     # endregion
 
+    # region Change counters of the aggregates
+    @_writing
+    def create_aggregate_changes_table(self):
+        cur = self._con.cursor()
+        cur.execute(AGGREGATE_CHANGES_TABLE_SQL)
+        # Random id of the database, distinguishes the counters of different database files
+        cur.execute('CREATE TABLE IF NOT EXISTS "database_id"("id" INTEGER NOT NULL)')
+        cur.execute('INSERT INTO database_id (id) SELECT random() WHERE NOT EXISTS (SELECT 1 FROM database_id)')
+        self._create_aggregate_changes_triggers(cur)
+        self._commit()
+        cur.close()
+
+    # Triggers incrementing the change counters of the banners
+    @staticmethod
+    def _create_aggregate_changes_triggers(cur: sqlite3.Cursor):
+        def increment(banner_id: str) -> str:
+            return f"""INSERT INTO aggregate_changes (banner_id, counter) VALUES ({banner_id}, 1)
+                    ON CONFLICT (banner_id) DO UPDATE SET counter = counter + 1;"""
+
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "banners_insert_changes" AFTER INSERT ON "banners"
+                    BEGIN {increment('NEW.id')} END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "banners_update_changes"
+                    AFTER UPDATE OF date_start, date_end ON "banners"
+                    WHEN OLD.date_start IS NOT NEW.date_start OR OLD.date_end IS NOT NEW.date_end
+                    BEGIN {increment('NEW.id')} END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "banners_delete_changes" AFTER DELETE ON "banners"
+                    BEGIN {increment('OLD.id')} END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "daily_showings_insert_changes" AFTER INSERT ON "daily_showings"
+                    {_not_suspended_sql('daily_showings_insert_changes')}
+                    BEGIN {increment('NEW.banner_id')} END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "daily_showings_update_changes" AFTER UPDATE ON "daily_showings"
+                    {_not_suspended_sql('daily_showings_update_changes')}
+                    BEGIN {increment('NEW.banner_id')} END;
+                    """)
+        cur.execute(f""" CREATE TRIGGER IF NOT EXISTS "daily_showings_delete_changes" AFTER DELETE ON "daily_showings"
+                    BEGIN {increment('OLD.banner_id')} END;
+                    """)
+
+    def _suspend_rollup_changes_triggers(self, cur: sqlite3.Cursor):
+        self._suspend_triggers(cur, *ROLLUP_CHANGES_TRIGGERS)
+
+    # Incrementing the change counters of the banners and resuming the suspended triggers
+    def _increment_aggregate_changes(self, cur: sqlite3.Cursor, banner_ids: Iterable[int]):
+        cur.executemany("""INSERT INTO aggregate_changes (banner_id, counter) VALUES (?, 1)
+                        ON CONFLICT (banner_id) DO UPDATE SET counter = counter + 1""",
+                        ((banner_id,) for banner_id in banner_ids))
+        self._resume_triggers(cur, *ROLLUP_CHANGES_TRIGGERS)
+
+    def get_database_id(self) -> int:
+        return self._read_con.execute("SELECT id FROM database_id").fetchone()[0]
+
+    # Banners ordered by id with their change counters: (id, counter)
+    @traced(category='sqlite')
+    def iter_banner_changes(self) -> Iterator[tuple[int, int]]:
+        return self._read_con.execute("""SELECT banners.id, coalesce(aggregate_changes.counter, 0) FROM banners
+                                 LEFT JOIN aggregate_changes ON aggregate_changes.banner_id = banners.id
+                                 ORDER BY banners.id""")
+
+    # Banners ordered by id without the dates: (id, name, company_name, min_showings, max_showings)
+    @traced(category='sqlite')
+    def iter_banner_attributes(self) -> Iterator[tuple]:
+        return self._read_con.execute("SELECT id, name, company_name, min_showings, max_showings FROM banners ORDER BY id")
+
+    # First and last days of the given banners (all banners if banner_ids is None) ordered by id:
+    # (id, first day, last day)
+    @traced(category='sqlite')
+    def get_banner_days(self, banner_ids: Iterable[int] = None) -> list[tuple[int, int, int]]:
+        query = f"""SELECT id, {_text_date_to_day_sql('date_start')}, {_text_date_to_day_sql('date_end')}
+                FROM banners"""
+        if banner_ids is None:
+            return self._read_con.execute(query + " ORDER BY id").fetchall()
+        return self._select_for_banners(query + " WHERE id IN ({}) ORDER BY id", banner_ids)
+
+    # Rows of the rollup of the given banners ordered by banner and day: (banner_id, day, count)
+    @traced(category='sqlite')
+    def get_daily_showings_for_banners(self, banner_ids: Iterable[int]) -> list[tuple[int, int, int]]:
+        return self._select_for_banners("""SELECT banner_id, day, count FROM daily_showings
+                                        WHERE banner_id IN ({}) ORDER BY banner_id, day""", banner_ids)
+
+    # Rows of the query for the banners, the ids are inserted into "IN ({})" by chunks.
+    # The rows are ordered by banner id if the query orders the rows of a chunk by banner id
+    def _select_for_banners(self, query: str, banner_ids: Iterable[int]) -> list[tuple]:
+        rows = []
+        banner_ids = iter(sorted(banner_ids))
+        cur = self._read_con.cursor()
+        while chunk := list(islice(banner_ids, IN_LIST_CHUNK_SIZE)):
+            cur.execute(query.format(', '.join('?' * len(chunk))), chunk)
+            rows.extend(cur.fetchall())
+        cur.close()
+        return rows
+
+    # endregion
+
+    # region Streaming reads for the reports (the cursors are iterated lazily, the shows are not loaded)
+    # Banners ordered by id with the dates as day ordinals:
+    # (id, name, company_name, first day, last day, min_showings, max_showings)
+    # showing_filter - only the banners of the filter (its banners and company) are read
+    def iter_banner_rows(self, showing_filter: ShowingFilter = None) -> Iterator[tuple]:
+        conditions, params = self._banner_filter_sql(showing_filter, 'id')
+        return self._read_con.execute(f"""SELECT id, name, company_name, {_text_date_to_day_sql('date_start')},
+                                 {_text_date_to_day_sql('date_end')}, min_showings, max_showings
+                                 FROM banners{_where_sql(conditions)} ORDER BY id""", params)
+
+    # Rows of the rollup ordered by banner and day: (banner_id, day, count)
+    # showing_filter - only the banners of the filter are read. If the filter selects the sites, the numbers
+    # of the shows of the sites are counted from the shows table (the time range of the filter is not applied)
+    def iter_daily_showings(self, showing_filter: ShowingFilter = None) -> Iterator[tuple[int, int, int]]:
+        conditions, params = self._banner_filter_sql(showing_filter, 'banner_id')
+        if showing_filter is None or not showing_filter.filters_sites():
+            return self._read_con.execute(f"""SELECT banner_id, day, count FROM daily_showings{_where_sql(conditions)}
+                                     ORDER BY banner_id, day""", params)
+        conditions.append("site_name = ?")
+        params.append(showing_filter.site_name)
+        return self._read_con.execute(f"""SELECT banner_id, ts / {MINUTES_PER_DAY} AS day, COUNT(*)
+                                 FROM showings{_where_sql(conditions)}
+                                 GROUP BY banner_id, day ORDER BY banner_id, day""", params)
+
+    # Shows of the exports by batches of fetch_size rows (id, banner_id, site_name, ts), only one batch is held
+    # in memory. The shows are ordered by id, or by banner and time if the banners are filtered (the order
+    # of the indexes, so the database does not sort the shows)
+    def iter_export_showing_batches(self, showing_filter: ShowingFilter = None,
+                                    fetch_size: int = EXPORT_FETCH_SIZE) -> Iterator[list[tuple]]:
+        conditions, params = self._banner_filter_sql(showing_filter, 'banner_id')
+        order = "banner_id, ts, id" if conditions else "id"
+        if showing_filter is not None:
+            for condition, value in (("site_name = ?", showing_filter.site_name), ("ts >= ?", showing_filter.ts_from),
+                                     ("ts <= ?", showing_filter.ts_to)):
+                if value is not None:
+                    conditions.append(condition)
+                    params.append(value)
+        cur = self._read_con.cursor()
+        try:
+            cur.execute(f"SELECT id, banner_id, site_name, ts FROM showings{_where_sql(conditions)} ORDER BY {order}",
+                        params)
+            while rows := cur.fetchmany(fetch_size):
+                yield rows
+        finally:
+            cur.close()
+
+    # Conditions of the filter on the banners of the rows and their parameters
+    # (banner_column - column of the banner id of the rows)
+    @staticmethod
+    def _banner_filter_sql(showing_filter: ShowingFilter, banner_column: str) -> tuple[list[str], list]:
+        conditions, params = [], []
+        if showing_filter is None:
+            return conditions, params
+        if showing_filter.banner_ids is not None:
+            conditions.append(f"{banner_column} IN ({', '.join('?' * len(showing_filter.banner_ids))})")
+            params.extend(showing_filter.banner_ids)
+        if showing_filter.company_name is not None:
+            conditions.append(f"{banner_column} IN (SELECT id FROM banners WHERE company_name = ?)")
+            params.append(showing_filter.company_name)
+        return conditions, params
+
+    # Total number of shows of all banners per day, return parallel arrays (day ordinals, counts)
+    @traced(category='sqlite')
+    def get_showings_per_day(self) -> tuple[np.ndarray, np.ndarray]:
+        cur = self._read_con.cursor()
+        rows = cur.execute("SELECT day, SUM(count) FROM daily_showings GROUP BY day").fetchall()
+        cur.close()
+        days = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        counts = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        return days, counts
+
+    # endregion
+
+    # Writing the rows with "executemany" by chunks of chunk_size rows inside one transaction
+    # (or inside the running transaction of a batch).
+    # The rows may be any iterable (including generators), only one chunk is held in memory.
+    # Within the transaction AUTOINCREMENT ids are assigned consecutively,
+    # so the ids of a chunk are restored from the last inserted rowid.
+    # before_insert and after_insert are called with the cursor inside the same transaction
+    @_writing
+    def _insert_many(self, query: str, rows: Iterable[tuple], chunk_size: int,
+                     before_insert=None, after_insert=None) -> list[int]:
+        if chunk_size <= 0:
+            raise ValueError('The chunk size must be positive.')
+        ids = []
+        rows = iter(rows)
+        cur = self._con.cursor()
+        try:
+            with self._transaction():
+                if before_insert is not None:
+                    before_insert(cur)
+                while chunk := list(islice(rows, chunk_size)):
+                    cur.executemany(query, chunk)
+                    last_row_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    ids.extend(range(last_row_id - len(chunk) + 1, last_row_id + 1))
+                if after_insert is not None:
+                    after_insert(cur)
+        finally:
+            cur.close()
+        return ids
+
     # region Random data generation
+    @traced(category='sqlite')
+    @_writing
     def generate_random_data(self):
         self.recreate_tables()
         banners = self._banners_for_rand_gen()
-        self.insert_banners(banners)
-        self._gen_rand_showings(banners)
+        banner_ids = self.insert_banners(banners)
+        self.insert_showing_rows(self._gen_rand_showings(banners, banner_ids))
 
     def _banners_for_rand_gen(self) -> list[BannerShortData]:
-        currd = QDate().currentDate()
-        return [BannerShortData('Banner 1', 'Company 1', currd.addDays(-15), currd.addDays(12), 5, 30),
-                BannerShortData('Banner 2', 'Company 2', currd.addDays(-18), currd.addDays(14), 10, 25),
-                BannerShortData('Banner 3', 'Company 3', currd.addDays(-8), currd.addDays(5), 10, 30),
-                BannerShortData('Banner 4', 'Company 4', currd.addDays(-13), currd.addDays(3), 5, 25),
-                BannerShortData('Banner 5', 'Company 5', currd.addDays(-7), currd.addDays(7), 15, 30),
-                BannerShortData('Banner 6', 'Company 6', currd.addDays(1), currd.addDays(15), 10, 20)]
+        currd = today()
+        return [BannerShortData('Banner 1', 'Company 1', currd - 15, currd + 12, 5, 30),
+                BannerShortData('Banner 2', 'Company 2', currd - 18, currd + 14, 10, 25),
+                BannerShortData('Banner 3', 'Company 3', currd - 8, currd + 5, 10, 30),
+                BannerShortData('Banner 4', 'Company 4', currd - 13, currd + 3, 5, 25),
+                BannerShortData('Banner 5', 'Company 5', currd - 7, currd + 7, 15, 30),
+                BannerShortData('Banner 6', 'Company 6', currd + 1, currd + 15, 10, 20)]
 
     # Generation random shows for list of banners
-    def _gen_rand_showings(self, banners: list[BannerShortData]):
-        for banner_id in range(1, 7):
-            self._gen_rand_showings_for_banner(banners[banner_id - 1], banner_id)
+    def _gen_rand_showings(self, banners: list[BannerShortData], banner_ids: list[int]) -> Iterator[tuple]:
+        for banner, banner_id in zip(banners, banner_ids):
+            yield from self._gen_rand_showings_for_banner(banner, banner_id)
 
-    # Generation random shows for one banner
-    def _gen_rand_showings_for_banner(self, banner: BannerShortData, banner_id):
-        cur = self._con.cursor()
+    # Generation random shows for one banner, yields rows (site_name, ts, banner_id)
+    def _gen_rand_showings_for_banner(self, banner: BannerShortData, banner_id) -> Iterator[tuple]:
         sites = ['website1.com', 'website2.com', 'website3.com', 'website4.com',
                  'website5.com', 'website6.com', 'website7.com', 'website8.com', 'website9.com']
-        date = banner.date_start
-        last_date = QDate().currentDate()
-        while date.daysTo(last_date) > 0:
-            datetime = QDateTime(date)
+        for day in range(banner.date_start, today()):
             shows_amount = randint(1, banner.max_showings)
             for _ in range(shows_amount):
-                cur.execute("""INSERT INTO showings (site_name, datetime, banner_id) VALUES (?, ?, ?)""",
-                            (sites[randint(0, 8)], datetime.addSecs(randint(0, 15000)).toString(DATETIME_FORMAT),
-                             banner_id))
-            date = date.addDays(1)
-        self._con.commit()
-        cur.close()
+                yield sites[randint(0, 8)], day * MINUTES_PER_DAY + randint(0, 15000) // 60, banner_id
 
     # endregion
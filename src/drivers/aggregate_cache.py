@@ -0,0 +1,188 @@
+import logging
+import os
+from dataclasses import dataclass, fields
+from os.path import exists, join
+
+from src.drivers.advertis_driver import *
+
+# Version of the format of the cache files
+AGGREGATES_FORMAT_VERSION = 1
+
+_logger = logging.getLogger(__name__)
+
+
+# Directory of the cache of the aggregates of the database (next to the database file)
+def aggregates_dir(db_file_name: str) -> str:
+    return db_file_name + '.aggregates'
+
+
+# Aggregates of the banners derived from the database: the dates of the banners, the numbers of shows
+# of each banner per day (the "daily_showings" rollup) and the total numbers of shows per day
+# (the source of the weekday profile of the forecast).
+# The arrays are stored as .npy files and memory-mapped when they are loaded, so reading them costs
+# only the pages actually used. The aggregates are valid for the change counters of the banners (see
+# AdvertisDriver.iter_banner_changes), a stale cache is rebuilt only for the changed banners (see load_aggregates)
+@dataclass(slots=True)
+class Aggregates:
+    # Banners ordered by id, their change counters and first and last days of action
+    banner_ids: np.ndarray
+    changes: np.ndarray
+    first_days: np.ndarray
+    last_days: np.ndarray
+    # Numbers of shows per day of the banner banner_ids[i] - days[offsets[i]:offsets[i + 1]] (ordered)
+    # and counts[offsets[i]:offsets[i + 1]]
+    offsets: np.ndarray
+    days: np.ndarray
+    counts: np.ndarray
+    # Total numbers of shows of all banners per day (ordered days with shows)
+    total_days: np.ndarray
+    total_counts: np.ndarray
+
+    # { day ordinal : count } for every banner in the order of banner_ids
+    def all_day_counts(self) -> list[dict[int, int]]:
+        days = self.days.tolist()
+        counts = self.counts.tolist()
+        offsets = self.offsets.tolist()
+        return [dict(zip(days[start:end], counts[start:end])) for start, end in zip(offsets, offsets[1:])]
+
+    # Total number of shows of all banners per day (the same as AdvertisDriver.get_showings_per_day)
+    def showings_per_day(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.total_days, self.total_counts
+
+    # The same as find_min_max_banner_days for the banners of the aggregates
+    def min_max_banner_days(self) -> tuple[int, int]:
+        current_day = today()
+        if len(self.banner_ids) == 0:
+            return current_day + 36500, current_day
+        return int(self.first_days.min()), min(int(self.last_days.max()), current_day)
+
+    # region Files of the cache
+    # The key file is removed before the arrays are written and is written last,
+    # so the files of an interrupted save are never loaded
+    def save(self, directory: str, database_id: int):
+        os.makedirs(directory, exist_ok=True)
+        key_file_name = join(directory, 'key.npy')
+        if exists(key_file_name):
+            os.remove(key_file_name)
+        for array_field in fields(self):
+            self._save_array(join(directory, array_field.name + '.npy'), getattr(self, array_field.name))
+        self._save_array(key_file_name, np.array([AGGREGATES_FORMAT_VERSION, database_id], dtype=np.int64))
+
+    # The arrays are replaced by renaming, so the arrays already memory-mapped by other readers stay valid
+    @staticmethod
+    def _save_array(file_name: str, array: np.ndarray):
+        with open(file_name + '.tmp', 'wb') as file:
+            np.save(file, np.ascontiguousarray(array, dtype=np.int64))
+        os.replace(file_name + '.tmp', file_name)
+
+    # Memory-mapping the cache, return None if there is no cache for the database
+    @classmethod
+    def load(cls, directory: str, database_id: int) -> 'Aggregates':
+        key_file_name = join(directory, 'key.npy')
+        if not exists(key_file_name):
+            return None
+        key = np.load(key_file_name)
+        if key.tolist() != [AGGREGATES_FORMAT_VERSION, database_id]:
+            return None
+        return cls(*(np.load(join(directory, array_field.name + '.npy'), mmap_mode='r')
+                     for array_field in fields(cls)))
+
+    # endregion
+
+
+# Rows of the query as the columns of an int64 array
+def _int_columns(rows: list[tuple], width: int) -> np.ndarray:
+    return np.array(rows, dtype=np.int64).reshape(-1, width)
+
+
+# Aggregates of the current state of the database (it should be called inside a read transaction).
+# The cache is valid if the banners and their change counters did not change, then it is just memory-mapped.
+# Otherwise the aggregates of the unchanged banners are taken from the cache, the dates and the numbers of shows
+# of the new and changed banners are read from the database, and the cache is written again.
+# If the cache cannot be written the aggregates are still returned (the error is logged as a warning)
+@traced(category='model')
+def load_aggregates(driver: AdvertisDriver, directory: str = None) -> Aggregates:
+    directory = directory if directory is not None else aggregates_dir(driver.get_db_file_name())
+    database_id = driver.get_database_id()
+    banner_changes = _int_columns(list(driver.iter_banner_changes()), 2)
+    banner_ids, changes = banner_changes[:, 0], banner_changes[:, 1]
+    try:
+        cached = Aggregates.load(directory, database_id)
+    except (OSError, ValueError):
+        cached = None
+    if cached is not None and np.array_equal(cached.banner_ids, banner_ids) and np.array_equal(cached.changes, changes):
+        return cached
+
+    # Rows of the unchanged banners in the cache (-1 - the banner is read from the database)
+    cached_rows = np.full(len(banner_ids), -1, dtype=np.int64)
+    if cached is not None and len(cached.banner_ids) > 0:
+        positions = np.minimum(np.searchsorted(cached.banner_ids, banner_ids), len(cached.banner_ids) - 1)
+        unchanged = (cached.banner_ids[positions] == banner_ids) & (cached.changes[positions] == changes)
+        cached_rows[unchanged] = positions[unchanged]
+    changed = cached_rows < 0
+    kept_rows = cached_rows[~changed]
+    if changed.all():
+        day_rows = _int_columns(driver.get_banner_days(), 3)
+        rollup = _int_columns(list(driver.iter_daily_showings()), 3)
+    else:
+        changed_ids = banner_ids[changed].tolist()
+        day_rows = _int_columns(driver.get_banner_days(changed_ids), 3)
+        rollup = _int_columns(driver.get_daily_showings_for_banners(changed_ids), 3)
+
+    first_days = np.empty(len(banner_ids), dtype=np.int64)
+    last_days = np.empty(len(banner_ids), dtype=np.int64)
+    first_days[changed], last_days[changed] = day_rows[:, 1], day_rows[:, 2]
+    if len(kept_rows) > 0:
+        first_days[~changed] = cached.first_days[kept_rows]
+        last_days[~changed] = cached.last_days[kept_rows]
+
+    # Rows of the banners for the read rows of the rollup (the rows without a banner are skipped)
+    read_rows = np.searchsorted(banner_ids, rollup[:, 0])
+    with_banner = read_rows < len(banner_ids)
+    with_banner[with_banner] = banner_ids[read_rows[with_banner]] == rollup[with_banner, 0]
+    read_rows, rollup = read_rows[with_banner], rollup[with_banner]
+    # Number of the days with shows of every banner
+    lengths = np.bincount(read_rows, minlength=len(banner_ids)).astype(np.int64)
+    if len(kept_rows) > 0:
+        lengths[~changed] = np.diff(cached.offsets)[kept_rows]
+    offsets = np.zeros(len(banner_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # The read rows take the places of the changed banners, the days of the unchanged banners are copied
+    # from the cache by their ranges (both are ordered by banner id)
+    days = np.empty(offsets[-1], dtype=np.int64)
+    counts = np.empty(offsets[-1], dtype=np.int64)
+    in_changed = np.repeat(changed, lengths)
+    days[in_changed], counts[in_changed] = rollup[:, 1], rollup[:, 2]
+    if len(kept_rows) > 0:
+        kept_lengths = lengths[~changed]
+        # Position of every copied element in the cache: start of its range + index inside the range
+        inside = np.arange(kept_lengths.sum()) - np.repeat(np.cumsum(kept_lengths) - kept_lengths, kept_lengths)
+        source = np.repeat(np.asarray(cached.offsets)[kept_rows], kept_lengths) + inside
+        days[~in_changed] = np.asarray(cached.days)[source]
+        counts[~in_changed] = np.asarray(cached.counts)[source]
+
+    total_days, inverse = np.unique(days, return_inverse=True)
+    total_counts = np.bincount(inverse, weights=counts, minlength=len(total_days)).astype(np.int64)
+    aggregates = Aggregates(banner_ids.copy(), changes.copy(), first_days, last_days, offsets, days, counts,
+                            total_days, total_counts)
+    try:
+        aggregates.save(directory, database_id)
+    except OSError as ex:
+        _logger.warning('The cache of the aggregates was not written to %s: %s', directory, ex)
+    return aggregates
+
+
+# Loading all banners together with the aggregates of the same state of the database.
+# The dates and the numbers of shows per day of the banners are taken from the aggregates
+@traced(category='model')
+def load_banners_with_aggregates(driver: AdvertisDriver) -> tuple[list[Banner], Aggregates]:
+    with driver.read_transaction():
+        aggregates = load_aggregates(driver)
+        attributes = list(driver.iter_banner_attributes())
+    banners = [Banner(id=b_el[0], name=b_el[1], company_name=b_el[2], date_start=date_start, date_end=date_end,
+                      min_showings=b_el[3], max_showings=b_el[4], day_counts=day_counts)
+               for b_el, date_start, date_end, day_counts in zip(attributes, aggregates.first_days.tolist(),
+                                                                 aggregates.last_days.tolist(),
+                                                                 aggregates.all_day_counts(), strict=True)]
+    return banners, aggregates
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from os.path import abspath
+from urllib.request import pathname2url
+
+
+# Settings of the connections to the database file
+@dataclass(slots=True)
+class ConnectionSettings:
+    # Page cache of every connection
+    cache_size_kib: int = 16 * 1024
+    # Size of the memory-mapped part of the file (0 - the file is read by system calls)
+    mmap_size: int = 256 * 1024 * 1024
+    # Time a connection waits for the lock of the database before "database is locked"
+    busy_timeout_ms: int = 5000
+    # True - the file is opened read-only (it must exist), the writer connection cannot change the data
+    read_only: bool = False
+
+
+# Connections of the process to one database file: one writer connection shared by all threads and a read-only
+# connection for every thread using the pool.
+# The database is switched to WAL journal mode with synchronous=NORMAL, so the readers are not blocked by
+# a running write transaction (for example the generation of data) and a commit does not wait for fsync.
+# The writes of the threads are serialized by write_lock (it waits busy_timeout_ms as SQLite does).
+# The pools are shared by the drivers of the same file and mode (see acquire and release)
+class ConnectionPool:
+    # { (absolute file name, read-only) : pool }
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_file_name: str, settings: ConnectionSettings):
+        self._db_file_name = db_file_name
+        self._settings = settings
+        self._users = 0
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        # True - the changes of the writer are committed by the owner of write_lock, not by every method
+        self.in_batch = False
+        self.writer = self._connect()
+        if settings.read_only:
+            self.writer.execute("PRAGMA query_only = ON")
+        else:
+            self.writer.execute("PRAGMA journal_mode = WAL")
+
+    # Pool of the database file, the settings are applied when the pool is created by the first user
+    @classmethod
+    def acquire(cls, db_file_name: str, settings: ConnectionSettings = None) -> 'ConnectionPool':
+        settings = settings if settings is not None else ConnectionSettings()
+        key = (abspath(db_file_name), settings.read_only)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(db_file_name, settings)
+                cls._pools[key] = pool
+            pool._users += 1
+            return pool
+
+    # The connections are closed when the last user releases the pool
+    def release(self):
+        with self._pools_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            del self._pools[(abspath(self._db_file_name), self._settings.read_only)]
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for connection in readers:
+            connection.close()
+        self.writer.close()
+
+    # Read-only connection of the current thread
+    def reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            connection.execute("PRAGMA query_only = ON")
+            self._local.connection = connection
+            with self._readers_lock:
+                self._readers.append(connection)
+        return connection
+
+    # Holding the writer connection, raise sqlite3.OperationalError if another thread writes for longer
+    # than the busy timeout
+    @contextmanager
+    def writing(self):
+        if not self.write_lock.acquire(timeout=self._settings.busy_timeout_ms / 1000):
+            raise sqlite3.OperationalError('database is locked')
+        try:
+            yield self.writer
+        finally:
+            self.write_lock.release()
+
+    # The connections are used by one thread at a time, but may be closed by another one
+    def _connect(self) -> sqlite3.Connection:
+        if self._settings.read_only:
+            connection = sqlite3.connect(f'file:{pathname2url(abspath(self._db_file_name))}?mode=ro', uri=True,
+                                         timeout=self._settings.busy_timeout_ms / 1000, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self._db_file_name, timeout=self._settings.busy_timeout_ms / 1000,
+                                         check_same_thread=False)
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA cache_size = {-int(self._settings.cache_size_kib)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self._settings.mmap_size)}")
+        return connection
@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.drivers.advertis_driver import *
+
+# Distributions of the number of shows of a banner per day
+DAILY_VOLUME_DISTRIBUTIONS = ('uniform', 'poisson')
+
+
+# Settings of the synthetic data generation.
+# Banners start inside the period [first_day, first_day + days) and last 1..max_duration days,
+# their shows are generated for the days of action inside the period
+@dataclass(slots=True)
+class GeneratorSettings:
+    banners: int = 100
+    sites: int = 20
+    first_day: int = 0
+    days: int = 30
+    max_duration: int = 30
+    min_showings_low: int = 5
+    min_showings_high: int = 30
+    max_showings_extra: int = 30
+    # 'uniform' - from 1 to the max number of shows of the banner,
+    # 'poisson' - mean is the middle between the min and max numbers of shows, limited by the max number
+    daily_volume: str = 'uniform'
+    seed: int = 0
+    # Number of banners whose shows are sampled at once
+    banners_per_block: int = 1000
+
+    def __post_init__(self):
+        if self.banners < 0 or self.sites <= 0 or self.days <= 0 or self.max_duration <= 0:
+            raise ValueError('The numbers of banners, sites, days and the duration must be positive.')
+        if not 0 <= self.min_showings_low <= self.min_showings_high or self.max_showings_extra < 0:
+            raise ValueError('Incorrect limits of the number of shows.')
+        if self.daily_volume not in DAILY_VOLUME_DISTRIBUTIONS:
+            raise ValueError(f'Unknown distribution of the daily volume: {self.daily_volume}.')
+
+
+# Generation of deterministic (for the same settings and seed) synthetic banners and shows.
+# The shows are sampled with NumPy by blocks of banners and streamed into the database in one bulk transaction
+class DataGenerator:
+    def __init__(self, settings: GeneratorSettings):
+        self._settings = settings
+        self._rng = np.random.default_rng(settings.seed)
+        self._site_names = np.array([f'website{i + 1}.com' for i in range(settings.sites)], dtype=object)
+
+    # Writing the generated data to the database, return (number of banners, number of shows)
+    def generate(self, driver: AdvertisDriver, recreate_tables: bool = True) -> tuple[int, int]:
+        if recreate_tables:
+            driver.recreate_tables()
+        starts, ends, min_showings, max_showings = self._gen_banners()
+        banner_ids = np.array(driver.insert_banners(self._banner_short_data(starts, ends, min_showings,
+                                                                            max_showings)), dtype=np.int64)
+        showing_ids = driver.insert_showing_rows(self._gen_showing_rows(banner_ids, starts, ends,
+                                                                        min_showings, max_showings),
+                                                 rebuild_rollup=recreate_tables)
+        return len(banner_ids), len(showing_ids)
+
+    def _gen_banners(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        s = self._settings
+        starts = s.first_day + self._rng.integers(0, s.days, s.banners)
+        ends = starts + self._rng.integers(0, s.max_duration, s.banners)
+        min_showings = self._rng.integers(s.min_showings_low, s.min_showings_high + 1, s.banners)
+        max_showings = min_showings + self._rng.integers(0, s.max_showings_extra + 1, s.banners)
+        return starts, ends, min_showings, max_showings
+
+    @staticmethod
+    def _banner_short_data(starts, ends, min_showings, max_showings):
+        for i, (start, end, min_sh, max_sh) in enumerate(zip(starts.tolist(), ends.tolist(),
+                                                             min_showings.tolist(), max_showings.tolist())):
+            yield BannerShortData(f'Banner {i + 1}', f'Company {i % 100 + 1}',
+                                  start, end, min_sh, max_sh)
+
+    # Rows (site_name, ts, banner_id) of the shows, sampled by blocks of banners
+    def _gen_showing_rows(self, banner_ids, starts, ends, min_showings, max_showings):
+        s = self._settings
+        last_day = s.first_day + s.days - 1
+        for block_start in range(0, len(banner_ids), s.banners_per_block):
+            block = slice(block_start, block_start + s.banners_per_block)
+            # Days of action of the banners inside the period, one element per banner and day
+            n_days = np.clip(np.minimum(ends[block], last_day) - starts[block] + 1, 0, None)
+            banner_index = np.repeat(np.arange(len(n_days)), n_days)
+            day_offset = np.arange(len(banner_index)) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+            days = starts[block][banner_index] + day_offset
+            daily_shows = self._gen_daily_volume(min_showings[block][banner_index], max_showings[block][banner_index])
+            # One element per show
+            show_banner_ids = np.repeat(banner_ids[block][banner_index], daily_shows)
+            timestamps = (np.repeat(days, daily_shows) * MINUTES_PER_DAY
+                          + self._rng.integers(0, MINUTES_PER_DAY, len(show_banner_ids)))
+            site_names = self._site_names[self._rng.integers(0, s.sites, len(show_banner_ids))]
+            yield from zip(site_names.tolist(), timestamps.tolist(), show_banner_ids.tolist())
+
+    def _gen_daily_volume(self, min_showings: np.ndarray, max_showings: np.ndarray) -> np.ndarray:
+        if self._settings.daily_volume == 'poisson':
+            return np.minimum(self._rng.poisson((min_showings + max_showings) / 2), max_showings)
+        return self._rng.integers(np.minimum(1, max_showings), max_showings + 1)
@@ -0,0 +1,192 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from src.drivers.showing_import import *
+
+# Size in bytes of the parts of the files parsed by one task of a worker
+IMPORT_PART_SIZE = 4 * 1024 * 1024
+# Number of tasks per worker submitted ahead of the writer (limits the memory of the parsed parts)
+TASKS_PER_WORKER = 2
+
+
+# Part of an imported file: the bytes [start, end) from the beginning of a line to the end of a line
+@dataclass(slots=True)
+class FilePart:
+    file_name: str
+    input_format: str
+    start: int
+    end: int
+    # Positions of the fields in the rows of a CSV file (see csv_columns), None for JSON lines
+    columns: tuple = None
+
+
+# Rows of a part of a file parsed and checked by a worker in compact columns for the writer
+@dataclass(slots=True)
+class ShowingBatch:
+    # Number of the lines of the part
+    line_count: int
+    # Rows that passed the checks of the worker: lines in the part (from 1), indexes of the site names in site_names,
+    # show times (minutes since 01.01.1970 00:00) and banner ids
+    lines: np.ndarray
+    site_codes: np.ndarray
+    site_names: list[str]
+    ts: np.ndarray
+    banner_ids: np.ndarray
+    # Rejected rows in the columns of REJECT_FIELDS (the lines in the part)
+    rejected: list[tuple]
+    # Time of the worker spent on the part
+    seconds: float
+
+    # Chunk of the checked rows for the daily caps check of the writer
+    # (line_offset - number of the lines of the file before the part)
+    def to_chunk(self, line_offset: int) -> ShowingChunk:
+        site_names = np.array(self.site_names, dtype=object)[self.site_codes].tolist()
+        return ShowingChunk(self.lines + line_offset, site_names, None, None,
+                            np.zeros(len(self.lines), dtype=np.int8), self.ts, self.banner_ids)
+
+
+# Parts of about part_size bytes of the file, the parts end at the ends of the lines.
+# So quoted CSV values with line breaks are not supported (they do not occur in the impression logs)
+def split_file(file_name: str, input_format: str, part_size: int = IMPORT_PART_SIZE) -> list[FilePart]:
+    if part_size <= 0:
+        raise ValueError('The part size must be positive.')
+    parts = []
+    with open(file_name, 'rb') as file:
+        columns = None
+        if input_format == 'csv':
+            header = file.readline().decode('utf-8')
+            if not header.strip():
+                return parts
+            columns = csv_columns(next(csv.reader([header])))
+        elif input_format != 'jsonl':
+            raise ValueError(f'Unknown import format: {input_format}.')
+        size = os.fstat(file.fileno()).st_size
+        start = file.tell()
+        while start < size:
+            file.seek(min(start + part_size, size))
+            file.readline()
+            end = min(file.tell(), size)
+            parts.append(FilePart(file_name, input_format, start, end, columns))
+            start = end
+    return parts
+
+
+# region Workers
+# Limits of the banners in the worker process (set by _init_worker)
+_worker_limits: BannerLimits = None
+
+
+def _init_worker(limits: BannerLimits):
+    global _worker_limits
+    _worker_limits = limits
+    disable_child_tracing()
+
+
+# Reading, parsing and checking the rows of the part in a worker process (the checks not depending on
+# the other rows, see BannerLimits.check_rows)
+def parse_part(part: FilePart) -> ShowingBatch:
+    start = perf_counter()
+    with open(part.file_name, 'rb') as file:
+        file.seek(part.start)
+        text = file.read(part.end - part.start).decode('utf-8')
+    line_count = text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+    # The part is read as one chunk (every row takes at least one character)
+    chunk = next(read_chunks(io.StringIO(text, newline=''), part.input_format, len(text) + 1, part.columns), None)
+    if chunk is None:
+        return ShowingBatch(line_count, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), [],
+                            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), [], perf_counter() - start)
+    parse_chunk(chunk)
+    _worker_limits.check_rows(chunk)
+    accepted = np.flatnonzero(chunk.accepted())
+    site_indexes = {}
+    site_codes = np.fromiter((site_indexes.setdefault(chunk.site_names[i], len(site_indexes))
+                              for i in accepted.tolist()), dtype=np.int32, count=len(accepted))
+    return ShowingBatch(line_count, chunk.lines[accepted], site_codes, list(site_indexes), chunk.ts[accepted],
+                        chunk.banner_id_values[accepted], list(chunk.rejected_rows()), perf_counter() - start)
+
+
+# endregion
+
+
+# Import of many files (or of a big file by parts) with a pool of worker processes and a single writer.
+# The workers read, parse and check the parts of the files (see parse_part) and send the rows to the writer
+# in compact columns. The writer (the calling process, it owns the connection of the driver) takes the parts
+# in the order of the files, checks the daily caps (see ShowingValidator.check_daily_caps), writes the rejected
+# rows and inserts the accepted rows of every file in one transaction.
+# The writer inserts the rows of a file while the workers parse the next parts, so the import is limited
+# by the slower of the two: the parsing on all workers or the inserts into SQLite
+class ParallelImporter:
+    # workers - number of the worker processes (None - number of the processors)
+    def __init__(self, driver: AdvertisDriver, workers: int = None, part_size: int = IMPORT_PART_SIZE):
+        self._driver = driver
+        self._workers = workers if workers is not None else os.cpu_count() or 1
+        self._part_size = part_size
+
+    # Importing the files in their order, return the numbers of every file.
+    # input_format - None: by the extensions of the files,
+    # rejects_file_names - files of the rejected rows of the files (None - default_rejects_file_name)
+    @traced(category='import')
+    def import_files(self, file_names: list[str], input_format: str = None,
+                     rejects_file_names: list[str] = None) -> list[ImportStats]:
+        if rejects_file_names is None:
+            rejects_file_names = [default_rejects_file_name(file_name) for file_name in file_names]
+        file_parts = [split_file(file_name, input_format if input_format is not None else import_format(file_name),
+                                 self._part_size) for file_name in file_names]
+        limits = BannerLimits.from_driver(self._driver)
+        executor = ProcessPoolExecutor(self._workers, initializer=_init_worker, initargs=(limits,))
+        try:
+            batches = self._parsed_batches(executor, [part for parts in file_parts for part in parts])
+            # The header of a CSV file is the line before the first part
+            return [self._import_parts(batches, len(parts), 1 if parts and parts[0].columns is not None else 0,
+                                       limits, rejects_file_name)
+                    for parts, rejects_file_name in zip(file_parts, rejects_file_names)]
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    # Parsed parts in the order of the parts, at most TASKS_PER_WORKER tasks per worker are waiting for the writer
+    def _parsed_batches(self, executor: ProcessPoolExecutor, parts: list[FilePart]) -> Iterator[ShowingBatch]:
+        parts = iter(parts)
+        futures = deque(executor.submit(parse_part, part) for part in islice(parts, self._workers * TASKS_PER_WORKER))
+        while futures:
+            future = futures.popleft()
+            part = next(parts, None)
+            if part is not None:
+                futures.append(executor.submit(parse_part, part))
+            yield future.result()
+
+    # Importing the next part_count parsed parts of one file in one transaction
+    def _import_parts(self, batches: Iterator[ShowingBatch], part_count: int, line_offset: int,
+                      limits: BannerLimits, rejects_file_name: str) -> ImportStats:
+        stats = ImportStats()
+        time_start = perf_counter()
+        validator = ShowingValidator(self._driver, limits)
+        rejects = RejectsWriter(rejects_file_name)
+        try:
+            rows = self._accepted_rows(islice(batches, part_count), line_offset, validator, rejects, stats)
+            insert_rows(self._driver, rows, validator, stats)
+        finally:
+            rejects.close()
+        stats.seconds = perf_counter() - time_start
+        return stats
+
+    @staticmethod
+    def _accepted_rows(batches: Iterator[ShowingBatch], line_offset: int, validator: ShowingValidator,
+                       rejects: RejectsWriter, stats: ImportStats) -> Iterator[tuple[str, int, int]]:
+        while True:
+            with stats.stage('wait for workers'):
+                batch = next(batches, None)
+            if batch is None:
+                return
+            stats.add_stage_seconds('read, parse, check (workers)', batch.seconds)
+            with stats.stage('validate'):
+                chunk = batch.to_chunk(line_offset)
+                validator.check_daily_caps(chunk)
+            with stats.stage('write rejects'):
+                rejected = [(line + line_offset, *values) for line, *values in batch.rejected]
+                stats.add_rejected_rows(rejected)
+                rejects.write_rows(sorted(rejected + list(chunk.rejected_rows()), key=lambda row: row[0]))
+            stats.add_chunk(chunk)
+            line_offset += batch.line_count
+            yield from chunk.accepted_rows()
@@ -0,0 +1,505 @@
+import csv
+import json
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from itertools import islice
+from os.path import splitext
+from time import perf_counter
+
+from src.drivers.advertis_driver import *
+
+# Columns of the imported files (the header of a CSV file, the keys of the objects of a JSON lines file)
+IMPORT_FIELDS = ('site_name', 'time', 'banner_id')
+# Columns of the file of the rejected rows (CSV): the line of the row in the imported file, the reason
+# and the values of the row as they were read
+REJECT_FIELDS = ('line', 'reason') + IMPORT_FIELDS
+IMPORT_FORMATS = ('csv', 'jsonl')
+# Number of rows read, validated and inserted at once
+IMPORT_CHUNK_SIZE = 100000
+# Lengths of the times "YYYY-MM-DD HH:MM" and "YYYY-MM-DD HH:MM:SS", positions of the digits
+# and of the separators of the date and the time in them
+_TIME_LENGTH = 16
+_TIME_SECONDS_LENGTH = 19
+_TIME_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15]
+_TIME_SEPARATORS = ((4, '-'), (7, '-'), (13, ':'))
+# Offset of the days in the keys of the (banner, day) groups, so the keys of the days before 1970 are positive too
+_DAY_KEY_OFFSET = 1 << 31
+
+
+# Reason of the rejection of an imported row (accepted - the row is inserted)
+class RejectReason(IntEnum):
+    accepted = 0
+    malformed = 1
+    invalid_site = 2
+    invalid_time = 3
+    invalid_banner_id = 4
+    unknown_banner = 5
+    outside_period = 6
+    max_shows_reached = 7
+
+
+# Format of the imported file by its extension: .csv or .jsonl (.json, .ndjson)
+def import_format(file_name: str) -> str:
+    extension = splitext(file_name)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f'Unknown format of the file {file_name}, the format should be one of: {", ".join(IMPORT_FORMATS)}.')
+
+
+# File of the rejected rows by default: <imported file>.rejects.csv
+def default_rejects_file_name(file_name: str) -> str:
+    return file_name + '.rejects.csv'
+
+
+# Rows of the imported file in columns. The values are kept as they were read (all values of a malformed row
+# are None), they are parsed by parse_chunk and validated by ShowingValidator
+@dataclass(slots=True)
+class ShowingChunk:
+    # Numbers of the lines of the rows in the file (from 1)
+    lines: np.ndarray
+    site_names: list
+    times: list
+    banner_ids: list
+    # Reasons of the rejection of the rows (RejectReason values), the malformed rows are rejected when they are read
+    reasons: np.ndarray
+    # Parsed show times (minutes since 01.01.1970 00:00) and banner ids, valid for the accepted rows only
+    ts: np.ndarray = None
+    banner_id_values: np.ndarray = None
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def accepted(self) -> np.ndarray:
+        return self.reasons == RejectReason.accepted
+
+    # Accepted rows (site_name, ts, banner_id) ordered by banner and time. The rows are inserted in the order
+    # of the indexes of the shows table, so the inserts touch fewer pages of the indexes
+    def accepted_rows(self) -> Iterator[tuple[str, int, int]]:
+        accepted = np.flatnonzero(self.accepted())
+        accepted = accepted[np.lexsort((self.ts[accepted], self.banner_id_values[accepted]))]
+        return zip(map(self.site_names.__getitem__, accepted.tolist()), self.ts[accepted].tolist(),
+                   self.banner_id_values[accepted].tolist())
+
+    # Rejected rows in the columns of REJECT_FIELDS. If the read values are not kept (times and banner_ids
+    # are None), the parsed ones are written
+    def rejected_rows(self) -> Iterator[tuple]:
+        for i in np.flatnonzero(~self.accepted()).tolist():
+            if self.times is None:
+                yield (int(self.lines[i]), RejectReason(int(self.reasons[i])).name, self.site_names[i],
+                       minutes_to_iso(int(self.ts[i])), int(self.banner_id_values[i]))
+            else:
+                yield (int(self.lines[i]), RejectReason(int(self.reasons[i])).name, self.site_names[i],
+                       self.times[i], self.banner_ids[i])
+
+
+# region Reading and parsing
+# Chunks of chunk_size rows of the open file (the whole file is never held in memory).
+# columns - positions of the fields in a CSV file without the header (see csv_columns)
+def read_chunks(file, input_format: str, chunk_size: int = IMPORT_CHUNK_SIZE,
+                columns: tuple[tuple[int, int, int], int] = None) -> Iterator[ShowingChunk]:
+    if chunk_size <= 0:
+        raise ValueError('The chunk size must be positive.')
+    if input_format == 'csv':
+        records = _read_csv_records(file, columns)
+    elif input_format == 'jsonl':
+        records = _read_jsonl_records(file)
+    else:
+        raise ValueError(f'Unknown import format: {input_format}.')
+    while records_chunk := list(islice(records, chunk_size)):
+        lines, site_names, times, banner_ids = (list(column) for column in zip(*records_chunk))
+        reasons = np.where(np.fromiter((site_name is None for site_name in site_names), dtype=bool,
+                                       count=len(site_names)), RejectReason.malformed, RejectReason.accepted)
+        yield ShowingChunk(np.array(lines, dtype=np.int64), site_names, times, banner_ids, reasons.astype(np.int8))
+
+
+# Positions of IMPORT_FIELDS in the rows of a CSV file and the number of columns, by the header of the file
+def csv_columns(header: list[str]) -> tuple[tuple[int, int, int], int]:
+    header = [name.strip() for name in header]
+    missing = [name for name in IMPORT_FIELDS if name not in header]
+    if missing:
+        raise ValueError(f'The file has no columns: {", ".join(missing)}.')
+    return tuple(header.index(name) for name in IMPORT_FIELDS), len(header)
+
+
+# Records (line, site_name, time, banner_id), site_name is None for the malformed rows.
+# The header is read from the file if the columns are not given
+def _read_csv_records(file, columns: tuple[tuple[int, int, int], int] = None) -> Iterator[tuple]:
+    reader = csv.reader(file)
+    if columns is None:
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = csv_columns(header)
+    (site_position, time_position, banner_position), width = columns
+    for values in reader:
+        if not values:
+            continue
+        if len(values) != width:
+            yield reader.line_num, None, None, None
+        else:
+            yield reader.line_num, values[site_position], values[time_position], values[banner_position]
+
+
+def _read_jsonl_records(file) -> Iterator[tuple]:
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict) or any(name not in record for name in IMPORT_FIELDS):
+            yield line_number, None, None, None
+        else:
+            site_name = record['site_name']
+            yield line_number, site_name if site_name is not None else '', record['time'], record['banner_id']
+
+
+# Parsing the times and banner ids of the chunk, the rows with invalid values are rejected
+@traced(category='import')
+def parse_chunk(chunk: ShowingChunk):
+    reasons = chunk.reasons
+    chunk.ts, valid_times = _parse_times(chunk.times)
+    chunk.banner_id_values, valid_banner_ids = _parse_ints(chunk.banner_ids)
+    invalid_site_names = np.fromiter((not site_name or not isinstance(site_name, str)
+                                      for site_name in chunk.site_names), dtype=bool, count=len(chunk))
+    pending = reasons == RejectReason.accepted
+    for invalid, reason in ((invalid_site_names, RejectReason.invalid_site),
+                            (~valid_times, RejectReason.invalid_time),
+                            (~valid_banner_ids, RejectReason.invalid_banner_id)):
+        rejected = pending & invalid
+        reasons[rejected] = reason
+        pending &= ~rejected
+
+
+# ISO 8601 times "YYYY-MM-DD HH:MM[:SS]" (or with "T") to minutes, return (minutes, valid).
+# The texts of another form (only a date, a time zone, fractions of seconds) are invalid, the seconds
+# are dropped (the show times are kept in minutes).
+# All times are parsed by NumPy at once, the times are parsed one by one only if some of them are invalid
+def _parse_times(values: list) -> tuple[np.ndarray, np.ndarray]:
+    texts = np.array([value if isinstance(value, str) and len(value) <= _TIME_SECONDS_LENGTH else ''
+                      for value in values], dtype=f'<U{_TIME_SECONDS_LENGTH}')
+    well_formed = _well_formed_times(texts)
+    # Only the "YYYY-MM-DD HH:MM" part is parsed, NumPy would accept the other forms too
+    texts = np.where(well_formed, texts, '').astype(f'<U{_TIME_LENGTH}')
+    try:
+        times = texts.astype('datetime64[m]')
+    except ValueError:
+        times = np.array([_parse_time(text) for text in texts.tolist()], dtype='datetime64[m]')
+    valid = ~np.isnat(times)
+    return np.where(valid, times.astype(np.int64), 0), valid
+
+
+def _parse_time(text: str) -> np.datetime64:
+    try:
+        return np.datetime64(text, 'm')
+    except ValueError:
+        return np.datetime64('NaT', 'm')
+
+
+# Texts of the form "YYYY-MM-DD HH:MM" or "YYYY-MM-DD HH:MM:SS" ("T" may separate the date and the time).
+# The characters are checked by their positions in the array of the code points of the texts
+def _well_formed_times(texts: np.ndarray) -> np.ndarray:
+    chars = texts.view(np.uint32).reshape(len(texts), _TIME_SECONDS_LENGTH)
+    digits = (chars >= ord('0')) & (chars <= ord('9'))
+    well_formed = digits[:, _TIME_DIGITS].all(axis=1)
+    for position, separator in _TIME_SEPARATORS:
+        well_formed &= chars[:, position] == ord(separator)
+    well_formed &= (chars[:, 10] == ord(' ')) | (chars[:, 10] == ord('T'))
+    # Without the seconds the rest of the text is empty (NumPy pads the texts with zeros)
+    with_seconds = ((chars[:, _TIME_LENGTH] == ord(':')) & digits[:, _TIME_LENGTH + 1:].all(axis=1)
+                    & (chars[:, _TIME_LENGTH + 1] <= ord('5')))
+    return well_formed & ((chars[:, _TIME_LENGTH] == 0) | with_seconds)
+
+
+# Integers (as numbers or texts) to an int64 array, return (values, valid).
+# The values are parsed one by one only if some of them are invalid (other types, for example floats)
+def _parse_ints(values: list) -> tuple[np.ndarray, np.ndarray]:
+    if set(map(type, values)) <= {int, str}:
+        try:
+            return (np.fromiter(map(int, values), dtype=np.int64, count=len(values)),
+                    np.ones(len(values), dtype=bool))
+        except (ValueError, OverflowError):
+            pass
+    parsed = [_parse_int(value) for value in values]
+    valid = np.fromiter((value is not None for value in parsed), dtype=bool, count=len(parsed))
+    return np.fromiter((value if value is not None else 0 for value in parsed), dtype=np.int64,
+                       count=len(parsed)), valid
+
+
+def _parse_int(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    return value if -(1 << 63) <= value < (1 << 63) else None
+
+
+# endregion
+
+
+# Limits of the banners for the validation of the imported shows (the arrays are ordered by banner id)
+@dataclass(slots=True)
+class BannerLimits:
+    banner_ids: np.ndarray
+    first_days: np.ndarray
+    last_days: np.ndarray
+    max_showings: np.ndarray
+
+    @classmethod
+    def from_driver(cls, driver: AdvertisDriver) -> 'BannerLimits':
+        banners = np.array([(row[0], row[3], row[4], row[6]) for row in driver.iter_banner_rows()],
+                           dtype=np.int64).reshape(-1, 4)
+        return cls(*banners.T.copy())
+
+    # Rejecting the rows of unknown banners and the rows outside the validity periods of the banners
+    @traced(category='import')
+    def check_rows(self, chunk: ShowingChunk):
+        reasons = chunk.reasons
+        pending = np.flatnonzero(reasons == RejectReason.accepted)
+        banner_ids = chunk.banner_id_values[pending]
+        if len(self.banner_ids) == 0:
+            reasons[pending] = RejectReason.unknown_banner
+            return
+        positions = np.minimum(np.searchsorted(self.banner_ids, banner_ids), len(self.banner_ids) - 1)
+        known = self.banner_ids[positions] == banner_ids
+        reasons[pending[~known]] = RejectReason.unknown_banner
+        pending, positions = pending[known], positions[known]
+        days = chunk.ts[pending] // MINUTES_PER_DAY
+        outside = (days < self.first_days[positions]) | (days > self.last_days[positions])
+        reasons[pending[outside]] = RejectReason.outside_period
+
+
+# Validation of the imported shows by the same rules as BannerEditor._check_showing_correct, done for the whole
+# chunk with NumPy: the show day is in the validity period of the banner (BannerLimits.check_rows) and the number
+# of shows of the banner per day does not exceed max_showings (check_daily_caps).
+# The numbers of shows per day are taken from the "daily_showings" rollup when the banner is met for the first time
+# and then counted by the validator, so the rows of one import are checked against each other too.
+# As in the application the rows are checked in the order of the file: the first rows of a day are accepted
+class ShowingValidator:
+    # limits - limits of the banners of the database (None - read from the database)
+    def __init__(self, driver: AdvertisDriver, limits: BannerLimits = None):
+        self._driver = driver
+        self.limits = limits if limits is not None else BannerLimits.from_driver(driver)
+        # Banners whose numbers of shows per day are read from the rollup
+        self._counted_banners = np.zeros(len(self.limits.banner_ids), dtype=bool)
+        # Numbers of shows of the counted banners per day: ordered keys of the (banner, day) groups, the counts
+        # and the numbers of the accepted rows of the groups
+        self._group_keys = np.empty(0, dtype=np.int64)
+        self._group_counts = np.empty(0, dtype=np.int64)
+        self._group_accepted = np.empty(0, dtype=np.int64)
+
+    # Validation of a parsed chunk (see parse_chunk), the rejected rows get their reasons
+    def validate(self, chunk: ShowingChunk):
+        self.limits.check_rows(chunk)
+        self.check_daily_caps(chunk)
+
+    # Rejecting the rows over the max number of shows of the banner per day and counting the accepted rows
+    # (the rows of unknown banners and outside the validity periods should be rejected by check_rows).
+    # The rows of every (banner, day) group are ranked in the order of the file by a stable sort
+    @traced(category='import')
+    def check_daily_caps(self, chunk: ShowingChunk):
+        pending = np.flatnonzero(chunk.reasons == RejectReason.accepted)
+        if len(pending) == 0:
+            return
+        banner_ids = chunk.banner_id_values[pending]
+        positions = np.searchsorted(self.limits.banner_ids, banner_ids)
+        self._count_banners(positions)
+        keys = (banner_ids << 32) + (chunk.ts[pending] // MINUTES_PER_DAY + _DAY_KEY_OFFSET)
+        group_keys, group_of_row, group_sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        order = np.argsort(group_of_row, kind='stable')
+        ranks = np.empty(len(pending), dtype=np.int64)
+        ranks[order] = np.arange(len(pending)) - np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+        # Numbers of shows of the groups before the chunk and their limits
+        group_positions = np.minimum(np.searchsorted(self._group_keys, group_keys), max(len(self._group_keys) - 1, 0))
+        counted = np.zeros(len(group_keys), dtype=np.int64)
+        if len(self._group_keys) > 0:
+            found = self._group_keys[group_positions] == group_keys
+            counted[found] = self._group_counts[group_positions[found]]
+        else:
+            found = np.zeros(len(group_keys), dtype=bool)
+        limits = np.empty(len(group_keys), dtype=np.int64)
+        limits[group_of_row] = self.limits.max_showings[positions]
+        chunk.reasons[pending[counted[group_of_row] + ranks >= limits[group_of_row]]] = RejectReason.max_shows_reached
+        added = np.clip(limits - counted, 0, group_sizes)
+        self._group_counts[group_positions[found]] += added[found]
+        self._group_accepted[group_positions[found]] += added[found]
+        self._add_groups(group_keys[~found], added[~found], added[~found])
+
+    # Numbers of the accepted rows per banner per day: (banner_id, day, count).
+    # The rows are counted when the generator is iterated, not when it is created
+    def accepted_daily_counts(self) -> Iterator[tuple[int, int, int]]:
+        accepted = self._group_accepted > 0
+        keys = self._group_keys[accepted]
+        yield from zip((keys >> 32).tolist(), ((keys & 0xFFFFFFFF) - _DAY_KEY_OFFSET).tolist(),
+                       self._group_accepted[accepted].tolist())
+
+    # Reading the numbers of shows per day of the banners (positions in the banner arrays) met for the first time
+    def _count_banners(self, positions: np.ndarray):
+        positions = np.unique(positions)
+        positions = positions[~self._counted_banners[positions]]
+        if len(positions) == 0:
+            return
+        self._counted_banners[positions] = True
+        rollup = np.array(self._driver.get_daily_showings_for_banners(self.limits.banner_ids[positions].tolist()),
+                          dtype=np.int64).reshape(-1, 3)
+        self._add_groups((rollup[:, 0] << 32) + (rollup[:, 1] + _DAY_KEY_OFFSET), rollup[:, 2],
+                         np.zeros(len(rollup), dtype=np.int64))
+
+    def _add_groups(self, keys: np.ndarray, counts: np.ndarray, accepted: np.ndarray):
+        if len(keys) == 0:
+            return
+        order = np.argsort(np.concatenate((self._group_keys, keys)), kind='stable')
+        self._group_keys = np.concatenate((self._group_keys, keys))[order]
+        self._group_counts = np.concatenate((self._group_counts, counts))[order]
+        self._group_accepted = np.concatenate((self._group_accepted, accepted))[order]
+
+
+# Writing the rejected rows to a CSV file (the header is written even if no row is rejected)
+class RejectsWriter:
+    def __init__(self, file_name: str):
+        self._file = open(file_name, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(REJECT_FIELDS)
+
+    def write(self, chunk: ShowingChunk):
+        self._writer.writerows(chunk.rejected_rows())
+
+    # Rows in the columns of REJECT_FIELDS
+    def write_rows(self, rows: Iterable[tuple]):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+# Numbers of the rows of an import
+@dataclass(slots=True)
+class ImportStats:
+    rows: int = 0
+    accepted: int = 0
+    # { reason name : number of the rejected rows }
+    rejected: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+    # { stage : seconds } in the order of the stages (see stage_rows)
+    stage_seconds: dict[str, float] = field(default_factory=dict)
+    # Seconds of the stages measured by stage, without the seconds added by add_stage_seconds
+    # (for example the seconds of the workers, which run in parallel with the stages of this process)
+    measured_seconds: float = 0.0
+
+    def rejected_total(self) -> int:
+        return sum(self.rejected.values())
+
+    def add_stage_seconds(self, stage: str, seconds: float):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    # Measuring the time of a stage: with stats.stage('parse'): ...
+    @contextmanager
+    def stage(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            self.add_stage_seconds(stage, seconds)
+            self.measured_seconds += seconds
+
+    # Adding the numbers of another import (for example of the next file)
+    def add(self, other: 'ImportStats'):
+        self.rows += other.rows
+        self.accepted += other.accepted
+        for name, count in other.rejected.items():
+            self.rejected[name] = self.rejected.get(name, 0) + count
+        self.seconds += other.seconds
+        self.measured_seconds += other.measured_seconds
+        for stage, seconds in other.stage_seconds.items():
+            self.add_stage_seconds(stage, seconds)
+
+    # Rows (stage, seconds, rows per second of the stage)
+    def stage_rows(self) -> list[tuple[str, float, float]]:
+        return [(stage, seconds, self.rows / seconds if seconds > 0 else 0.0)
+                for stage, seconds in self.stage_seconds.items()]
+
+    def add_chunk(self, chunk: ShowingChunk):
+        codes, counts = np.unique(chunk.reasons, return_counts=True)
+        self.rows += len(chunk)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            if code == RejectReason.accepted:
+                self.accepted += count
+            else:
+                name = RejectReason(code).name
+                self.rejected[name] = self.rejected.get(name, 0) + count
+
+    # Counting the rows rejected before they got into a chunk, the rows are in the columns of REJECT_FIELDS
+    def add_rejected_rows(self, rows: list[tuple]):
+        self.rows += len(rows)
+        for row in rows:
+            self.rejected[row[1]] = self.rejected.get(row[1], 0) + 1
+
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+# Import of the shows from the impression logs of the ad servers (CSV or JSON lines with the fields IMPORT_FIELDS,
+# the time is ISO 8601 "YYYY-MM-DD HH:MM[:SS]" without a time zone).
+# The file is read by chunks, every chunk is parsed and validated with NumPy, its rejected rows are written
+# to the rejects file and its accepted rows are inserted. All accepted rows of the file are inserted in one
+# transaction, so a failed import does not change the database.
+# The time of every stage is measured (ImportStats.stage_seconds)
+class ShowingImporter:
+    def __init__(self, driver: AdvertisDriver, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self._driver = driver
+        self._chunk_size = chunk_size
+
+    # input_format - None: by the extension of the file, rejects_file_name - None: default_rejects_file_name
+    @traced(category='import')
+    def import_file(self, file_name: str, input_format: str = None, rejects_file_name: str = None) -> ImportStats:
+        input_format = input_format if input_format is not None else import_format(file_name)
+        rejects_file_name = rejects_file_name if rejects_file_name is not None else default_rejects_file_name(file_name)
+        stats = ImportStats()
+        time_start = perf_counter()
+        validator = ShowingValidator(self._driver)
+        with open(file_name, newline='', encoding='utf-8') as file:
+            rejects = RejectsWriter(rejects_file_name)
+            try:
+                chunks = read_chunks(file, input_format, self._chunk_size)
+                insert_rows(self._driver, self._accepted_rows(chunks, validator, rejects, stats), validator, stats,
+                            self._chunk_size)
+            finally:
+                rejects.close()
+        stats.seconds = perf_counter() - time_start
+        return stats
+
+    @staticmethod
+    def _accepted_rows(chunks: Iterator[ShowingChunk], validator: ShowingValidator, rejects: RejectsWriter,
+                       stats: ImportStats) -> Iterator[tuple[str, int, int]]:
+        while True:
+            with stats.stage('read'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            with stats.stage('parse'):
+                parse_chunk(chunk)
+            with stats.stage('validate'):
+                validator.validate(chunk)
+            with stats.stage('write rejects'):
+                rejects.write(chunk)
+            stats.add_chunk(chunk)
+            yield from chunk.accepted_rows()
+
+
+# Inserting the accepted rows in one transaction, the rollup is incremented by the numbers of the accepted rows
+# counted by the validator. The rows are generated during the insert, so the time of the "insert" stage is
+# the time of the insert without the stages measured by the generator
+def insert_rows(driver: AdvertisDriver, rows: Iterator[tuple[str, int, int]], validator: ShowingValidator,
+                stats: ImportStats, chunk_size: int = IMPORT_CHUNK_SIZE):
+    start = perf_counter()
+    measured = stats.measured_seconds
+    driver.insert_counted_showing_rows(rows, validator.accepted_daily_counts(), chunk_size)
+    stats.add_stage_seconds('insert', perf_counter() - start - (stats.measured_seconds - measured))
@@ -0,0 +1,49 @@
+# Generation of synthetic banners and shows for load testing, for example:
+# python generate_data.py --db test.db --banners 10000 --sites 50 --days 90 --volume poisson --seed 1
+import sys
+from argparse import ArgumentParser
+from contextlib import closing
+from datetime import date, timedelta
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from src.drivers.data_generator import *
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Generation of synthetic banners and shows.')
+    parser.add_argument('--db', default=DEFAULT_DB_FILE_NAME, help='database file (default: the application database)')
+    parser.add_argument('--banners', type=int, default=100, help='number of banners')
+    parser.add_argument('--sites', type=int, default=20, help='number of sites')
+    parser.add_argument('--start', type=date.fromisoformat, default=None,
+                        help='first day of the period, YYYY-MM-DD (default: the period ends yesterday)')
+    parser.add_argument('--days', type=int, default=30, help='length of the period in days')
+    parser.add_argument('--max-duration', type=int, default=30, help='max number of days of banner action')
+    parser.add_argument('--min-shows', type=int, nargs=2, default=(5, 30), metavar=('LOW', 'HIGH'),
+                        help='range of the min number of shows per day of a banner')
+    parser.add_argument('--max-shows-extra', type=int, default=30,
+                        help='max number of shows per day is min number + 0..EXTRA')
+    parser.add_argument('--volume', choices=DAILY_VOLUME_DISTRIBUTIONS, default='uniform',
+                        help='distribution of the number of shows of a banner per day')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--append', action='store_true', help='keep the existing data')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    start = args.start if args.start is not None else date.today() - timedelta(days=args.days)
+    settings = GeneratorSettings(banners=args.banners, sites=args.sites, first_day=py_date_to_day(start),
+                                 days=args.days, max_duration=args.max_duration,
+                                 min_showings_low=args.min_shows[0], min_showings_high=args.min_shows[1],
+                                 max_showings_extra=args.max_shows_extra, daily_volume=args.volume, seed=args.seed)
+    time_start = perf_counter()
+    with closing(AdvertisDriver(args.db)) as driver:
+        banners, showings = DataGenerator(settings).generate(driver, recreate_tables=not args.append)
+    print(f'Generated {banners} banners and {showings} shows in {perf_counter() - time_start:.1f} s.')
+
+
+if __name__ == '__main__':
+    main()
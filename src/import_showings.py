@@ -0,0 +1,77 @@
+# Import of the shows from the impression logs of the ad servers (CSV or JSON lines), for example:
+# python import_showings.py impressions.csv --db advertisement.db
+# python import_showings.py impressions.jsonl --rejects rejected.csv
+# python import_showings.py logs/*.csv --workers 4
+# The rows are validated as in the application, the rejected rows are written to the rejects files
+import sys
+from argparse import ArgumentParser
+from contextlib import closing
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from src.drivers.parallel_import import *
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Import of the shows from CSV or JSON lines files '
+                                        f'with the fields {", ".join(IMPORT_FIELDS)}.')
+    parser.add_argument('files', nargs='+', help='imported files, the time is "YYYY-MM-DD HH:MM[:SS]"')
+    parser.add_argument('--db', default=DEFAULT_DB_FILE_NAME, help='database file (default: the application database)')
+    parser.add_argument('--format', choices=IMPORT_FORMATS, default=None,
+                        help='format of the file (default: by the extension of the file)')
+    parser.add_argument('--rejects', default=None,
+                        help='CSV file for the rejected rows of one imported file (default: <file>.rejects.csv)')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='number of rows validated at once')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of the processes parsing the files (0 - number of the processors, '
+                             '1 - the files are parsed by the writing process)')
+    parser.add_argument('--part-size', type=float, default=IMPORT_PART_SIZE / 1024 / 1024,
+                        help='size in MiB of the parts of the files parsed by the workers')
+    args = parser.parse_args(args)
+    if args.rejects is not None and len(args.files) > 1:
+        parser.error('--rejects is allowed for one imported file only')
+    return args
+
+
+def print_stats(file_name: str, stats: ImportStats, rejects_file_name: str):
+    print(f'{file_name}: imported {stats.accepted} of {stats.rows} shows in {stats.seconds:.1f} s '
+          f'({stats.rows_per_second():.0f} rows/s).')
+    if stats.rejected:
+        print(f'Rejected {stats.rejected_total()} rows ({rejects_file_name}):')
+        for reason, count in sorted(stats.rejected.items(), key=lambda item: item[1], reverse=True):
+            print(f'  {reason}: {count}')
+
+
+# Throughput of the stages of the import of all files (the stages of the workers are summed over the workers)
+def print_stage_table(stats: ImportStats, seconds: float):
+    print(f'\n{"stage":<30} {"seconds":>9} {"rows/s":>12}')
+    for stage, stage_seconds, rows_per_second in stats.stage_rows():
+        print(f'{stage:<30} {stage_seconds:>9.2f} {rows_per_second:>12.0f}')
+    print(f'{"total":<30} {seconds:>9.2f} {stats.rows / seconds if seconds > 0 else 0.0:>12.0f}')
+
+
+def main(args=None):
+    args = parse_args(args)
+    rejects_file_names = [args.rejects if args.rejects is not None else default_rejects_file_name(file_name)
+                          for file_name in args.files]
+    time_start = perf_counter()
+    with closing(AdvertisDriver(args.db)) as driver:
+        if args.workers == 1:
+            importer = ShowingImporter(driver, args.chunk_size)
+            file_stats = [importer.import_file(file_name, args.format, rejects_file_name)
+                          for file_name, rejects_file_name in zip(args.files, rejects_file_names)]
+        else:
+            importer = ParallelImporter(driver, args.workers if args.workers > 0 else None,
+                                        max(round(args.part_size * 1024 * 1024), 1))
+            file_stats = importer.import_files(args.files, args.format, rejects_file_names)
+    seconds = perf_counter() - time_start
+    total = ImportStats()
+    for file_name, stats, rejects_file_name in zip(args.files, file_stats, rejects_file_names):
+        print_stats(file_name, stats, rejects_file_name)
+        total.add(stats)
+    print_stage_table(total, seconds)
+
+
+if __name__ == '__main__':
+    main()
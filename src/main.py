@@ -1,5 +1,26 @@
+import sys
+from argparse import ArgumentParser
+
 from views.main_wnd import MainWnd
+from src.models.edit_queue import DEFAULT_FLUSH_INTERVAL
+from src.models.tracing import enable_tracing
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Accounting for the results of advertising.')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='trace the hot paths and write the trace (Chrome trace-event JSON) to the file on exit')
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL, metavar='SECONDS',
+                        help='the edits are written to the database in one transaction SECONDS after the first edit '
+                             '(0 - every edit is written at once)')
+    # The other arguments are passed to Qt
+    return parser.parse_known_args(args)
+
 
 if __name__ == '__main__':
-    main_window = MainWnd()
+    args, qt_args = parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+    sys.argv = sys.argv[:1] + qt_args
+    main_window = MainWnd(args.flush_interval)
     main_window.run()
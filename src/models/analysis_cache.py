@@ -0,0 +1,97 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from src.models.promotion_report import *
+
+# Default minimal interval in seconds between the checks of the database for changes
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+# Banners and numbers of shows loaded for one state of the database (one value of PRAGMA data_version)
+# together with the results calculated for this state
+@dataclass(slots=True)
+class AnalysisSnapshot:
+    data_version: int
+    # { banner_id : banner } ordered by banner id
+    banners: dict[int, ReportBanner]
+    # Total number of shows of all banners per day (parallel arrays of day ordinals and counts)
+    days: np.ndarray
+    counts: np.ndarray
+    # Calculated results, { key : future of the result }
+    results: dict = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, driver: AdvertisDriver, data_version: int) -> 'AnalysisSnapshot':
+        banners = {banner.id: banner for banner in iter_report_banners(driver)}
+        days, counts = driver.get_showings_per_day()
+        return cls(data_version, banners, days, counts)
+
+
+# Cache of the analysis results for the asyncio services.
+# The database is read and the results are calculated in one worker thread (it owns the connection),
+# so the event loop is never blocked. The database is checked for changes at most once per check_interval,
+# when it was changed by another connection a new snapshot is loaded and all cached results are dropped.
+# Concurrent requests of the same result share one calculation
+class AnalysisCache:
+    def __init__(self, db_file_name: str = DEFAULT_DB_FILE_NAME, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self._db_file_name = db_file_name
+        self._check_interval = check_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis')
+        # The driver is created and used only in the worker thread
+        self._driver = None
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refreshing = None
+
+    # Current snapshot of the database
+    async def snapshot(self) -> AnalysisSnapshot:
+        if self._snapshot is not None and time.monotonic() - self._checked_at < self._check_interval:
+            return self._snapshot
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refreshing)
+
+    # Result of function(*args) for the snapshot, calculated once in the worker thread and cached by key
+    async def compute(self, snapshot: AnalysisSnapshot, key, function, *args):
+        future = snapshot.results.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+            snapshot.results[key] = future
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # Failed calculations are not cached
+            if snapshot.results.get(key) is future:
+                del snapshot.results[key]
+            raise
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_driver)
+        self._executor.shutdown()
+
+    async def _refresh(self) -> AnalysisSnapshot:
+        try:
+            self._snapshot = await asyncio.get_running_loop().run_in_executor(self._executor, self._load_if_changed,
+                                                                              self._snapshot)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+        finally:
+            self._refreshing = None
+
+    # region Methods of the worker thread
+    def _load_if_changed(self, snapshot: AnalysisSnapshot) -> AnalysisSnapshot:
+        if self._driver is None:
+            self._driver = AdvertisDriver(self._db_file_name, ConnectionSettings(read_only=True))
+        data_version = self._driver.get_data_version()
+        if snapshot is not None and snapshot.data_version == data_version:
+            return snapshot
+        return AnalysisSnapshot.load(self._driver, data_version)
+
+    def _close_driver(self):
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
+
+    # endregion
@@ -1,25 +1,26 @@
-from dataclasses import dataclass
-
-from PyQt5.QtCore import QDate
+from dataclasses import dataclass, field
 
+from src.models.date_ordinals import *
 from src.models.showing import Showing
 
-DATE_FORMAT = 'dd.MM.yyyy'
-
 
 @dataclass(slots=True)
 class Banner:
     id: int = 0
     name: str = ''
     company_name: str = ''
-    date_start: QDate = QDate()
-    date_end: QDate = QDate()
+    # First and last day of banner action (day ordinals)
+    date_start: int = 0
+    date_end: int = 0
     min_showings: int = 0
     max_showings: int = 0
-    showings: list[Showing] = ()
+    # Number of shows per day, { day ordinal : count } (filled from the "daily_showings" rollup,
+    # then kept up to date by add_showing, remove_showing and replace_showing).
+    # The shows themselves are not kept in memory, they are read from the database page by page (see ShowingEditor)
+    day_counts: dict[int, int] = field(default_factory=dict)
 
     def __post_init__(self):
-        if self.date_start.daysTo(self.date_end) < 0:
+        if self.date_end < self.date_start:
             raise Exception('Incorrect dates were entered.')
         if self.min_showings < 0 | self.max_showings < 0:
             raise Exception('The number of shows cannot be negative.')
@@ -27,32 +28,51 @@ class Banner:
             raise Exception('The minimum number of shows cannot be higher than the maximum number of shows.')
 
     def add_showing(self, showing: Showing):
-        self.showings.append(showing)
+        self._count_day(showing.day(), 1)
+
+    def remove_showing(self, showing: Showing):
+        self._count_day(showing.day(), -1)
+
+    def replace_showing(self, old_showing: Showing, showing: Showing):
+        self._count_day(old_showing.day(), -1)
+        self._count_day(showing.day(), 1)
 
-    def pop_showing(self, index):
-        showing = self.showings.pop(index)
-        return showing
+    def _count_day(self, day: int, delta: int):
+        count = self.day_counts.get(day, 0) + delta
+        if count > 0:
+            self.day_counts[day] = count
+        else:
+            self.day_counts.pop(day, None)
 
     def date_start_str(self) -> str:
-        return self.date_start.toString(DATE_FORMAT)
+        return day_to_text(self.date_start)
 
     def date_end_str(self) -> str:
-        return self.date_end.toString(DATE_FORMAT)
+        return day_to_text(self.date_end)
 
     def to_banner_short_data(self):
         return BannerShortData(self.name, self.company_name, self.date_start,
                                self.date_end, self.min_showings, self.max_showings)
 
-    # Getting the number of banner impressions for the selected date (default for current date)
-    def count_showings_for_date(self, date: QDate = QDate.currentDate()) -> int:
-        amount = 0
-        for sh in self.showings:
-            if sh.datetime.date() == date:
-                amount += 1
-        return amount
+    # Getting the number of banner impressions for the day ordinal
+    def count_showings_for_day(self, day: int) -> int:
+        return self.day_counts.get(day, 0)
+
+    def is_active_on_day(self, day: int):
+        return self.date_start <= day <= self.date_end
+
+    # Number of all shows of the banner
+    def total_showings(self) -> int:
+        return sum(self.day_counts.values())
+
 
-    def is_active_on_date(self, date: QDate):
-        return self.date_start.daysTo(date) >= 0 & date.daysTo(self.date_end) >= 0
+# First and last day of action of the banners (day ordinals). The last day is not later than today,
+# without banners the period is empty (the first day is 100 years later than today)
+def find_min_max_banner_days(banners) -> tuple[int, int]:
+    current_day = today()
+    min_day = min((banner.date_start for banner in banners), default=current_day + 36500)
+    max_day = max((banner.date_end for banner in banners), default=current_day)
+    return min_day, min(max_day, current_day)
 
 
 # Brief information about banner
@@ -60,13 +80,13 @@ class Banner:
 class BannerShortData:
     name: str = ''
     company_name: str = ''
-    date_start: QDate = QDate()
-    date_end: QDate = QDate()
+    date_start: int = 0
+    date_end: int = 0
     min_showings: int = 0
     max_showings: int = 0
 
     def __post_init__(self):
-        if self.date_start.daysTo(self.date_end) < 0:
+        if self.date_end < self.date_start:
             raise Exception('Incorrect dates were entered.')
         if self.min_showings < 0 | self.max_showings < 0:
             raise Exception('The number of shows cannot be negative.')
@@ -74,10 +94,10 @@ class BannerShortData:
             raise Exception('The minimum number of shows cannot be higher than the maximum number of shows.')
 
     def date_start_str(self) -> str:
-        return self.date_start.toString(DATE_FORMAT)
+        return day_to_text(self.date_start)
 
     def date_end_str(self) -> str:
-        return self.date_end.toString(DATE_FORMAT)
+        return day_to_text(self.date_end)
 
 
 # Information about banner promotion
@@ -91,19 +111,19 @@ class BannerPromotionData:
     min_sh_all: int = 0
     max_sh_all: int = 0
     fact_sh_all: int = 0
-    date_start: QDate = QDate()
-    date_end: QDate = QDate()
+    date_start: int = 0
+    date_end: int = 0
 
-    def set_from_banner(self, banner: Banner, date: QDate):
+    def set_from_banner(self, banner: Banner, day: int):
         self.name = banner.name
         self.company_name = banner.company_name
         self.min_sh_today = banner.min_showings
         self.max_sh_today = banner.max_showings
-        self.fact_sh_today = banner.count_showings_for_date(date)
-        days = banner.date_start.daysTo(banner.date_end) + 1
+        self.fact_sh_today = banner.count_showings_for_day(day)
+        days = banner.date_end - banner.date_start + 1
         self.min_sh_all = days * banner.min_showings
         self.max_sh_all = days * banner.max_showings
-        self.fact_sh_all = len(banner.showings)
+        self.fact_sh_all = banner.total_showings()
         self.date_start = banner.date_start
         self.date_end = banner.date_end
 
@@ -122,7 +142,7 @@ class BannerPromotionData:
         return percent
 
     def date_start_str(self) -> str:
-        return self.date_start.toString(DATE_FORMAT)
+        return day_to_text(self.date_start)
 
     def date_end_str(self) -> str:
-        return self.date_end.toString(DATE_FORMAT)
+        return day_to_text(self.date_end)
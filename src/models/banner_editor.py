@@ -1,6 +1,11 @@
+from bisect import bisect_right
+from contextlib import closing
 from enum import Enum
+from operator import attrgetter
 
-from src.drivers.advertis_driver import *
+from PyQt5.QtCore import pyqtSignal
+
+from src.drivers.aggregate_cache import *
 from src.models.showing_editor import *
 
 
@@ -9,71 +14,110 @@ class SortedMode(Enum):
     by_date_end = 1
 
 
+# Keys of the banner order for the sorting modes
+SORT_KEYS = {SortedMode.by_date_start: attrgetter('date_start'),
+             SortedMode.by_date_end: attrgetter('date_end')}
+
+
 class BannerEditor(QAbstractTableModel):
-    def __init__(self, parent=None):
+    # Signals about the changes of the data for the dependent models
+    banners_reloaded = pyqtSignal(list)  # all banners were loaded again
+    banner_changed = pyqtSignal(object)  # banner was added or replaced
+    banner_removed = pyqtSignal(int)  # banner id
+    showings_changed = pyqtSignal(int, int, int)  # banner id, day ordinal, change of the number of shows
+
+    # load_from_db - False if the banners are loaded later by set_banners (for example outside of the GUI thread)
+    # flush_interval - the edits are written to the database by edit_queue flush_interval seconds after the first
+    # edit (0 - every edit is written at once)
+    def __init__(self, parent=None, load_from_db: bool = True, db_file_name: str = DEFAULT_DB_FILE_NAME,
+                 flush_interval: float = 0):
         super().__init__(parent)
-        self._advertising_driver = AdvertisDriver()
+        self._advertising_driver = AdvertisDriver(db_file_name)
+        self.edit_queue = EditQueue(self._advertising_driver, flush_interval, self)
         self._banners = []
+        # Aggregates loaded together with the banners, None - the banners were changed after loading
+        self._aggregates = None
         self._headers = ["Name", "Start date of banner action", "End date of banner action"]
-        self.showing_editor = ShowingEditor()
-        self._sorted_mode = SortedMode.by_date_end
-        self._init_all_banners_from_db()
+        self.showing_editor = ShowingEditor(self._advertising_driver, edit_queue=self.edit_queue)
+        self._sorted_mode = SortedMode.by_date_start
+        if load_from_db:
+            self._init_all_banners_from_db()
 
     def get_banners(self):
         return self._banners
 
+    def get_db_file_name(self) -> str:
+        return self._advertising_driver.get_db_file_name()
+
+    # The queued edits are written before the connection to the database is released
+    def close(self):
+        self.edit_queue.flush()
+        self._advertising_driver.close()
+
     def _init_all_banners_from_db(self):
-        self._banners = self._advertising_driver.get_all_banners()
-        self.sort_banners()
+        self.edit_queue.flush()
+        self.set_banners(*load_banners_with_aggregates(self._advertising_driver))
+
+    # aggregates - aggregates of the database the banners were loaded from (see load_banners_with_aggregates)
+    def set_banners(self, banners: list[Banner], aggregates: Aggregates = None):
+        self.edit_queue.forget_reserved_ids()
+        self._banners = banners
+        self._aggregates = aggregates
+        self._resort_banners()
+        self.banners_reloaded.emit(self._banners)
+
+    # Loading the banners and the aggregates with a separate connection to the database
+    # (may be called outside of the GUI thread)
+    @staticmethod
+    def load_banners(db_file_name: str = DEFAULT_DB_FILE_NAME) -> tuple[list[Banner], Aggregates]:
+        with closing(AdvertisDriver(db_file_name)) as driver:
+            return load_banners_with_aggregates(driver)
+
+    # Generation of random data with a separate connection to the database
+    # (may be called outside of the GUI thread), return the new banners and their aggregates
+    @staticmethod
+    def generate_rand_banners(db_file_name: str = DEFAULT_DB_FILE_NAME) -> tuple[list[Banner], Aggregates]:
+        with closing(AdvertisDriver(db_file_name)) as driver:
+            driver.generate_random_data()
+            return load_banners_with_aggregates(driver)
 
     def sort_banners(self, sort_mode: SortedMode = SortedMode.by_date_start):
-        self.beginResetModel()
         if self._sorted_mode == sort_mode:
             return
         self._sorted_mode = sort_mode
-        if self._sorted_mode == SortedMode.by_date_start:
-            self._banners = sorted(self._banners, key=lambda x: x.date_start)
-        elif self._sorted_mode == SortedMode.by_date_end:
-            self._banners = sorted(self._banners, key=lambda x: x.date_end)
-        self.endResetModel()
+        self._resort_banners()
 
+    @traced('BannerEditor.sort', category='model')
     def _resort_banners(self):
         self.beginResetModel()
-        if self._sorted_mode == SortedMode.by_date_start:
-            self._banners = sorted(self._banners, key=lambda x: x.date_start)
-        elif self._sorted_mode == SortedMode.by_date_end:
-            self._banners = sorted(self._banners, key=lambda x: x.date_end)
+        self._banners = sorted(self._banners, key=SORT_KEYS[self._sorted_mode])
         self.endResetModel()
 
-    def find_min_max_banner_dates(self):
-        min_date = QDate.currentDate().addYears(100)
-        max_date = QDate.currentDate().addYears(-100)
-        for banner in self._banners:
-            if min_date.daysTo(banner.date_start) < 0:
-                min_date = banner.date_start
-            if max_date.daysTo(banner.date_end) > 0:
-                max_date = banner.date_end
-        if QDate.currentDate().daysTo(max_date) > 0:
-            max_date = QDate.currentDate()
-        return min_date, max_date
-
-    def find_min_banner_date(self):
-        min_date = QDate.currentDate().addYears(100)
-        for banner in self._banners:
-            if min_date.daysTo(banner.date_start) < 0:
-                min_date = banner.date_start
-        return min_date
+    # Position for the banner in the sorted list (after the banners with the same key)
+    def _insert_position(self, banner: Banner) -> int:
+        key = SORT_KEYS[self._sorted_mode]
+        return bisect_right(self._banners, key(banner), key=key)
+
+    # First and last day of action of the banners (day ordinals, the last day is not later than today)
+    def find_min_max_banner_dates(self) -> tuple[int, int]:
+        if self._aggregates is not None:
+            return self._aggregates.min_max_banner_days()
+        return find_min_max_banner_days(self._banners)
+
+    def find_min_banner_date(self) -> int:
+        return self.find_min_max_banner_dates()[0]
 
     # region Overriding methods for filling the table
     def headerData(self, section, orientation, role=...):
         if role == Qt.DisplayRole and orientation == Qt.Horizontal:
             return self._headers[section]
 
+    # The items of a table have no children
     def rowCount(self, parent=None):
-        return len(self._banners)
+        return 0 if parent is not None and parent.isValid() else len(self._banners)
 
     def columnCount(self, parent=None):
-        return len(self._headers)
+        return 0 if parent is not None and parent.isValid() else len(self._headers)
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
@@ -82,69 +126,95 @@ class BannerEditor(QAbstractTableModel):
             if column == 0:
                 return self._banners[row].name
             if column == 1:
-                return self._banners[row].date_start
+                return day_to_date(self._banners[row].date_start)
             if column == 2:
-                return self._banners[row].date_end
+                return day_to_date(self._banners[row].date_end)
 
     # endregion
 
-    def save_changes_for_banner(self, banner_short_data: BannerShortData, index: int):
-        self.beginResetModel()
+    # The changed banner is moved to its new position in the sorted list, return the new index of the banner
+    def save_changes_for_banner(self, banner_short_data: BannerShortData, index: int) -> int:
         banner = Banner(self._banners[index].id, banner_short_data.name,
                         banner_short_data.company_name, banner_short_data.date_start,
                         banner_short_data.date_end, banner_short_data.min_showings,
-                        banner_short_data.max_showings, self._banners[index].showings)
-        self._advertising_driver.update_banner(banner)
-        self._banners[index] = banner
-        self.endResetModel()
+                        banner_short_data.max_showings, self._banners[index].day_counts)
+        self.edit_queue.update_banner(banner)
+        self._aggregates = None
+        # Position of the changed banner in the list without the old banner
+        old_banner = self._banners.pop(index)
+        new_index = self._insert_position(banner)
+        self._banners.insert(index, old_banner)
+        if new_index == index:
+            self._banners[index] = banner
+            self.dataChanged.emit(self.index(index, 0), self.index(index, self.columnCount() - 1))
+        else:
+            # Destination row of beginMoveRows is counted before the move
+            self.beginMoveRows(QModelIndex(), index, index, QModelIndex(),
+                               new_index + 1 if new_index > index else new_index)
+            del self._banners[index]
+            self._banners.insert(new_index, banner)
+            self.endMoveRows()
+        self.banner_changed.emit(banner)
+        return new_index
 
     def delete_banner(self, index: int):
-        self.beginResetModel()
+        self.beginRemoveRows(QModelIndex(), index, index)
         banner = self._banners.pop(index)
-        self._advertising_driver.delete_banner(banner.id)
-        self.endResetModel()
-
-    def add_banner(self, banner_short_data: BannerShortData):
-        self.beginResetModel()
-        banner_id = self._advertising_driver.insert_banner(banner_short_data)
+        self.edit_queue.delete_banner(banner.id)
+        self._aggregates = None
+        self.endRemoveRows()
+        self.banner_removed.emit(banner.id)
+
+    # The banner is inserted into the sorted list, return the index of the new banner
+    def add_banner(self, banner_short_data: BannerShortData) -> int:
+        banner_id = self.edit_queue.insert_banner(banner_short_data)
+        self._aggregates = None
         banner = Banner(banner_id, banner_short_data.name,
                         banner_short_data.company_name, banner_short_data.date_start,
                         banner_short_data.date_end, banner_short_data.min_showings,
-                        banner_short_data.max_showings, [])
-        self._banners.append(banner)
-        self.endResetModel()
+                        banner_short_data.max_showings)
+        index = self._insert_position(banner)
+        self.beginInsertRows(QModelIndex(), index, index)
+        self._banners.insert(index, banner)
+        self.endInsertRows()
+        self.banner_changed.emit(banner)
+        return index
 
     # Getting brief information for the banner (for output to the form)
     def get_banner_short_data(self, index: int) -> BannerShortData:
-        self.showing_editor.init_showings(self._banners[index].showings)
+        self.showing_editor.init_showings(self._banners[index].id)
         return self._banners[index].to_banner_short_data()
 
+    # The banner table does not change when the shows are edited, only the table of the shows is updated.
+    # ind_showing - row of the show in the table of the shows of the banner (showing_editor)
     def save_changes_for_showing(self, short_showing: ShowingShortData, ind_banner: int, ind_showing: int):
-        self.beginResetModel()
         selected_banner = self._banners[ind_banner]
         self._check_showing_correct(short_showing, selected_banner)
-        showing = Showing(selected_banner.showings[ind_showing].id,
-                          short_showing.site_name, short_showing.datetime,
-                          selected_banner.id)
-        self._advertising_driver.update_showing(showing)
-        selected_banner.showings[ind_showing] = showing
-        self.endResetModel()
+        old_showing = self.showing_editor.get_showing(ind_showing)
+        showing = Showing(old_showing.id, short_showing.site_name, short_showing.ts, selected_banner.id)
+        self.edit_queue.update_showing(showing)
+        selected_banner.replace_showing(old_showing, showing)
+        self.showing_editor.showing_replaced(ind_showing, showing)
+        self.showings_changed.emit(selected_banner.id, old_showing.day(), -1)
+        self.showings_changed.emit(selected_banner.id, showing.day(), 1)
 
     def add_showing(self, short_showing: ShowingShortData, ind_banner: int):
         selected_banner = self._banners[ind_banner]
         self._check_showing_correct(short_showing, selected_banner)
-        self.beginResetModel()
-        showing_id = self._advertising_driver.insert_showing(short_showing, selected_banner.id)
+        showing_id = self.edit_queue.insert_showing(short_showing, selected_banner.id)
         showing = Showing(showing_id, short_showing.site_name,
-                          short_showing.datetime, selected_banner.id)
+                          short_showing.ts, selected_banner.id)
         selected_banner.add_showing(showing)
-        self.endResetModel()
+        self.showing_editor.showing_added(showing)
+        self.showings_changed.emit(selected_banner.id, showing.day(), 1)
 
     def delete_showing(self, ind_banner: int, ind_showing: int):
-        self.beginResetModel()
-        showing = self._banners[ind_banner].pop_showing(ind_showing)
-        self._advertising_driver.delete_showing(showing.id)
-        self.endResetModel()
+        selected_banner = self._banners[ind_banner]
+        showing = self.showing_editor.get_showing(ind_showing)
+        self.edit_queue.delete_showing(showing.id)
+        selected_banner.remove_showing(showing)
+        self.showing_editor.showing_removed(ind_showing)
+        self.showings_changed.emit(showing.banner_id, showing.day(), -1)
 
     # Cleaning the table of records about banner impressions
     def clear_showing_editor_data(self):
@@ -156,14 +226,14 @@ class BannerEditor(QAbstractTableModel):
 
     # The method checks the showing short data correctness
     def _check_showing_correct(self, showing: ShowingShortData, banner: Banner):
-        date = showing.datetime.date()
-        if banner.count_showings_for_date(date) >= banner.max_showings:
+        day = minutes_to_day(showing.ts)
+        if banner.count_showings_for_day(day) >= banner.max_showings:
             raise Exception('The max. number of impressions has been reached for the given date.')
-        if date.daysTo(banner.date_end) < 0 or banner.date_start.daysTo(date) < 0:
+        if not banner.is_active_on_day(day):
             raise Exception('The show date is not included in the banner validity period.')
 
-    # Generation of random data
+    # Generation of random data (the tables are created again, so the queued edits are discarded)
     def gen_rand_data(self):
+        self.edit_queue.discard()
         self._advertising_driver.generate_random_data()
-        self._banners = self._advertising_driver.get_all_banners()
-        self._resort_banners()
+        self.set_banners(*load_banners_with_aggregates(self._advertising_driver))
@@ -0,0 +1,61 @@
+from datetime import date, datetime, timedelta
+
+# Dates and times of the models are plain integers:
+# day ordinal - number of days since 01.01.1970,
+# timestamp - number of minutes since 01.01.1970 00:00 (wall-clock time, no time zone shift).
+# The conversion to the Qt types is done only by the table models and the views (see qt_dates)
+MINUTES_PER_DAY = 24 * 60
+EPOCH_DATE = date(1970, 1, 1)
+# Text formats of the dates in the database and in the forms ("dd.MM.yyyy" and "dd.MM.yyyy hh:mm" in Qt notation)
+DAY_TEXT_FORMAT = '%d.%m.%Y'
+MINUTES_TEXT_FORMAT = '%d.%m.%Y %H:%M'
+MINUTES_ISO_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def today() -> int:
+    return (date.today() - EPOCH_DATE).days
+
+
+def day_to_py_date(day: int) -> date:
+    return EPOCH_DATE + timedelta(days=day)
+
+
+def py_date_to_day(value: date) -> int:
+    return (value - EPOCH_DATE).days
+
+
+def minutes_to_day(minutes: int) -> int:
+    return minutes // MINUTES_PER_DAY
+
+
+# Conversion of day ordinals to ISO dates "YYYY-MM-DD" and back (for the files and the command line)
+def day_to_iso(day: int) -> str:
+    return day_to_py_date(day).isoformat()
+
+
+def iso_to_day(text: str) -> int:
+    return py_date_to_day(date.fromisoformat(text))
+
+
+# Conversion of day ordinals to the "dd.MM.yyyy" text and back
+def day_to_text(day: int) -> str:
+    return day_to_py_date(day).strftime(DAY_TEXT_FORMAT)
+
+
+def text_to_day(text: str) -> int:
+    return py_date_to_day(datetime.strptime(text, DAY_TEXT_FORMAT).date())
+
+
+def minutes_to_text(minutes: int) -> str:
+    return (datetime(1970, 1, 1) + timedelta(minutes=minutes)).strftime(MINUTES_TEXT_FORMAT)
+
+
+# Conversion of timestamps to the ISO "YYYY-MM-DD HH:MM" text (for the files)
+def minutes_to_iso(minutes: int) -> str:
+    return (datetime(1970, 1, 1) + timedelta(minutes=minutes)).strftime(MINUTES_ISO_FORMAT)
+
+
+# Index of the day of the week (0 - Monday, ..., 6 - Sunday), works for NumPy arrays of day ordinals too.
+# 01.01.1970 was a Thursday
+def weekday_index(day):
+    return (day + 3) % 7
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from src.drivers.advertis_driver import *
+
+# Default interval in seconds between an edit and the flush of the queue in the application
+DEFAULT_FLUSH_INTERVAL = 1.0
+# Number of the ids of a table reserved in the database at once for the queued inserts
+ID_BLOCK_SIZE = 100
+
+
+# Queued state of a row of the banners or shows table
+@dataclass(slots=True)
+class RowEdit:
+    # True - the row was inserted by a queued edit and is not in the database yet
+    inserted: bool
+    # New state of the row, None - the row is deleted
+    row: Banner | Showing | None
+
+
+# Write-behind queue of the edits of the banners and shows.
+# The methods changing the data are the same as in AdvertisDriver, so the in-memory models are changed
+# immediately. The ids of the new rows are reserved in the database by blocks of ID_BLOCK_SIZE
+# (AdvertisDriver.reserve_ids) and given out from memory, so the rows inserted by other connections
+# before the flush do not take these ids.
+# The edits are written to the database in one transaction flush_interval seconds after the first queued edit
+# (0 - every edit is written at once), or earlier by flush (on a tab switch, before reading the shows, on exit).
+# The edits of one row are coalesced into its last state at the place of the first edit of the row, the rows
+# are written in this order. If the flush fails, flush_failed is emitted and the edits are kept for the next flush
+# (they are discarded only by discard)
+class EditQueue(QObject):
+    flush_failed = pyqtSignal(str)  # error text
+
+    def __init__(self, driver: AdvertisDriver, flush_interval: float = 0, parent=None):
+        super().__init__(parent)
+        self._driver = driver
+        # { (table name, row id) : edit } in the order of the first edits of the rows
+        self._edits = {}
+        # { table name : (next reserved id, end of the reserved ids) }
+        self._reserved_ids = {}
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._flush_interval = 0
+        self.set_flush_interval(flush_interval)
+
+    def set_flush_interval(self, flush_interval: float):
+        self._flush_interval = flush_interval
+        self._timer.setInterval(round(flush_interval * 1000))
+
+    # Number of the rows with queued edits
+    def pending(self) -> int:
+        return len(self._edits)
+
+    # region Edits (the same as the methods of AdvertisDriver)
+    def update_banner(self, banner: Banner):
+        self._queue('banners', banner.id, banner)
+
+    # The queued edits of the shows of the banner are not needed, its shows are deleted
+    def delete_banner(self, uid: int):
+        self._edits = {key: edit for key, edit in self._edits.items()
+                       if key[0] != 'showings' or edit.row is None or edit.row.banner_id != uid}
+        self._queue('banners', uid, None)
+
+    def insert_banner(self, banner: BannerShortData) -> int:
+        uid = self._allocate_id('banners')
+        self._queue('banners', uid, Banner(uid, banner.name, banner.company_name, banner.date_start,
+                                           banner.date_end, banner.min_showings, banner.max_showings), True)
+        return uid
+
+    # The banner of a queued show is kept (AdvertisDriver.update_showing does not change the banner)
+    def update_showing(self, showing: Showing):
+        edit = self._edits.get(('showings', showing.id))
+        if edit is not None and edit.row is not None:
+            showing = Showing(showing.id, showing.site_name, showing.ts, edit.row.banner_id)
+        self._queue('showings', showing.id, showing)
+
+    def delete_showing(self, uid: int):
+        self._queue('showings', uid, None)
+
+    def insert_showing(self, showing: ShowingShortData, banner_id: int) -> int:
+        uid = self._allocate_id('showings')
+        self._queue('showings', uid, Showing(uid, showing.site_name, showing.ts, banner_id), True)
+        return uid
+
+    def _allocate_id(self, table_name: str) -> int:
+        uid, end = self._reserved_ids.get(table_name, (0, 0))
+        if uid >= end:
+            uid = self._driver.reserve_ids(table_name, ID_BLOCK_SIZE)
+            end = uid + ID_BLOCK_SIZE
+        self._reserved_ids[table_name] = (uid + 1, end)
+        return uid
+
+    def _queue(self, table_name: str, uid: int, row: Banner | Showing | None, inserted: bool = False):
+        key = (table_name, uid)
+        edit = self._edits.get(key)
+        if edit is None:
+            self._edits[key] = RowEdit(inserted, row)
+        elif row is None and edit.inserted:
+            # The row was inserted and deleted before the flush
+            del self._edits[key]
+        else:
+            edit.row = row
+        if self._flush_interval <= 0:
+            self.flush()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    # endregion
+
+    # Writing the queued edits in one transaction, return False if they were not written
+    @traced(category='sqlite')
+    def flush(self) -> bool:
+        self._timer.stop()
+        if not self._edits:
+            return True
+        try:
+            with self._driver.batch():
+                for (table_name, uid), edit in self._edits.items():
+                    self._write(table_name, uid, edit)
+        except Exception as ex:
+            self.flush_failed.emit(str(ex.args[0]) if ex.args else repr(ex))
+            return False
+        self.discard()
+        return True
+
+    def discard(self):
+        self._timer.stop()
+        self._edits = {}
+
+    # The tables may be recreated (for example by the generation of random data), the ids are reserved again
+    def forget_reserved_ids(self):
+        self._reserved_ids = {}
+
+    def _write(self, table_name: str, uid: int, edit: RowEdit):
+        if edit.row is None:
+            if table_name == 'banners':
+                self._driver.delete_banner(uid)
+            else:
+                self._driver.delete_showing(uid)
+        elif not edit.inserted:
+            if table_name == 'banners':
+                self._driver.update_banner(edit.row)
+            else:
+                self._driver.update_showing(edit.row)
+        elif table_name == 'banners':
+            self._driver.insert_banner(edit.row.to_banner_short_data(), uid)
+        else:
+            self._driver.insert_showing(edit.row.to_showing_short_data(), edit.row.banner_id, uid)
@@ -0,0 +1,56 @@
+import numpy as np
+
+from src.models.date_ordinals import *
+
+
+# Vectorized calculation of the banner shows forecast.
+# Banners are described by parallel arrays: first and last day of action (day ordinals),
+# min and max number of shows per day. The forecast is calculated for n_days days starting from first_day
+
+
+# Sum of the min number of shows of the banners active on each day (difference array over the action intervals)
+def sum_min_showings_per_day(starts: np.ndarray, ends: np.ndarray, min_showings: np.ndarray,
+                             first_day: int, n_days: int) -> np.ndarray:
+    begin = np.clip(starts - first_day, 0, n_days)
+    end = np.clip(ends - first_day + 1, 0, n_days)
+    diff = (np.bincount(begin, weights=min_showings, minlength=n_days + 1)
+            - np.bincount(end, weights=min_showings, minlength=n_days + 1))
+    return np.rint(np.cumsum(diff[:n_days])).astype(np.int64)
+
+
+# Mask banners x days of the days when the banner is active
+def active_mask(starts: np.ndarray, ends: np.ndarray, first_day: int, n_days: int) -> np.ndarray:
+    days = first_day + np.arange(n_days)
+    return (starts[:, None] <= days) & (days <= ends[:, None])
+
+
+# Forecast matrix banners x days. The expected number of shows of the day (target) is distributed
+# between the active banners in proportion to their min number of shows and limited by their max number.
+# Inactive days are 0, the mask of active days is returned together with the matrix.
+# all_min - sum of the min number of shows per day of all banners, by default it is calculated for the given
+# banners (it is passed when the forecast is calculated by blocks of banners)
+def forecast_matrix(starts: np.ndarray, ends: np.ndarray, min_showings: np.ndarray, max_showings: np.ndarray,
+                    targets: np.ndarray, first_day: int, all_min: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    n_days = len(targets)
+    active = active_mask(starts, ends, first_day, n_days)
+    if all_min is None:
+        all_min = sum_min_showings_per_day(starts, ends, min_showings, first_day, n_days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = min_showings[:, None] * targets[None, :] / all_min[None, :]
+    forecast = np.minimum(np.rint(np.nan_to_num(share, nan=0.0, posinf=0.0)), max_showings[:, None])
+    forecast = np.where(active, forecast, 0).astype(np.int64)
+    return forecast, active
+
+
+# Average number of shows for each day of the week (0 - Monday) over the days from first_day to the day before today.
+# days and counts - parallel arrays with the number of shows per day
+def weekday_profile(days: np.ndarray, counts: np.ndarray, first_day: int, today: int) -> np.ndarray:
+    past = days < today
+    totals = np.bincount(weekday_index(days[past]), weights=counts[past], minlength=7)
+    amount_days_of_week = np.bincount(weekday_index(first_day + np.arange(max(today - first_day, 0))), minlength=7)
+    return np.divide(totals, amount_days_of_week, out=np.zeros(7), where=amount_days_of_week > 0)
+
+
+# Expected number of shows for each day from the average number of shows for each day of the week
+def targets_for_days(average_in_week, first_day: int, n_days: int) -> np.ndarray:
+    return np.asarray(average_in_week, dtype=np.float64)[weekday_index(first_day + np.arange(n_days))]
@@ -1,104 +1,149 @@
+from dataclasses import dataclass
+
 from PyQt5.QtCore import QAbstractTableModel, Qt
 
-from src.models.banner import *
+from src.drivers.aggregate_cache import *
+from src.models.forecast_engine import *
+from src.models.qt_dates import *
+
+
+# Result of the forecast calculation. It is calculated by Forecaster.calc_forecast
+# (possibly outside of the GUI thread) and shown by Forecaster.set_forecast
+@dataclass(slots=True)
+class Forecast:
+    banners: list[Banner]
+    # Forecast matrix banners x days starting from first_day and the mask of the days of banners action
+    forecast_showings: np.ndarray
+    active_days: np.ndarray
+    first_day: int
+    average_sh_in_week: np.ndarray
+    week_profile_key: tuple[int, int]
+    # Number of the invalidations of the average numbers of shows before the calculation
+    profile_generation: int
 
 
 class Forecaster(QAbstractTableModel):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._average_sh_in_week = [0, 0, 0, 0, 0, 0, 0]
+        self._average_sh_in_week = np.zeros(7)
+        # (first day, today) the average numbers of shows were calculated for, None - must be recalculated
+        self._week_profile_key = None
+        # Incremented by invalidate_week_profile, the average numbers of shows of a forecast calculated
+        # before the invalidation are not kept
+        self._profile_generation = 0
+        # Aggregates of the loaded banners, None - the shows were changed after loading
+        self._aggregates = None
         self._banners = []
-        self._forecast_showings = []
-        self._min_date = QDate()
-        self._max_date = QDate()
+        self._forecast_showings = np.zeros((0, 0), dtype=np.int64)
+        self._active_days = np.zeros((0, 0), dtype=bool)
+        self._first_day = 0
         self._headers = ["Name", "Company", "End date of banner action"]
 
+    @traced(category='model')
     def set_banners(self, banners: list[Banner]):
+        self.set_forecast(self.calc_forecast(*self.forecast_arguments(banners)))
+
+    # The total numbers of shows per day are taken from the aggregates until the shows are changed
+    def set_aggregates(self, aggregates: Aggregates):
+        self._aggregates = aggregates
+
+    @traced(category='model')
+    def set_forecast(self, forecast: Forecast):
         self.beginResetModel()
-        self._forecast_showings.clear()
-        self._banners = banners
-        self._min_max_dates()
-        self._analyse_results()
-        self._sort_banners()
-        self._forecast_showings = [dict() for _ in range(len(self._banners))]
-        self._calc_forecast_for_banners()
+        self._banners = forecast.banners
+        self._forecast_showings = forecast.forecast_showings
+        self._active_days = forecast.active_days
+        self._first_day = forecast.first_day
+        if forecast.profile_generation == self._profile_generation:
+            self._average_sh_in_week = forecast.average_sh_in_week
+            self._week_profile_key = forecast.week_profile_key
         self.endResetModel()
 
-    # Calculate the average number of shows for each day of the week
-    def _analyse_results(self):
-        for banner in self._banners:
-            for sh in banner.showings:
-                date = sh.datetime.date()
-                if date.daysTo(QDate().currentDate()) > 0:
-                    self._average_sh_in_week[date.dayOfWeek() - 1] += 1
-        amount_days_of_week = self._amount_days_of_week()
-        for i, _ in enumerate(self._average_sh_in_week):
-            self._average_sh_in_week[i] /= amount_days_of_week[i]
-
-    # Getting the start and end dates of all banners
-    def _min_max_dates(self):
-        self._min_date = QDate().currentDate().addYears(10)
-        self._max_date = QDate().currentDate().addYears(-10)
-        for banner in self._banners:
-            if self._min_date.daysTo(banner.date_start) < 0:
-                self._min_date = banner.date_start
-            if self._max_date.daysTo(banner.date_end) > 0:
-                self._max_date = banner.date_end
-
-    # Number of days of the week in the banner validity period
-    def _amount_days_of_week(self):
-        date = QDate(self._min_date)
-        amount = [0, 0, 0, 0, 0, 0, 0]
-        while date.daysTo(QDate().currentDate()) > 0:
-            amount[date.dayOfWeek() - 1] += 1
-            date = date.addDays(1)
-        return amount
-
-    # Sort banners by min amount of shows
-    def _sort_banners(self):
-        sorted_banners = []
-        for banner in self._banners:
-            if QDate().currentDate().daysTo(banner.date_end) > 0:
-                sorted_banners.append(banner)
-        self._banners = sorted(sorted_banners, key=lambda x: x.min_showings)
-
-    # For each date to calculate the forecast of banner shows
-    def _calc_forecast_for_banners(self):
-        date = QDate().currentDate()
-        while date.daysTo(self._max_date) >= 0:
-            target_sh = self._average_sh_in_week[date.dayOfWeek() - 1]
-            self._calc_forecast_for_date(date, target_sh)
-            date = date.addDays(1)
-
-    # Calculate impressions forecast for a certain date
-    def _calc_forecast_for_date(self, date: QDate, target: int):
-        all_min_sh = self._sum_min_showings_for_date(date)
-        for i, banner in enumerate(self._banners):
-            if banner.is_active_on_date(date):
-                sh_for_date = round(banner.min_showings * target / all_min_sh)
-                if sh_for_date > banner.max_showings:
-                    sh_for_date = banner.max_showings
-                self._forecast_showings[i][date] = sh_for_date
-
-    # Total minimum number of banners shows for the given date
-    def _sum_min_showings_for_date(self, date: QDate):
-        all_min_sh = 0
-        for banner in self._banners:
-            if banner.is_active_on_date(date):
-                all_min_sh += banner.min_showings
-        return all_min_sh
+    # Arguments of calc_forecast: the banners, the aggregates and the cached average numbers of shows.
+    # They are taken in the GUI thread, so calc_forecast does not read the model
+    def forecast_arguments(self, banners: list[Banner]) -> tuple:
+        return (list(banners), self._aggregates, self._average_sh_in_week, self._week_profile_key,
+                self._profile_generation)
+
+    # Calculating the forecast for the banners with the arguments of forecast_arguments. The model is not used,
+    # so the method may be called outside of the GUI thread; the result is shown by set_forecast
+    @staticmethod
+    @traced(category='model')
+    def calc_forecast(banners: list[Banner], aggregates: Aggregates, average_sh_in_week: np.ndarray,
+                      week_profile_key: tuple[int, int], profile_generation: int) -> Forecast:
+        min_day, max_day = Forecaster._min_max_dates(banners)
+        average_sh_in_week, week_profile_key = Forecaster._analyse_results(banners, min_day, aggregates,
+                                                                           average_sh_in_week, week_profile_key)
+        first_day = today()
+        sorted_banners = Forecaster._sort_banners(banners, first_day)
+        forecast_showings, active_days = Forecaster._calc_forecast_for_banners(sorted_banners, average_sh_in_week,
+                                                                               first_day, max_day)
+        return Forecast(sorted_banners, forecast_showings, active_days, first_day,
+                        average_sh_in_week, week_profile_key, profile_generation)
+
+    # Calculate the average number of shows for each day of the week.
+    # The result is cached until the shows are changed (see invalidate_week_profile) or the period changes
+    @staticmethod
+    def _analyse_results(banners: list[Banner], min_day: int, aggregates: Aggregates, average_sh_in_week: np.ndarray,
+                         week_profile_key: tuple[int, int]) -> tuple[np.ndarray, tuple[int, int]]:
+        key = (min_day, today())
+        if key != week_profile_key:
+            if aggregates is not None:
+                days, counts = aggregates.showings_per_day()
+            else:
+                days, counts = Forecaster._showings_per_day(banners)
+            average_sh_in_week = weekday_profile(days, counts, *key)
+        return average_sh_in_week, key
+
+    # The shows of banners were changed, the average numbers of shows must be recalculated
+    def invalidate_week_profile(self):
+        self._week_profile_key = None
+        self._profile_generation += 1
+        self._aggregates = None
+
+    # Numbers of shows per day of all banners as two parallel arrays (day ordinals, counts)
+    @staticmethod
+    def _showings_per_day(banners: list[Banner]) -> tuple[np.ndarray, np.ndarray]:
+        amount = sum(len(banner.day_counts) for banner in banners)
+        days = np.fromiter((day for banner in banners for day in banner.day_counts),
+                           dtype=np.int64, count=amount)
+        counts = np.fromiter((count for banner in banners for count in banner.day_counts.values()),
+                             dtype=np.int64, count=amount)
+        return days, counts
+
+    # Getting the start and end days of all banners (10 years from today if there are no banners)
+    @staticmethod
+    def _min_max_dates(banners: list[Banner]) -> tuple[int, int]:
+        current_day = today()
+        min_day = min((banner.date_start for banner in banners), default=current_day + 3650)
+        max_day = max((banner.date_end for banner in banners), default=current_day - 3650)
+        return min_day, max_day
+
+    # Sort the banners acting after first_day by min amount of shows
+    @staticmethod
+    def _sort_banners(banners: list[Banner], first_day: int) -> list[Banner]:
+        return sorted((banner for banner in banners if banner.date_end > first_day), key=lambda x: x.min_showings)
+
+    # Calculate the forecast of banner shows for all days from first_day to the last day of banners action
+    @staticmethod
+    def _calc_forecast_for_banners(banners: list[Banner], average_sh_in_week: np.ndarray,
+                                   first_day: int, last_day: int) -> tuple[np.ndarray, np.ndarray]:
+        n_days = max(last_day - first_day + 1, 0)
+        starts = np.fromiter((b.date_start for b in banners), dtype=np.int64, count=len(banners))
+        ends = np.fromiter((b.date_end for b in banners), dtype=np.int64, count=len(banners))
+        min_sh = np.fromiter((b.min_showings for b in banners), dtype=np.int64, count=len(banners))
+        max_sh = np.fromiter((b.max_showings for b in banners), dtype=np.int64, count=len(banners))
+        targets = targets_for_days(average_sh_in_week, first_day, n_days)
+        return forecast_matrix(starts, ends, min_sh, max_sh, targets, first_day)
 
     # Get the impression forecast for the banner
-    # return [dates of banner action, forecasted impressions, min impressions, max impressions]
+    # return [days of banner action (day ordinals), forecasted impressions, min impressions, max impressions]
     def get_forecast_for_banner(self, index: int) -> tuple[list, list, list, list]:
-        dates = list(self._forecast_showings[index].keys())
-        showings = []
-        min_sh = []
-        max_sh = []
-        for date in dates:
-            showings.append(self._forecast_showings[index].get(date))
-            min_sh.append(self._banners[index].min_showings)
-            max_sh.append(self._banners[index].max_showings)
+        day_indexes = np.flatnonzero(self._active_days[index])
+        dates = (self._first_day + day_indexes).tolist()
+        showings = self._forecast_showings[index, day_indexes].tolist()
+        min_sh = [self._banners[index].min_showings] * len(dates)
+        max_sh = [self._banners[index].max_showings] * len(dates)
         return dates, showings, min_sh, max_sh
 
     # region Redefining the methods for filling the table
@@ -107,11 +152,12 @@ class Forecaster(QAbstractTableModel):
             return self._headers[section]
         return None
 
+    # The items of a table have no children
     def rowCount(self, parent=None):
-        return len(self._banners)
+        return 0 if parent is not None and parent.isValid() else len(self._banners)
 
     def columnCount(self, parent=None):
-        return len(self._headers)
+        return 0 if parent is not None and parent.isValid() else len(self._headers)
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
@@ -122,6 +168,6 @@ class Forecaster(QAbstractTableModel):
             if column == 1:
                 return self._banners[row].company_name
             if column == 2:
-                return self._banners[row].date_end
+                return day_to_date(self._banners[row].date_end)
         return None
     # endregion
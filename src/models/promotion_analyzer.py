@@ -5,79 +5,135 @@ from src.models.banner_editor import *
 class PromotionAnalyser(QAbstractTableModel):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._all_banners = []
+        # _banners_by_id format - { banner_id : banner }
+        self._banners_by_id = {}
         self._banners_to_show = []
-        # _date_banners_dict format - { QDate : [id1, id2, id3, ...] }
-        self._date_banners_dict = {}
-        self._min_date = QDate()
-        self._max_date = QDate()
-        self._selected_date = QDate()
+        # Inverted index of the shows, _date_index format - { day ordinal : { banner_id : number of shows } }
+        self._date_index = {}
+        # First and last day of the analysed period and the selected day (day ordinals, None - no day is selected)
+        self._min_date, self._max_date = find_min_max_banner_days([])
+        self._selected_day = None
         self._headers = ['Name', 'Min shows', 'Actual shows']
 
-    def get_min_date(self) -> QDate:
+    def get_min_date(self) -> int:
         return self._min_date
 
-    def get_max_date(self) -> QDate:
+    def get_max_date(self) -> int:
         return self._max_date
 
-    def get_banner_info(self, index: int, date: QDate) -> BannerPromotionData:
+    def get_banner_info(self, index: int, day: int) -> BannerPromotionData:
         banner_pr = BannerPromotionData()
-        banner_pr.set_from_banner(self._banners_to_show[index], date)
+        banner_pr.set_from_banner(self._banners_to_show[index], day)
         return banner_pr
 
     def get_alltime_data(self) -> (int, int, int):
         all_fact_showings = 0
         all_min_showings = 0
         all_max_showings = 0
-        for banner in self._all_banners:
-            all_fact_showings += len(banner.showings)
-            days = banner.date_start.daysTo(banner.date_end) + 1
+        for banner in self._banners_by_id.values():
+            all_fact_showings += banner.total_showings()
+            days = banner.date_end - banner.date_start + 1
             all_min_showings += banner.min_showings * days
             all_max_showings += banner.max_showings * days
         return all_fact_showings, all_min_showings, all_max_showings
 
-    def find_min_max_banner_dates(self):
-        min_date = QDate.currentDate().addYears(100)
-        max_date = QDate.currentDate().addYears(-100)
-        for banner in self._all_banners:
-            if min_date.daysTo(banner.date_start) < 0:
-                min_date = banner.date_start
-            if max_date.daysTo(banner.date_end) > 0:
-                max_date = banner.date_end
-        if QDate.currentDate().daysTo(max_date) > 0:
-            max_date = QDate.currentDate()
-        return min_date, max_date
-
-    def set_banners(self, banners: list[Banner]):
-        self._all_banners = banners
+    def find_min_max_banner_dates(self) -> tuple[int, int]:
+        return find_min_max_banner_days(self._banners_by_id.values())
+
+    # date_index - index built by build_date_index for the same banners (for example outside of the GUI thread),
+    # by default it is built here.
+    # aggregates - aggregates of the database the banners were loaded from (see load_banners_with_aggregates)
+    @traced(category='model')
+    def set_banners(self, banners: list[Banner], date_index: dict[int, dict[int, int]] = None,
+                    aggregates: Aggregates = None):
+        self._banners_by_id = {banner.id: banner for banner in banners}
+        if aggregates is not None:
+            self._min_date, self._max_date = aggregates.min_max_banner_days()
+        else:
+            self._min_date, self._max_date = self.find_min_max_banner_dates()
+        self._date_index = date_index if date_index is not None else self.build_date_index(banners, aggregates)
+        self.set_banners_to_display(self._selected_day)
+
+    # Building the inverted index in one pass over the numbers of shows per day of the banners,
+    # or from the aggregates of the same banners (the rollup rows are grouped by day with NumPy)
+    @staticmethod
+    @traced(category='model')
+    def build_date_index(banners: list[Banner], aggregates: Aggregates = None) -> dict[int, dict[int, int]]:
+        if aggregates is not None:
+            return PromotionAnalyser._date_index_from_aggregates(aggregates)
+        date_index = {}
+        for banner in banners:
+            PromotionAnalyser._add_to_index(date_index, banner)
+        return date_index
+
+    @staticmethod
+    def _date_index_from_aggregates(aggregates: Aggregates) -> dict[int, dict[int, int]]:
+        banner_ids = np.repeat(aggregates.banner_ids, np.diff(aggregates.offsets))
+        order = np.argsort(aggregates.days, kind='stable')
+        days = np.asarray(aggregates.days)[order]
+        banner_ids = banner_ids[order].tolist()
+        counts = np.asarray(aggregates.counts)[order].tolist()
+        # Boundaries of the groups of the same day
+        bounds = [0, *(np.flatnonzero(np.diff(days)) + 1).tolist(), len(days)]
+        return {int(days[start]): dict(zip(banner_ids[start:end], counts[start:end]))
+                for start, end in zip(bounds, bounds[1:]) if start < end}
+
+    def _index_banner(self, banner: Banner):
+        self._add_to_index(self._date_index, banner)
+
+    @staticmethod
+    def _add_to_index(date_index: dict[int, dict[int, int]], banner: Banner):
+        for day, count in banner.day_counts.items():
+            date_index.setdefault(day, {})[banner.id] = count
+
+    def _unindex_banner(self, banner: Banner):
+        for day in banner.day_counts:
+            day_banners = self._date_index.get(day)
+            if day_banners is not None:
+                day_banners.pop(banner.id, None)
+                if not day_banners:
+                    del self._date_index[day]
+
+    # region Incremental updates of the index after the banners and their shows are edited
+    # Adding a new banner or replacing the banner with the same id
+    def update_banner(self, banner: Banner):
+        old_banner = self._banners_by_id.get(banner.id)
+        if old_banner is not None:
+            self._unindex_banner(old_banner)
+        self._banners_by_id[banner.id] = banner
+        self._index_banner(banner)
         self._min_date, self._max_date = self.find_min_max_banner_dates()
-        self._set_date_banners_dict()
-
-    # Filling the dictionary, where the key is a date
-    # and the value is a list of banners shown on this date
-    def _set_date_banners_dict(self):
-        date = QDate(self._min_date)
-        while date.daysTo(self._max_date) >= 0:
-            self._date_banners_dict[date] = []
-            date = date.addDays(1)
-        for banner in self._all_banners:
-            for showing in banner.showings:
-                date = QDate(showing.datetime.date())
-                if date.daysTo(QDate.currentDate()) >= 0:
-                    self._date_banners_dict.get(date).append(banner.id)
-
-    # Filling the list to display the banner table (for a specific date)
-    def set_banners_to_display(self, date: QDate):
+        self.set_banners_to_display(self._selected_day)
+
+    def remove_banner(self, banner_id: int):
+        banner = self._banners_by_id.pop(banner_id, None)
+        if banner is None:
+            return
+        self._unindex_banner(banner)
+        self._min_date, self._max_date = self.find_min_max_banner_dates()
+        self.set_banners_to_display(self._selected_day)
+
+    # Changing the number of shows of the banner for the day by delta
+    def update_showings_count(self, banner_id: int, day: int, delta: int):
+        day_banners = self._date_index.setdefault(day, {})
+        count = day_banners.get(banner_id, 0) + delta
+        if count > 0:
+            day_banners[banner_id] = count
+        else:
+            day_banners.pop(banner_id, None)
+            if not day_banners:
+                del self._date_index[day]
+        if day == self._selected_day:
+            self.set_banners_to_display(self._selected_day)
+
+    # endregion
+
+    # Filling the list to display the banner table (for a specific day ordinal)
+    def set_banners_to_display(self, day: int):
         self.beginResetModel()
-        self._selected_date = date
-        ids = self._date_banners_dict.get(date)
-        self._banners_to_show.clear()
-        if ids is not None:
-            for banner in self._all_banners:
-                for id in ids:
-                    if id == banner.id:
-                        self._banners_to_show.append(banner)
-                        break
+        self._selected_day = day
+        day_banners = self._date_index.get(self._selected_day, {})
+        self._banners_to_show = [self._banners_by_id[banner_id] for banner_id in day_banners]
         self.endResetModel()
 
     # region Overriding methods for filling the table
@@ -86,11 +142,12 @@ class PromotionAnalyser(QAbstractTableModel):
             return self._headers[section]
         return None
 
+    # The items of a table have no children
     def rowCount(self, parent=None):
-        return len(self._banners_to_show)
+        return 0 if parent is not None and parent.isValid() else len(self._banners_to_show)
 
     def columnCount(self, parent=None):
-        return len(self._headers)
+        return 0 if parent is not None and parent.isValid() else len(self._headers)
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
@@ -101,6 +158,6 @@ class PromotionAnalyser(QAbstractTableModel):
             if column == 1:
                 return self._banners_to_show[row].min_showings
             if column == 2:
-                return self._banners_to_show[row].count_showings_for_date(self._selected_date)
+                return self._date_index[self._selected_day][self._banners_to_show[row].id]
         return None
     # endregion
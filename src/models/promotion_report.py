@@ -0,0 +1,166 @@
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from itertools import groupby, islice
+from operator import itemgetter
+
+from src.drivers.advertis_driver import *
+from src.models.forecast_engine import *
+
+# Number of banners whose forecast is calculated at once (limits the size of the forecast matrix)
+FORECAST_BLOCK_SIZE = 1000
+
+COMPLETION_FIELDS = ('banner_id', 'name', 'company_name', 'date', 'min_shows', 'max_shows', 'fact_shows',
+                     'min_completion_percent', 'min_shows_all', 'max_shows_all', 'fact_shows_all',
+                     'min_completion_percent_all')
+TOTALS_FIELDS = ('banners', 'fact_shows', 'min_shows', 'max_shows', 'min_completion_percent')
+FORECAST_FIELDS = ('banner_id', 'name', 'company_name', 'date', 'forecast_shows', 'min_shows', 'max_shows')
+BANNER_FIELDS = ('banner_id', 'name', 'company_name', 'date_from', 'date_to', 'min_shows', 'max_shows', 'fact_shows',
+                 'min_completion_percent')
+
+
+# Banner for the reports: the dates are day ordinals and only the numbers of shows per day are kept
+@dataclass(slots=True)
+class ReportBanner:
+    id: int
+    name: str
+    company_name: str
+    first_day: int
+    last_day: int
+    min_showings: int
+    max_showings: int
+    # { day ordinal : number of shows }
+    day_counts: dict[int, int] = field(default_factory=dict)
+
+    def action_days(self) -> int:
+        return self.last_day - self.first_day + 1
+
+
+# Percentage of completion of the min number of shows (the same as in BannerPromotionData, limited by 100)
+def completion_percent(fact_showings: int, min_showings: int) -> float:
+    if min_showings <= 0:
+        return 100.0
+    return min(fact_showings / min_showings * 100, 100.0)
+
+
+# Reading the banners one by one together with their numbers of shows per day.
+# Banners and the rollup are both ordered by banner id, so only one banner is held in memory.
+# showing_filter - only the banners and the shows of the sites of the filter are read
+def iter_report_banners(driver: AdvertisDriver, showing_filter: ShowingFilter = None) -> Iterator[ReportBanner]:
+    daily_groups = groupby(driver.iter_daily_showings(showing_filter), key=itemgetter(0))
+    group_id, group_rows = next(daily_groups, (None, None))
+    for row in driver.iter_banner_rows(showing_filter):
+        banner = ReportBanner(*row)
+        # Skipping the rows of the rollup without a banner
+        while group_id is not None and group_id < banner.id:
+            group_id, group_rows = next(daily_groups, (None, None))
+        if group_id == banner.id:
+            banner.day_counts = {day: count for _, day, count in group_rows}
+            group_id, group_rows = next(daily_groups, (None, None))
+        yield banner
+
+
+# Daily and all-time completion of the min number of shows, one row for each day of banner action
+# within [first_day, last_day] (None - no limit)
+def completion_rows(banners: Iterator[ReportBanner], first_day: int = None,
+                    last_day: int = None) -> Iterator[dict]:
+    for banner in banners:
+        days = banner.action_days()
+        min_all = banner.min_showings * days
+        max_all = banner.max_showings * days
+        fact_all = sum(banner.day_counts.values())
+        percent_all = completion_percent(fact_all, min_all)
+        start = banner.first_day if first_day is None else max(banner.first_day, first_day)
+        end = banner.last_day if last_day is None else min(banner.last_day, last_day)
+        for day in range(start, end + 1):
+            fact = banner.day_counts.get(day, 0)
+            yield {'banner_id': banner.id, 'name': banner.name, 'company_name': banner.company_name,
+                   'date': day_to_iso(day), 'min_shows': banner.min_showings, 'max_shows': banner.max_showings,
+                   'fact_shows': fact, 'min_completion_percent': round(completion_percent(fact, banner.min_showings), 2),
+                   'min_shows_all': min_all, 'max_shows_all': max_all, 'fact_shows_all': fact_all,
+                   'min_completion_percent_all': round(percent_all, 2)}
+
+
+# Completion of the min number of shows by every banner within [first_day, last_day] (None - no limit),
+# one row for each banner acting within the period
+def banner_completion_rows(banners: Iterator[ReportBanner], first_day: int = None,
+                           last_day: int = None) -> Iterator[dict]:
+    for banner in banners:
+        start = banner.first_day if first_day is None else max(banner.first_day, first_day)
+        end = banner.last_day if last_day is None else min(banner.last_day, last_day)
+        if start > end:
+            continue
+        days = end - start + 1
+        fact = sum(count for day, count in banner.day_counts.items() if start <= day <= end)
+        yield {'banner_id': banner.id, 'name': banner.name, 'company_name': banner.company_name,
+               'date_from': day_to_iso(start), 'date_to': day_to_iso(end), 'min_shows': banner.min_showings * days,
+               'max_shows': banner.max_showings * days, 'fact_shows': fact,
+               'min_completion_percent': round(completion_percent(fact, banner.min_showings * days), 2)}
+
+
+# All-time totals of all banners (the same as PromotionAnalyser.get_alltime_data)
+def totals_row(banners: Iterator[ReportBanner]) -> dict:
+    amount = fact_showings = min_showings = max_showings = 0
+    for banner in banners:
+        amount += 1
+        fact_showings += sum(banner.day_counts.values())
+        min_showings += banner.min_showings * banner.action_days()
+        max_showings += banner.max_showings * banner.action_days()
+    return {'banners': amount, 'fact_shows': fact_showings, 'min_shows': min_showings, 'max_shows': max_showings,
+            'min_completion_percent': round(completion_percent(fact_showings, min_showings), 2)}
+
+
+# Forecast of the shows of the banners acting after today (as in Forecaster), one row for each forecasted day.
+# The banners and the numbers of shows are read once in one read transaction, so they match each other.
+# The forecast is calculated by blocks of block_size banners: only the rows of the banners acting after today
+# and the matrix of one block are held in memory
+def forecast_rows(driver: AdvertisDriver, today: int, block_size: int = FORECAST_BLOCK_SIZE) -> Iterator[dict]:
+    if block_size <= 0:
+        raise ValueError('The block size must be positive.')
+    min_day = None
+    banner_rows = []
+    with driver.read_transaction():
+        for row in driver.iter_banner_rows():
+            min_day = row[3] if min_day is None else min(min_day, row[3])
+            if row[4] > today:
+                banner_rows.append(row)
+        days, counts = driver.get_showings_per_day()
+    if not banner_rows:
+        return
+    starts, ends, min_sh = (np.array(column, dtype=np.int64) for column in list(zip(*banner_rows))[3:6])
+    average_sh_in_week = weekday_profile(days, counts, min_day, today)
+    n_days = int(ends.max()) - today + 1
+    targets = targets_for_days(average_sh_in_week, today, n_days)
+    all_min = sum_min_showings_per_day(starts, ends, min_sh, today, n_days)
+
+    banner_rows = iter(banner_rows)
+    while block := list(islice(banner_rows, block_size)):
+        block_starts, block_ends, block_min, block_max = (np.array(column, dtype=np.int64)
+                                                          for column in list(zip(*block))[3:7])
+        forecast, active = forecast_matrix(block_starts, block_ends, block_min, block_max, targets, today, all_min)
+        for row, banner_forecast, banner_active in zip(block, forecast, active):
+            for day_index in np.flatnonzero(banner_active).tolist():
+                yield {'banner_id': row[0], 'name': row[1], 'company_name': row[2],
+                       'date': day_to_iso(today + day_index), 'forecast_shows': int(banner_forecast[day_index]),
+                       'min_shows': row[5], 'max_shows': row[6]}
+
+
+# Forecast of the banners held in memory (the same calculation as in Forecaster.calc_forecast).
+# days, counts - total number of shows of all banners per day (see AdvertisDriver.get_showings_per_day)
+# return { banner_id : [(day, forecasted shows), ...] } for the banners acting after today
+def forecast_for_banners(banners: list[ReportBanner], days: np.ndarray, counts: np.ndarray,
+                         today: int) -> dict[int, list[tuple[int, int]]]:
+    forecast_banners = [banner for banner in banners if banner.last_day > today]
+    if not forecast_banners:
+        return {}
+    starts, ends, min_sh, max_sh = (np.fromiter((getattr(banner, name) for banner in forecast_banners),
+                                                dtype=np.int64, count=len(forecast_banners))
+                                    for name in ('first_day', 'last_day', 'min_showings', 'max_showings'))
+    min_day = min(banner.first_day for banner in banners)
+    n_days = int(ends.max()) - today + 1
+    targets = targets_for_days(weekday_profile(days, counts, min_day, today), today, n_days)
+    forecast, active = forecast_matrix(starts, ends, min_sh, max_sh, targets, today)
+    result = {}
+    for banner, banner_forecast, banner_active in zip(forecast_banners, forecast, active):
+        day_indexes = np.flatnonzero(banner_active)
+        result[banner.id] = list(zip((today + day_indexes).tolist(), banner_forecast[day_indexes].tolist()))
+    return result
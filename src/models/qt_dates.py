@@ -0,0 +1,24 @@
+from PyQt5.QtCore import QDate, QDateTime, QTime
+
+from src.models.date_ordinals import *
+
+# Conversion between the integer dates of the models (see date_ordinals) and the Qt types of the views
+QT_EPOCH_DATE = QDate(1970, 1, 1)
+
+
+def date_to_day(date: QDate) -> int:
+    return QT_EPOCH_DATE.daysTo(date)
+
+
+def day_to_date(day: int) -> QDate:
+    return QT_EPOCH_DATE.addDays(day)
+
+
+def datetime_to_minutes(datetime: QDateTime) -> int:
+    time = datetime.time()
+    return date_to_day(datetime.date()) * MINUTES_PER_DAY + time.hour() * 60 + time.minute()
+
+
+def minutes_to_datetime(minutes: int) -> QDateTime:
+    day, minute_of_day = divmod(minutes, MINUTES_PER_DAY)
+    return QDateTime(day_to_date(day), QTime(minute_of_day // 60, minute_of_day % 60))
@@ -1,25 +1,79 @@
 from dataclasses import dataclass
+from enum import Enum
+from string import ascii_lowercase, ascii_uppercase
 
-from PyQt5.QtCore import QDateTime
-
-DATETIME_FORMAT = 'dd.MM.yyyy hh:mm'
+from src.models.date_ordinals import *
 
 
 @dataclass(slots=True)
 class Showing:
     id: int = 0
     site_name: str = ''
-    datetime: QDateTime = QDateTime()
+    # Show time, minutes since 01.01.1970 00:00
+    ts: int = 0
     banner_id: int = 0
 
     def to_showing_short_data(self):
-        return ShowingShortData(self.site_name, self.datetime)
+        return ShowingShortData(self.site_name, self.ts)
 
     def datetime_str(self) -> str:
-        return self.datetime.toString(DATETIME_FORMAT)
+        return minutes_to_text(self.ts)
+
+    # Day ordinal of the show
+    def day(self) -> int:
+        return minutes_to_day(self.ts)
 
 
 @dataclass(slots=True)
 class ShowingShortData:
     site_name: str = ''
-    datetime: QDateTime = QDateTime()
+    ts: int = 0
+
+
+class ShowingOrder(Enum):
+    by_site = 0
+    by_time = 1
+
+
+# Translation of the ASCII letters to the lower case (the case of the other letters matters, as in SQLite LIKE)
+_ASCII_LOWER = str.maketrans(ascii_uppercase, ascii_lowercase)
+
+
+# Order and filter of the shows of a banner, applied by the database (see AdvertisDriver.get_showings_page)
+@dataclass(slots=True)
+class ShowingQuery:
+    order: ShowingOrder = ShowingOrder.by_time
+    descending: bool = False
+    # Part of the site name (the case of the ASCII letters is ignored), '' - any site
+    site_substring: str = ''
+    # Show time range in minutes (inclusive), None - no limit
+    ts_from: int = None
+    ts_to: int = None
+
+    # Key of the show in the order of the query (the keys of different shows are different)
+    def sort_key(self, showing: Showing) -> tuple:
+        if self.order == ShowingOrder.by_site:
+            return showing.site_name, showing.ts, showing.id
+        return showing.ts, showing.id
+
+    def matches(self, showing: Showing) -> bool:
+        return (self.site_substring.translate(_ASCII_LOWER) in showing.site_name.translate(_ASCII_LOWER)
+                and (self.ts_from is None or showing.ts >= self.ts_from)
+                and (self.ts_to is None or showing.ts <= self.ts_to))
+
+
+# Filter of the shows and banners of the exports, applied by the database (see AdvertisDriver.iter_export_showing_batches).
+# None - no filter
+@dataclass(slots=True)
+class ShowingFilter:
+    banner_ids: list[int] = None
+    company_name: str = None
+    # Exact site name
+    site_name: str = None
+    # Show time range in minutes (inclusive)
+    ts_from: int = None
+    ts_to: int = None
+
+    # True - only the shows of some sites are selected, so the numbers of shows cannot be taken from the rollup
+    def filters_sites(self) -> bool:
+        return self.site_name is not None
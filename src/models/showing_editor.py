@@ -1,42 +1,172 @@
-from PyQt5.QtCore import QAbstractTableModel, Qt
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
 
-from src.models.showing import *
+from src.models.edit_queue import *
+from src.models.qt_dates import *
+from src.models.showing_store import ShowingStore
 
 
+# Table of the shows of one banner.
+# The shows are read from the database lazily by pages of page_size shows: the first page when the banner
+# is selected, the next ones when the view is scrolled to the end of the loaded rows (canFetchMore / fetchMore).
+# Sorting (by the columns) and filtering are done by the database, only the loaded pages are kept in memory
+# (in the columns of a ShowingStore).
+# edit_queue - queue of the edits of the shows, it is flushed before the shows are read
 class ShowingEditor(QAbstractTableModel):
-    def __init__(self, parent=None):
+    def __init__(self, driver: AdvertisDriver, parent=None, page_size: int = SHOWINGS_PAGE_SIZE,
+                 edit_queue: EditQueue = None):
         super().__init__(parent)
-        self._showings = []
+        self._driver = driver
+        self._edit_queue = edit_queue
+        self._page_size = page_size
+        self._banner_id = None
+        self._query = ShowingQuery()
+        # Loaded shows in the order of the query
+        self._showings = ShowingStore()
+        self._has_more = False
         self._headers = ["Site name", "Show time"]
 
-    def init_showings(self, showings):
+    # The order and the filter are kept when another banner is selected
+    @traced(category='model')
+    def init_showings(self, banner_id: int):
+        self._flush_edits()
         self.beginResetModel()
-        self._showings = showings
+        self._banner_id = banner_id
+        self._showings = ShowingStore(banner_id, self._driver.get_showings_page(banner_id, None, self._page_size,
+                                                                                 self._query))
+        self._has_more = len(self._showings) == self._page_size
         self.endResetModel()
 
     def clear_showings(self):
         self.beginResetModel()
-        self._showings = []
+        self._banner_id = None
+        self._showings = ShowingStore()
+        self._has_more = False
         self.endResetModel()
 
+    # region Sorting and filtering (the shows of the displayed banner are loaded again from the first page)
+    # column - 0 (site name) or 1 (show time)
+    @traced(category='model')
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._query.order = ShowingOrder(column)
+        self._query.descending = order == Qt.DescendingOrder
+        self._reload()
+
+    # site_substring - part of the site name ('' - any site), ts_from, ts_to - show time range in minutes
+    # (inclusive, None - no limit)
+    def set_filter(self, site_substring: str = '', ts_from: int = None, ts_to: int = None):
+        self._query.site_substring = site_substring
+        self._query.ts_from = ts_from
+        self._query.ts_to = ts_to
+        self._reload()
+
+    def get_query(self) -> ShowingQuery:
+        return self._query
+
+    def _reload(self):
+        if self._banner_id is not None:
+            self.init_showings(self._banner_id)
+
+    # Row for the show in the loaded rows (after the rows preceding it in the order of the query)
+    def _insert_row(self, showing: Showing) -> int:
+        key = self._query.sort_key(showing)
+        low, high = 0, len(self._showings)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._query.sort_key(self._showings[middle])
+            if (middle_key > key) if self._query.descending else (middle_key < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # endregion
+
+    # region Lazy loading of the pages
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._has_more
+
+    @traced(category='model')
+    def fetchMore(self, parent):
+        if parent.isValid() or not self._has_more:
+            return
+        self._flush_edits()
+        after = self._query.sort_key(self._showings[-1]) if self._showings else None
+        page = self._driver.get_showings_page(self._banner_id, after, self._page_size, self._query)
+        self._has_more = len(page) == self._page_size
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._showings), len(self._showings) + len(page) - 1)
+            self._showings.extend(page)
+            self.endInsertRows()
+
+    def _flush_edits(self):
+        if self._edit_queue is not None:
+            self._edit_queue.flush()
+
+    # endregion
+
+    # region Notifications about the changes of the shows saved to the database by BannerEditor.
+    # Only the loaded rows are changed: a show following the last loaded row is read with the next page,
+    # the shows not matching the filter are not displayed
+    def showing_added(self, showing: Showing):
+        if showing.banner_id != self._banner_id or not self._query.matches(showing):
+            return
+        row = self._insert_row(showing)
+        if row == len(self._showings) and self._has_more:
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._showings.insert(row, showing)
+        self.endInsertRows()
+
+    def showing_removed(self, row: int):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._showings[row]
+        self.endRemoveRows()
+
+    # The changed show is moved to its new position in the table
+    def showing_replaced(self, row: int, showing: Showing):
+        if not self._query.matches(showing):
+            self.showing_removed(row)
+            return
+        # Position of the changed show in the table without the old show
+        old_showing = self._showings.pop(row)
+        new_row = self._insert_row(showing)
+        self._showings.insert(row, old_showing)
+        if new_row == row:
+            self._showings[row] = showing
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+        elif new_row == len(self._showings) - 1 and self._has_more:
+            self.showing_removed(row)
+        else:
+            # Destination row of beginMoveRows is counted before the move
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), new_row + 1 if new_row > row else new_row)
+            del self._showings[row]
+            self._showings.insert(new_row, showing)
+            self.endMoveRows()
+
+    # endregion
+
     def headerData(self, section, orientation, role=...):
         if role == Qt.DisplayRole and orientation == Qt.Horizontal:
             return self._headers[section]
 
+    # The items of a table have no children
     def rowCount(self, parent=None):
-        return len(self._showings)
+        return 0 if parent is not None and parent.isValid() else len(self._showings)
 
     def columnCount(self, parent=None):
-        return len(self._headers)
+        return 0 if parent is not None and parent.isValid() else len(self._headers)
 
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
             row = index.row()
             column = index.column()
             if column == 0:
-                return self._showings[row].site_name
+                return self._showings.site_name(row)
             if column == 1:
-                return self._showings[row].datetime
+                return minutes_to_datetime(self._showings.ts(row))
+
+    def get_showing(self, index: int) -> Showing:
+        return self._showings[index]
 
     def get_short_showing(self, index: int) -> ShowingShortData:
         return self._showings[index].to_showing_short_data()
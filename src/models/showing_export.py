@@ -0,0 +1,65 @@
+from collections.abc import Callable, Iterator
+from contextlib import closing
+from json.encoder import encode_basestring
+from operator import add
+
+from src.drivers.advertis_driver import *
+
+# Columns of the exported shows
+SHOWING_FIELDS = ('id', 'banner_id', 'name', 'company_name', 'site_name', 'time')
+# Lines of the exported shows (the same text as csv.writer and json.dumps write for the rows of the reports)
+_CSV_LINE = '%d,%d,%s,%s,%s,%s\n'
+_JSONL_LINE = '{"id": %d, "banner_id": %d, "name": %s, "company_name": %s, "site_name": %s, "time": "%s"}\n'
+# " HH:MM" of every minute of a day
+_MINUTE_TEXTS = [f' {minute // 60:02d}:{minute % 60:02d}' for minute in range(MINUTES_PER_DAY)]
+
+
+# Value of the CSV file, quoted if needed (as csv.writer does, None - empty value)
+def _csv_text(text: str) -> str:
+    if text is None:
+        return ''
+    if any(char in text for char in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+# JSON string of the text (None - null)
+def _json_text(text: str) -> str:
+    return encode_basestring(text) if text is not None else 'null'
+
+
+# Cache of the encoded values (the names of the banners, companies and sites and the days repeat)
+class _EncodedValues(dict):
+    def __init__(self, encode: Callable):
+        super().__init__()
+        self._encode = encode
+
+    def __missing__(self, value):
+        encoded = self[value] = self._encode(value)
+        return encoded
+
+
+# Export of the shows as text blocks of the CSV or JSON lines file, one block for a batch of the shows read
+# from the database (see AdvertisDriver.iter_export_showing_batches), so the memory does not depend
+# on the number of the shows. The banners and the shows are read in one read transaction, so the names
+# of the banners match the shows. The values of a batch are converted by columns: the times by NumPy
+# and the cached texts of the days and minutes, the texts by the caches of the encoded names
+def export_showing_blocks(driver: AdvertisDriver, output_format: str,
+                          showing_filter: ShowingFilter = None) -> Iterator[str]:
+    line, encode = (_CSV_LINE, _csv_text) if output_format == 'csv' else (_JSONL_LINE, _json_text)
+    no_banner = (encode(None), encode(None))
+    site_names = _EncodedValues(encode)
+    days = _EncodedValues(day_to_iso)
+    if output_format == 'csv':
+        yield ','.join(SHOWING_FIELDS) + '\n'
+    with driver.read_transaction():
+        banners = {row[0]: (encode(row[1]), encode(row[2])) for row in driver.iter_banner_rows(showing_filter)}
+        with closing(driver.iter_export_showing_batches(showing_filter)) as batches:
+            for batch in batches:
+                ids, banner_ids, batch_site_names, ts = zip(*batch)
+                ts = np.array(ts, dtype=np.int64)
+                times = map(add, map(days.__getitem__, (ts // MINUTES_PER_DAY).tolist()),
+                            map(_MINUTE_TEXTS.__getitem__, (ts % MINUTES_PER_DAY).tolist()))
+                yield ''.join([line % (uid, banner_id, *banners.get(banner_id, no_banner), site_names[site_name],
+                                       time)
+                               for uid, banner_id, site_name, time in zip(ids, banner_ids, batch_site_names, times)])
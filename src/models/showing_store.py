@@ -0,0 +1,131 @@
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+from src.models.showing import *
+
+
+# Interned site names: every site name is stored once and the shows refer to it by an integer id
+class SiteTable:
+    def __init__(self):
+        self._names = []
+        self._ids = {}
+
+    def intern(self, site_name: str) -> int:
+        site_id = self._ids.get(site_name)
+        if site_id is None:
+            site_id = len(self._names)
+            self._names.append(site_name)
+            self._ids[site_name] = site_id
+        return site_id
+
+    def name(self, site_id: int) -> str:
+        return self._names[site_id]
+
+    def __len__(self):
+        return len(self._names)
+
+
+# Site table shared by all show stores of the application
+SITES = SiteTable()
+
+
+# Columnar storage of the loaded shows of one banner (see ShowingEditor).
+# The shows are kept in three parallel NumPy arrays (row ids, show times in minutes, site ids),
+# Showing objects are created only when an element is read through the list-like interface
+class ShowingStore:
+    __slots__ = ('banner_id', '_sites', '_ids', '_ts', '_site_ids', '_size')
+
+    _MIN_CAPACITY = 16
+
+    def __init__(self, banner_id: int = None, showings: Iterable[Showing] = (), sites: SiteTable = SITES):
+        self.banner_id = banner_id
+        self._sites = sites
+        self._ids = np.empty(0, dtype=np.int64)
+        self._ts = np.empty(0, dtype=np.int64)
+        self._site_ids = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self.extend(showings)
+
+    # region Access to the columns of one show without creating a Showing
+    def site_name(self, index: int) -> str:
+        return self._sites.name(self._site_ids[self._check_index(index)])
+
+    def ts(self, index: int) -> int:
+        return int(self._ts[self._check_index(index)])
+
+    # endregion
+
+    # region List-like interface
+    def __len__(self):
+        return self._size
+
+    def __iter__(self) -> Iterator[Showing]:
+        for index in range(self._size):
+            yield self._showing_at(index)
+
+    def __getitem__(self, index: int) -> Showing:
+        return self._showing_at(self._check_index(index))
+
+    def __setitem__(self, index: int, showing: Showing):
+        index = self._check_index(index)
+        self._ids[index] = showing.id
+        self._ts[index] = showing.ts
+        self._site_ids[index] = self._sites.intern(showing.site_name)
+
+    def __delitem__(self, index: int):
+        index = self._check_index(index)
+        for column in (self._ids, self._ts, self._site_ids):
+            column[index:self._size - 1] = column[index + 1:self._size]
+        self._size -= 1
+
+    def insert(self, index: int, showing: Showing):
+        index = min(max(index + self._size if index < 0 else index, 0), self._size)
+        if self._size == len(self._ids):
+            self._grow(self._size + 1)
+        for column in (self._ids, self._ts, self._site_ids):
+            column[index + 1:self._size + 1] = column[index:self._size]
+        self._size += 1
+        self[index] = showing
+
+    def append(self, showing: Showing):
+        self.insert(self._size, showing)
+
+    def extend(self, showings: Iterable[Showing]):
+        showings = list(showings)
+        if self._size + len(showings) > len(self._ids):
+            self._grow(self._size + len(showings))
+        end = self._size + len(showings)
+        self._ids[self._size:end] = [showing.id for showing in showings]
+        self._ts[self._size:end] = [showing.ts for showing in showings]
+        self._site_ids[self._size:end] = [self._sites.intern(showing.site_name) for showing in showings]
+        self._size = end
+
+    def pop(self, index: int = -1) -> Showing:
+        showing = self[index]
+        del self[index]
+        return showing
+
+    # endregion
+
+    def _showing_at(self, index: int) -> Showing:
+        return Showing(int(self._ids[index]), self._sites.name(self._site_ids[index]), int(self._ts[index]),
+                       self.banner_id)
+
+    def _check_index(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('Show index out of range.')
+        return index
+
+    # Doubling the capacity of the columns until it holds min_capacity shows
+    def _grow(self, min_capacity: int):
+        capacity = max(self._MIN_CAPACITY, len(self._ids))
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in ('_ids', '_ts', '_site_ids'):
+            old_column = getattr(self, name)
+            column = np.empty(capacity, dtype=old_column.dtype)
+            column[:self._size] = old_column[:self._size]
+            setattr(self, name, column)
@@ -0,0 +1,104 @@
+from collections.abc import Callable
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object, object)  # task, result
+    failed = pyqtSignal(object, str)  # task, error text
+    done = pyqtSignal(object)  # task, emitted last in any case (also for the cancelled tasks)
+
+
+# Function executed in a thread of the pool.
+# The result is delivered by the signals to the thread that created the task (the GUI thread)
+class Task(QRunnable):
+    def __init__(self, channel: str, description: str, function: Callable, *args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.channel = channel
+        self.description = description
+        self.cancelled = False
+        self.signals = TaskSignals()
+        self._function = function
+        self._args = args
+
+    def run(self):
+        try:
+            if not self.cancelled:
+                self.signals.finished.emit(self, self._function(*self._args))
+        except Exception as ex:
+            self.signals.failed.emit(self, str(ex.args[0]) if ex.args else repr(ex))
+        finally:
+            self.signals.done.emit(self)
+
+
+# Running the long operations outside of the GUI thread.
+# Each task belongs to a channel (for example "forecast"), a new task of the channel cancels the previous one:
+# the previous task is removed from the queue if it has not started, otherwise its result is ignored
+class TaskRunner(QObject):
+    # Descriptions of the running tasks separated by commas, empty string - no tasks are running
+    running_changed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool.globalInstance()
+        # _tasks format - { channel : (task, on_finished, on_failed) }
+        self._tasks = {}
+        # Cancelled tasks that are still running (the references are kept until the tasks end)
+        self._cancelled_tasks = set()
+
+    def run(self, channel: str, description: str, on_finished: Callable, on_failed: Callable,
+            function: Callable, *args):
+        self.cancel(channel)
+        task = Task(channel, description, function, *args)
+        task.signals.finished.connect(self._task_finished)
+        task.signals.failed.connect(self._task_failed)
+        task.signals.done.connect(self._task_done)
+        self._tasks[channel] = (task, on_finished, on_failed)
+        self._pool.start(task)
+        self._emit_running_changed()
+
+    def cancel(self, channel: str):
+        task_info = self._tasks.pop(channel, None)
+        if task_info is None:
+            return
+        task = task_info[0]
+        task.cancelled = True
+        if not self._pool.tryTake(task):
+            self._cancelled_tasks.add(task)
+        self._emit_running_changed()
+
+    def is_running(self, channel: str) -> bool:
+        return channel in self._tasks
+
+    # Waiting for the end of all tasks (used on exit)
+    def wait_all(self):
+        for channel in list(self._tasks):
+            self.cancel(channel)
+        self._pool.waitForDone()
+
+    def _task_finished(self, task: Task, result):
+        on_finished = self._pop_current_task(task, 1)
+        if on_finished is not None:
+            on_finished(result)
+
+    def _task_failed(self, task: Task, error_text: str):
+        on_failed = self._pop_current_task(task, 2)
+        if on_failed is not None:
+            on_failed(error_text)
+
+    def _task_done(self, task: Task):
+        self._cancelled_tasks.discard(task)
+
+    # Removing the finished task if it is still the current task of its channel,
+    # return its handler or None for the cancelled tasks
+    def _pop_current_task(self, task: Task, handler_index: int):
+        task_info = self._tasks.get(task.channel)
+        if task_info is None or task_info[0] is not task:
+            return None
+        del self._tasks[task.channel]
+        self._emit_running_changed()
+        return task_info[handler_index]
+
+    def _emit_running_changed(self):
+        self.running_changed.emit(', '.join(task_info[0].description for task_info in self._tasks.values()))
@@ -0,0 +1,190 @@
+import atexit
+import json
+import os
+import sys
+import threading
+from collections.abc import Callable
+from functools import wraps
+from math import ceil
+from time import perf_counter_ns
+
+# Environment variable with the name of the trace file, tracing is enabled on start if it is set:
+# ADVERTIS_TRACE=trace.json python main.py
+TRACE_ENV_VAR = 'ADVERTIS_TRACE'
+
+# Tracing of the hot paths (database queries, model recalculations, tab switches).
+# The spans are recorded only while tracing is enabled, a disabled span costs one check of a global flag.
+# On exit the spans are written in the Chrome trace-event format (chrome://tracing, https://ui.perfetto.dev)
+# and the summary table (counts and p50 / p95 durations of the spans) is printed to the standard error
+_enabled = False
+_trace_file_name = None
+# Completed spans: (name, category, start in ns, duration in ns, thread id)
+_events = []
+# { thread id : thread name }
+_thread_names = {}
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+# trace_file_name - file for the trace written on exit (None - the trace is only written by write_trace)
+def enable_tracing(trace_file_name: str = None):
+    global _enabled, _trace_file_name
+    if trace_file_name is not None and _trace_file_name is None:
+        atexit.register(_write_on_exit)
+    _trace_file_name = trace_file_name if trace_file_name is not None else _trace_file_name
+    _enabled = True
+
+
+# The recorded spans are kept
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+
+# Disabling tracing in a child process (for example a worker of a process pool started with the environment
+# of the parent), so the trace file of the parent process is not overwritten by the child on exit
+def disable_child_tracing():
+    global _enabled, _trace_file_name
+    _enabled = False
+    _trace_file_name = None
+    clear_trace()
+
+
+def clear_trace():
+    _events.clear()
+    _thread_names.clear()
+
+
+def _record(name: str, category: str, start: int):
+    duration = perf_counter_ns() - start
+    thread_id = threading.get_ident()
+    if thread_id not in _thread_names:
+        _thread_names[thread_id] = threading.current_thread().name
+    _events.append((name, category, start, duration, thread_id))
+
+
+# region Spans
+class _Span:
+    __slots__ = ('_name', '_category', '_start')
+
+    def __init__(self, name: str, category: str):
+        self._name = name
+        self._category = category
+
+    def __enter__(self):
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self._name, self._category, self._start)
+
+
+class _DisabledSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+# Span of a block of code: with span('Loading banners', 'model'): ...
+def span(name: str, category: str = 'app'):
+    return _Span(name, category) if _enabled else _DISABLED_SPAN
+
+
+# Span of every call of the function, the name of the span is the qualified name of the function by default
+def traced(name: str = None, category: str = 'app') -> Callable:
+    def decorator(function: Callable) -> Callable:
+        span_name = name if name is not None else function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(span_name, category, start)
+
+        return wrapper
+
+    return decorator
+
+
+# Tracing the method of one object (for example paintEvent of a widget) if tracing is enabled
+def trace_method(obj, method_name: str, name: str, category: str = 'app'):
+    if _enabled:
+        setattr(obj, method_name, traced(name, category)(getattr(obj, method_name)))
+
+
+# endregion
+
+
+# region Output of the trace
+def write_trace(file_name: str):
+    events = list(_events)
+    origin = min((event[2] for event in events), default=0)
+    # Metadata events with the names of the threads
+    trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+                     'args': {'name': thread_name}} for thread_id, thread_name in list(_thread_names.items())]
+    for name, category, start, duration, thread_id in events:
+        trace_events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread_id,
+                             'ts': (start - origin) / 1000, 'dur': duration / 1000})
+    with open(file_name, 'w') as file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, file)
+
+
+# Nearest-rank percentile of the ordered values
+def _percentile(values: list[int], fraction: float) -> int:
+    return values[max(ceil(fraction * len(values)) - 1, 0)]
+
+
+# Rows (name, category, count, total, p50, p95, max) ordered by the total duration, the durations in ms
+def summary_rows() -> list[tuple]:
+    durations = {}
+    for name, category, _, duration, _ in list(_events):
+        durations.setdefault((name, category), []).append(duration)
+    rows = []
+    for (name, category), values in durations.items():
+        values.sort()
+        rows.append((name, category, len(values), sum(values) / 1e6, _percentile(values, 0.5) / 1e6,
+                     _percentile(values, 0.95) / 1e6, values[-1] / 1e6))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def summary_table() -> str:
+    rows = summary_rows()
+    width = max((len(row[0]) for row in rows), default=4)
+    lines = [f'{"Span":<{width}}  {"Category":<8}  {"Count":>7}  {"Total ms":>10}  {"p50 ms":>9}  {"p95 ms":>9}  '
+             f'{"Max ms":>9}']
+    for name, category, count, total, p50, p95, max_duration in rows:
+        lines.append(f'{name:<{width}}  {category:<8}  {count:>7}  {total:>10.3f}  {p50:>9.3f}  {p95:>9.3f}  '
+                     f'{max_duration:>9.3f}')
+    return '\n'.join(lines)
+
+
+def _write_on_exit():
+    if _trace_file_name is None:
+        return
+    try:
+        write_trace(_trace_file_name)
+    except OSError as ex:
+        print(f'The trace was not written: {ex}', file=sys.stderr)
+        return
+    print(f'Trace written to {_trace_file_name}', file=sys.stderr)
+    print(summary_table(), file=sys.stderr)
+
+
+# endregion
+
+
+if os.environ.get(TRACE_ENV_VAR):
+    enable_tracing(os.environ[TRACE_ENV_VAR])
@@ -0,0 +1,163 @@
+# Batch reports on the promotion of banners without the graphical interface, for example:
+# python report.py completion --db advertisement.db --from 2024-01-01 --to 2024-01-31 --format csv -o completion.csv
+# python report.py totals --format jsonl
+# python report.py forecast --today 2024-02-01 --format jsonl -o forecast.jsonl
+# python report.py banners --company "Company 1" --from 2024-01-01 --to 2024-01-31 -o banners.csv
+# python report.py showings --banner 1 --banner 2 --site website1.com --format jsonl -o showings.jsonl.gz
+# The rows are written as they are calculated, the shows are read by batches (the other reports read only
+# the daily rollup)
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable
+from contextlib import closing, contextmanager
+from datetime import date
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from src.models.promotion_report import *
+from src.models.showing_export import *
+
+REPORT_FIELDS = {'completion': COMPLETION_FIELDS, 'totals': TOTALS_FIELDS, 'forecast': FORECAST_FIELDS,
+                 'banners': BANNER_FIELDS, 'showings': SHOWING_FIELDS}
+# Reports limited by the period of --from and --to
+PERIOD_REPORTS = ('completion', 'banners', 'showings')
+OUTPUT_FORMATS = ('csv', 'jsonl')
+# Compression level of the gzip output (the fastest one, the exports are large)
+GZIP_COMPRESS_LEVEL = 1
+
+
+# The rows of the completion and forecast reports are calculated lazily, so the span includes their calculation
+@traced(category='report')
+def write_rows(rows: Iterable[dict], fields: tuple, file, output_format: str):
+    if output_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False))
+            file.write('\n')
+
+
+# The blocks of the shows are read and formatted lazily, so the span includes the reading
+@traced(category='report')
+def write_blocks(blocks: Iterable[str], file):
+    for block in blocks:
+        file.write(block)
+
+
+# Filter of the banners and the shows of the report by the options (None - the report is not filtered)
+def showing_filter_of(args) -> ShowingFilter:
+    if args.banners is None and args.company is None and args.site is None and args.report != 'showings':
+        return None
+    return ShowingFilter(args.banners, args.company, args.site,
+                         iso_to_day(args.date_from) * MINUTES_PER_DAY if args.date_from else None,
+                         (iso_to_day(args.date_to) + 1) * MINUTES_PER_DAY - 1 if args.date_to else None)
+
+
+def report_rows(driver: AdvertisDriver, args) -> Iterable[dict]:
+    first_day = iso_to_day(args.date_from) if args.date_from else None
+    last_day = iso_to_day(args.date_to) if args.date_to else None
+    if args.report == 'completion':
+        return completion_rows(iter_report_banners(driver, showing_filter_of(args)), first_day, last_day)
+    if args.report == 'banners':
+        return banner_completion_rows(iter_report_banners(driver, showing_filter_of(args)), first_day, last_day)
+    if args.report == 'totals':
+        return [totals_row(iter_report_banners(driver, showing_filter_of(args)))]
+    return forecast_rows(driver, iso_to_day(args.today), args.block_size)
+
+
+def write_report(driver: AdvertisDriver, args, file):
+    if args.report == 'showings':
+        write_blocks(export_showing_blocks(driver, args.format, showing_filter_of(args)), file)
+    else:
+        write_rows(report_rows(driver, args), REPORT_FIELDS[args.report], file, args.format)
+
+
+# Text file of the report: the file or the standard output (None), compressed by gzip if compress is True
+@contextmanager
+def open_output(file_name: str, compress: bool):
+    if file_name is None and not compress:
+        yield sys.stdout
+    elif file_name is None:
+        with gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb', compresslevel=GZIP_COMPRESS_LEVEL) as binary:
+            with io.TextIOWrapper(binary, encoding='utf-8', newline='') as file:
+                yield file
+    elif compress:
+        with gzip.open(file_name, 'wt', compresslevel=GZIP_COMPRESS_LEVEL, encoding='utf-8', newline='') as file:
+            yield file
+    else:
+        with open(file_name, 'w', newline='', encoding='utf-8') as file:
+            yield file
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Reports on the promotion of banners (CSV or JSON lines).')
+    parser.add_argument('report', choices=REPORT_FIELDS,
+                        help='completion - daily and all-time completion of the min number of shows per banner, '
+                             'totals - all-time totals of all banners, forecast - forecast of the shows per banner, '
+                             'banners - completion of the min number of shows per banner within the period, '
+                             'showings - the shows')
+    parser.add_argument('--db', default=DEFAULT_DB_FILE_NAME, help='database file (default: the application database)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help='output format')
+    parser.add_argument('-o', '--output', default=None, help='output file (default: standard output)')
+    parser.add_argument('--gzip', action='store_true',
+                        help='compress the output by gzip (always done for the output files ending with .gz)')
+    parser.add_argument('--from', dest='date_from', default=None,
+                        help='first day of the completion, banners and showings reports, YYYY-MM-DD '
+                             '(default: first day of banner action)')
+    parser.add_argument('--to', dest='date_to', default=None,
+                        help='last day of the completion, banners and showings reports, YYYY-MM-DD '
+                             '(default: last day of banner action)')
+    parser.add_argument('--banner', dest='banners', type=int, action='append', default=None,
+                        help='only the banner with the id (the option may be repeated)')
+    parser.add_argument('--company', default=None, help='only the banners of the company')
+    parser.add_argument('--site', default=None, help='only the shows on the site')
+    parser.add_argument('--today', default=None, help='first day of the forecast, YYYY-MM-DD (default: today)')
+    parser.add_argument('--block-size', type=int, default=None,
+                        help=f'number of banners whose forecast is calculated at once (default: {FORECAST_BLOCK_SIZE})')
+    args = parser.parse_args(args)
+    if args.report == 'forecast' and (args.banners is not None or args.company is not None or args.site is not None):
+        parser.error('the forecast report has no filters')
+    if args.report not in PERIOD_REPORTS and (args.date_from is not None or args.date_to is not None):
+        parser.error(f'the {args.report} report has no period (--from, --to)')
+    if args.report != 'forecast' and (args.today is not None or args.block_size is not None):
+        parser.error('--today and --block-size are options of the forecast report')
+    for option, value in (('--from', args.date_from), ('--to', args.date_to), ('--today', args.today)):
+        if value is not None:
+            try:
+                iso_to_day(value)
+            except ValueError:
+                parser.error(f'{option}: the date must be YYYY-MM-DD, not {value!r}')
+    if (args.date_from is not None and args.date_to is not None
+            and iso_to_day(args.date_from) > iso_to_day(args.date_to)):
+        parser.error('--from is later than --to')
+    if args.block_size is not None and args.block_size <= 0:
+        parser.error('--block-size must be positive')
+    args.today = args.today if args.today is not None else date.today().isoformat()
+    args.block_size = args.block_size if args.block_size is not None else FORECAST_BLOCK_SIZE
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    compress = args.gzip or (args.output is not None and args.output.endswith('.gz'))
+    with closing(AdvertisDriver(args.db)) as driver:
+        try:
+            with open_output(args.output, compress) as file:
+                write_report(driver, args, file)
+        except BrokenPipeError:
+            if args.output is not None:
+                raise
+            # The reader of the output was closed (for example "| head"), the rest of the report is not needed
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import datetime, time
 from PyQt5 import QtGui
-from PyQt5.QtCore import QModelIndex
-from PyQt5.QtWidgets import QApplication, QTableView
+from PyQt5.QtCore import QDate, QDateTime, QModelIndex, Qt
+from PyQt5.QtWidgets import QApplication, QProgressBar, QTableView
 from PyQt5 import uic
 import sys
 import pyqtgraph as pg
@@ -10,6 +10,7 @@ sys.path.insert(0, '..')
 
 from src.models.forecaster import Forecaster
 from src.models.promotion_analyzer import PromotionAnalyser
+from src.models.task_runner import TaskRunner
 from src.views.message_box import *
 from src.models.banner_editor import *
 
@@ -22,16 +23,22 @@ class FormMode(Enum):
 
 
 class MainWnd:
-    def __init__(self):
+    # flush_interval - interval in seconds between an edit and writing the edits to the database
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
         form, window = uic.loadUiType(join(dirname(__file__), 'ui_main_window.ui'))
         self._app = QApplication(sys.argv)
         self._window = window()
         self._form = form()
-        self._banner_editor = BannerEditor()
+        self._banner_editor = BannerEditor(load_from_db=False, flush_interval=flush_interval)
         self._pr_analyser = PromotionAnalyser()
         self._forecaster = Forecaster()
+        self._tasks = TaskRunner()
+        # Range of dates (min, max) formatted in the calendar
+        self._calendar_range = None
         self._banner_form_mode = FormMode.default
         self._impression_form_mode = FormMode.block_all
+        # Error of the last flush of the edits while the window is closed, None - the window is not closed
+        self._close_flush_error = None
         self._window.setWindowIcon(QtGui.QIcon(join(dirname(__file__), '../images/icon_ad.png')))
 
     # region Setting up tables
@@ -53,6 +60,9 @@ class MainWnd:
         self._form.tableview_showings.setSelectionBehavior(QTableView.SelectRows)
         self._form.tableview_showings.setColumnWidth(0, 220)
         self._form.tableview_showings.setColumnWidth(1, 210)
+        # Sorting by the header is done by the model (in the database), the shows are ordered by time at first
+        self._form.tableview_showings.horizontalHeader().setSortIndicator(1, Qt.AscendingOrder)
+        self._form.tableview_showings.setSortingEnabled(True)
 
     def _set_tableview_pr_analyse(self):
         self._form.tableview_pr_banners.setModel(self._pr_analyser)
@@ -78,6 +88,9 @@ class MainWnd:
         self._set_events_impression_buttons()
         self._form.combobox_sort_by.currentIndexChanged.connect(self._sort_by_changed)
         self._set_events_pr_analyser()
+        self._set_events_forecaster()
+        self._banner_editor.edit_queue.flush_failed.connect(self._edits_flush_failed)
+        self._window.closeEvent = self._window_closing
 
     def _set_events_tables(self):
         self._last_selected_banner = -1
@@ -103,27 +116,46 @@ class MainWnd:
 
     def _set_events_pr_analyser(self):
         self._form.calendar_widget.clicked.connect(self._calendar_clicked)
+        self._banner_editor.banner_changed.connect(self._pr_analyser.update_banner)
+        self._banner_editor.banner_removed.connect(self._pr_analyser.remove_banner)
+        self._banner_editor.showings_changed.connect(self._pr_analyser.update_showings_count)
+
+    # The cached statistics of the forecaster are reset when the shows change
+    def _set_events_forecaster(self):
+        self._banner_editor.banners_reloaded.connect(lambda *args: self._forecaster.invalidate_week_profile())
+        self._banner_editor.banner_removed.connect(lambda *args: self._forecaster.invalidate_week_profile())
+        self._banner_editor.showings_changed.connect(lambda *args: self._forecaster.invalidate_week_profile())
 
     # Switching to the banner overview tab
+    @traced(category='qt')
     def _switching_to_banners_overview(self):
+        self._tasks.cancel('forecast')
+        self._banner_editor.edit_queue.flush()
         self._form.stackedWidget.setCurrentWidget(self._form.banners_overview)
         self._form.stackedWidget_2.setCurrentWidget(self._form.banners_editor)
 
     # Switching to the tab of viewing the records of banner shows
+    @traced(category='qt')
     def _switching_to_shows_overview(self):
+        self._tasks.cancel('forecast')
+        self._banner_editor.edit_queue.flush()
         self._form.stackedWidget.setCurrentWidget(self._form.banners_overview)
         self._form.stackedWidget_2.setCurrentWidget(self._form.showings_editor)
 
     # Switching to the tab for analyzing the results of advertising services promotion
+    @traced(category='qt')
     def _switching_to_promotion_results(self):
+        self._tasks.cancel('forecast')
+        self._banner_editor.edit_queue.flush()
         self._form.stackedWidget.setCurrentWidget(self._form.banners_analisys)
-        self._pr_analyser.set_banners(self._banner_editor.get_banners())
-        min = QDate(self._pr_analyser.get_min_date())
+        min = day_to_date(self._pr_analyser.get_min_date())
         max = QDate().currentDate().addDays(-1)
         self._form.calendar_widget.setDateRange(min, max)
-        while min.daysTo(max) >= 0:
-            self._form.calendar_widget.setDateTextFormat(min, self._blocked_format)
-            min = min.addDays(1)
+        if self._calendar_range != (min, max):
+            self._calendar_range = (QDate(min), QDate(max))
+            while min.daysTo(max) >= 0:
+                self._form.calendar_widget.setDateTextFormat(min, self._blocked_format)
+                min = min.addDays(1)
         self._fill_alltime_data()
 
     # Initializing the format for active calendar dates
@@ -134,15 +166,25 @@ class MainWnd:
         self._blocked_format.setFont(font)
 
     # Switching to the tab for forecasting
+    @traced(category='qt')
     def _switching_to_forecasting(self):
+        self._banner_editor.edit_queue.flush()
         self._form.stackedWidget.setCurrentWidget(self._form.banners_forecasting)
-        self._forecaster.set_banners(self._banner_editor.get_banners())
+        self._tasks.run('forecast', 'Calculating the forecast', self._forecaster.set_forecast,
+                        lambda error_text: show_error_messagebox("Forecast error.", error_text),
+                        self._forecaster.calc_forecast,
+                        *self._forecaster.forecast_arguments(self._banner_editor.get_banners()))
 
     # Setting events for the form for banner show records
     def _set_events_impression_buttons(self):
         self._form.button_save_changes_showing.clicked.connect(self._save_show_changes)
         self._form.button_delete_showing.clicked.connect(self._delete_show)
         self._form.button_new_showing.clicked.connect(self._change_form_for_new_show)
+        self._form.checkbox_time_filter.toggled.connect(self._form.datetime_filter_from.setEnabled)
+        self._form.checkbox_time_filter.toggled.connect(self._form.datetime_filter_to.setEnabled)
+        self._form.button_apply_showing_filter.clicked.connect(self._apply_showing_filter)
+        self._form.site_filter_input.returnPressed.connect(self._apply_showing_filter)
+        self._banner_editor.showing_editor.modelReset.connect(self._showings_reloaded)
 
     # endregion
 
@@ -175,8 +217,6 @@ class MainWnd:
             self._fill_banner_form()
             self._fill_showing_form()
             self._banner_editor.clear_showing_editor_data()
-
-            self._banner_editor.sort_banners()
         except Exception as ex:
             show_error_messagebox("Error of banner saving.", ex.args[0])
 
@@ -233,7 +273,6 @@ class MainWnd:
             self._impression_form_mode = FormMode.default
             self._set_showing_form_widgets()
             self._fill_showing_form()
-            self._banner_editor.showing_editor.layoutChanged.emit()
         except Exception as ex:
             show_error_messagebox("Error of saving banner show record.", ex.args[0])
 
@@ -242,32 +281,112 @@ class MainWnd:
         self._banner_editor.delete_showing(self._last_selected_banner, self._last_selected_showing)
         self._fill_showing_form()
         self._set_showing_form_widgets()
-        self._banner_editor.showing_editor.layoutChanged.emit()
+
+    # Filtering the shows of the selected banner by the site and the time range (the rows are loaded again)
+    def _apply_showing_filter(self):
+        ts_from = ts_to = None
+        if self._form.checkbox_time_filter.isChecked():
+            ts_from = datetime_to_minutes(self._form.datetime_filter_from.dateTime())
+            ts_to = datetime_to_minutes(self._form.datetime_filter_to.dateTime())
+        self._banner_editor.showing_editor.set_filter(self._form.site_filter_input.text(), ts_from, ts_to)
+
+    # The selected row of the shows is not valid after the shows were loaded again (sorted or filtered)
+    def _showings_reloaded(self):
+        if self._impression_form_mode == FormMode.editing:
+            self._impression_form_mode = FormMode.default
+            self._set_showing_form_widgets()
+            self._fill_showing_form()
 
     # Changing the form for getting data about new show
     def _change_form_for_new_show(self):
         self._fill_showing_form()
         self._impression_form_mode = FormMode.adding
         self._set_showing_form_widgets()
-        self._banner_editor.showing_editor.layoutChanged.emit()
 
     # Random data generation
     def _generate_random_data(self):
-        try:
-            self._impression_form_mode = FormMode.block_all
-            self._set_showing_form_widgets()
-            self._banner_form_mode = FormMode.default
-            self._set_banner_form_default()
-            self._banner_editor.gen_rand_data()
-            show_success_messagebox("Data generated successfully.")
-        except Exception as ex:
-            show_error_messagebox("Data generation error.", ex.args[0])
+        self._impression_form_mode = FormMode.block_all
+        self._set_showing_form_widgets()
+        self._banner_form_mode = FormMode.default
+        self._set_banner_form_default()
+        self._start_loading_banners('Generating random data', BannerEditor.generate_rand_banners,
+                                    self._random_data_generated, "Data generation error.")
+
+    def _random_data_generated(self, result):
+        self._banners_loaded(result)
+        show_success_messagebox("Data generated successfully.")
+
+    # endregion
+
+    # region Loading the banners outside of the GUI thread
+    def _load_banners(self):
+        self._start_loading_banners('Loading banners', BannerEditor.load_banners,
+                                    self._banners_loaded, "Error of loading banners.")
+
+    # The banners and the index of the promotion analyser are built by a task of the thread pool,
+    # the form is blocked until the task ends
+    def _start_loading_banners(self, description: str, load_function, on_loaded, error_text: str):
+        self._form.centralwidget.setEnabled(False)
+        # The banners are read by another connection, the edits that cannot be written are replaced
+        # by the loaded banners (the user is told about it)
+        if not self._banner_editor.edit_queue.flush():
+            self._banner_editor.edit_queue.discard()
+            show_error_messagebox("The unsaved changes were discarded.",
+                                  "The banners and shows are loaded from the database again.")
+        self._banner_editor.clear_showing_editor_data()
+        self._tasks.cancel('forecast')
+        self._tasks.run('banners', description, on_loaded,
+                        lambda more_info: self._banners_loading_failed(error_text, more_info),
+                        self._load_banners_task, load_function, self._banner_editor.get_db_file_name())
+
+    # The task opens its own connection to the database of the banner editor
+    @staticmethod
+    def _load_banners_task(load_function, db_file_name: str):
+        banners, aggregates = load_function(db_file_name)
+        return banners, aggregates, PromotionAnalyser.build_date_index(banners, aggregates)
+
+    def _banners_loaded(self, result):
+        banners, aggregates, date_index = result
+        self._pr_analyser.set_banners(banners, date_index, aggregates)
+        self._banner_editor.set_banners(banners, aggregates)
+        # After set_banners, which resets the statistics of the forecaster
+        self._forecaster.set_aggregates(aggregates)
+        self._form.centralwidget.setEnabled(True)
+
+    def _banners_loading_failed(self, error_text: str, more_info: str):
+        self._form.centralwidget.setEnabled(True)
+        show_error_messagebox(error_text, more_info)
+
+    # The edits are kept by the queue and written by the next flush
+    def _edits_flush_failed(self, error_text: str):
+        if self._close_flush_error is not None:
+            self._close_flush_error = error_text
+            return
+        show_error_messagebox("Error of saving the changes (they are kept and saved with the next changes).",
+                              error_text)
+
+    # Showing the running background tasks in the status bar
+    def _set_progress_indicator(self):
+        self._progress_bar = QProgressBar()
+        self._progress_bar.setRange(0, 0)
+        self._progress_bar.setMaximumWidth(200)
+        self._progress_bar.hide()
+        self._form.statusbar.addPermanentWidget(self._progress_bar)
+        self._tasks.running_changed.connect(self._show_running_tasks)
+
+    def _show_running_tasks(self, descriptions: str):
+        if descriptions:
+            self._form.statusbar.showMessage(f'{descriptions}...')
+            self._progress_bar.show()
+        else:
+            self._form.statusbar.clearMessage()
+            self._progress_bar.hide()
 
     # endregion
 
     # region Tab events to analyze the results of advertising promotion
     def _calendar_clicked(self):
-        self._pr_analyser.set_banners_to_display(self._form.calendar_widget.selectedDate())
+        self._pr_analyser.set_banners_to_display(date_to_day(self._form.calendar_widget.selectedDate()))
 
     def _pr_table_clicked(self, clicked_index: QModelIndex):
         if self._last_selected_pr_ban != clicked_index.row:
@@ -282,8 +401,8 @@ class MainWnd:
             self._form.graphicview.clear()
             dates, showings, min_sh, max_sh = self._forecaster.get_forecast_for_banner(clicked_index.row())
             timestamps = []
-            for date in dates:
-                timestamps.append(datetime(date.year(), date.month(), date.day()).timestamp())
+            for day in dates:
+                timestamps.append(datetime.combine(day_to_py_date(day), time()).timestamp())
             self._form.graphicview.plot(timestamps, min_sh, symbol='o', pen=pg.mkPen('r', width=4),
                                         name='Minimal number of shows per day')
             self._form.graphicview.plot(timestamps, max_sh, symbol='o', pen=pg.mkPen('g', width=4),
@@ -299,8 +418,8 @@ class MainWnd:
         banner = BannerShortData(
             self._form.bname_input.text(),
             self._form.bcomp_name_input.text(),
-            self._form.date_start_edit.date(),
-            self._form.date_end_edit.date(),
+            date_to_day(self._form.date_start_edit.date()),
+            date_to_day(self._form.date_end_edit.date()),
             self._form.spin_box_min_showings.value(),
             self._form.spin_box_max_showings.value())
         return banner
@@ -335,14 +454,14 @@ class MainWnd:
         self._form.button_new_banner.setEnabled(True)
         self._set_enabled_banner_form(False)
 
-    # Loading banner data into the form
-    def _fill_banner_form(self, banner=BannerShortData('', '', QDate(), QDate(), 0, 0)):
-        self._form.bname_input.setText(banner.name)
-        self._form.bcomp_name_input.setText(banner.company_name)
-        self._form.date_start_edit.setDate(banner.date_start)
-        self._form.date_end_edit.setDate(banner.date_end)
-        self._form.spin_box_min_showings.setValue(banner.min_showings)
-        self._form.spin_box_max_showings.setValue(banner.max_showings)
+    # Loading banner data into the form (None - clearing the form, the dates are not changed)
+    def _fill_banner_form(self, banner: BannerShortData = None):
+        self._form.bname_input.setText(banner.name if banner else '')
+        self._form.bcomp_name_input.setText(banner.company_name if banner else '')
+        self._form.date_start_edit.setDate(day_to_date(banner.date_start) if banner else QDate())
+        self._form.date_end_edit.setDate(day_to_date(banner.date_end) if banner else QDate())
+        self._form.spin_box_min_showings.setValue(banner.min_showings if banner else 0)
+        self._form.spin_box_max_showings.setValue(banner.max_showings if banner else 0)
 
     # Blocking and unblocking the form elements for banners
     def _set_enabled_banner_form(self, is_enabled: bool):
@@ -360,7 +479,7 @@ class MainWnd:
     def _showing_from_form(self) -> ShowingShortData:
         showing = ShowingShortData(
             self._form.site_name_input.text(),
-            self._form.datetime_edit.dateTime())
+            datetime_to_minutes(self._form.datetime_edit.dateTime()))
         return showing
 
     # Setting form for record show of a banner
@@ -402,10 +521,10 @@ class MainWnd:
         self._form.button_new_showing.setEnabled(True)
         self._set_enabled_showing_form(False)
 
-    # Loading show data into the form
-    def _fill_showing_form(self, showing=ShowingShortData()):
-        self._form.site_name_input.setText(showing.site_name)
-        self._form.datetime_edit.setDateTime(showing.datetime)
+    # Loading show data into the form (None - clearing the form, the time is not changed)
+    def _fill_showing_form(self, showing: ShowingShortData = None):
+        self._form.site_name_input.setText(showing.site_name if showing else '')
+        self._form.datetime_edit.setDateTime(minutes_to_datetime(showing.ts) if showing else QDateTime())
 
     # Blocking and unblocking the form elements for showings
     def _set_enabled_showing_form(self, is_enabled: bool):
@@ -416,7 +535,8 @@ class MainWnd:
 
     # region Interaction with forms to analyze the results of advertising promotion
     def _fill_ban_form_for_date(self, banner_index: int):
-        banner_pr_data = self._pr_analyser.get_banner_info(banner_index, self._form.calendar_widget.selectedDate())
+        banner_pr_data = self._pr_analyser.get_banner_info(banner_index,
+                                                           date_to_day(self._form.calendar_widget.selectedDate()))
         self._form.line_bname.setText(banner_pr_data.name)
         self._form.line_bcomp_name.setText(banner_pr_data.company_name)
         self._form.label_min_sh_now.setText(f'Min number of shows: {banner_pr_data.min_sh_today}')
@@ -453,6 +573,12 @@ class MainWnd:
         self._form.graphicview.setLabel(axis='left', text='Number of shows')
         self._form.graphicview.setBackground('w')
 
+    # Painting of the tables and the graph is traced only if tracing is enabled
+    def _trace_painting(self):
+        for widget in (self._form.tableview_banners, self._form.tableview_showings, self._form.tableview_pr_banners,
+                       self._form.tableview_forecast, self._form.graphicview):
+            trace_method(widget, 'paintEvent', f'{widget.objectName()}.paintEvent', 'qt')
+
     def run(self):
         self._form.setupUi(self._window)
 
@@ -462,6 +588,28 @@ class MainWnd:
         self._set_events()
         self._set_tableviews()
         self._set_enabled_dates_format()
+        self._set_progress_indicator()
+        self._trace_painting()
 
         self._window.show()
+        self._load_banners()
         self._app.exec_()
+        self._tasks.wait_all()
+        self._banner_editor.close()
+
+    # The queued edits are written while the window still exists. If they cannot be written, the user
+    # retries, discards them or cancels the closing of the window
+    def _window_closing(self, event):
+        edit_queue = self._banner_editor.edit_queue
+        self._close_flush_error = ''
+        try:
+            while not edit_queue.flush():
+                answer = ask_retry_messagebox("Error of saving the changes.", self._close_flush_error)
+                if answer == QMessageBox.Discard:
+                    edit_queue.discard()
+                elif answer == QMessageBox.Cancel:
+                    event.ignore()
+                    return
+        finally:
+            self._close_flush_error = None
+        event.accept()
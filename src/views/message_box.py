@@ -16,3 +16,15 @@ def show_success_messagebox(msg_text: str):
     msg.setText(msg_text)
     msg.setWindowTitle("Executed successfully")
     msg.exec_()
+
+
+# Question on an error that can be retried, return QMessageBox.Retry, QMessageBox.Discard or QMessageBox.Cancel
+def ask_retry_messagebox(error_text: str, more_info: str) -> int:
+    msg = QMessageBox()
+    msg.setIcon(QMessageBox.Warning)
+    msg.setText(error_text)
+    msg.setInformativeText(more_info)
+    msg.setWindowTitle("Error")
+    msg.setStandardButtons(QMessageBox.Retry | QMessageBox.Discard | QMessageBox.Cancel)
+    msg.setDefaultButton(QMessageBox.Retry)
+    return msg.exec_()
@@ -0,0 +1,28 @@
+import os
+import sys
+from contextlib import closing
+from os.path import abspath, dirname, join
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, join(dirname(abspath(__file__)), '..'))
+
+from src.drivers.advertis_driver import *
+
+
+# Banner acting from 10 days ago to 10 days later with up to 5 shows per day
+def make_banner(name: str = 'Banner 1', max_showings: int = 5) -> BannerShortData:
+    current_day = today()
+    return BannerShortData(name, 'Company 1', current_day - 10, current_day + 10, 1, max_showings)
+
+
+@pytest.fixture
+def db_file_name(tmp_path) -> str:
+    return str(tmp_path / 'advertisement.db')
+
+
+@pytest.fixture
+def driver(db_file_name: str) -> AdvertisDriver:
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        yield driver
@@ -0,0 +1,135 @@
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+from os.path import abspath, dirname, join
+
+import pytest
+
+from conftest import make_banner
+from src.drivers.advertis_driver import *
+
+
+def count_rows(driver: AdvertisDriver, table_name: str) -> int:
+    return driver._read_con.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+
+
+def test_batch_commits_bulk_inserts_and_table_creation_together(driver: AdvertisDriver):
+    with driver.batch():
+        banner_id = driver.insert_banner(make_banner())
+        driver.create_showings_table()
+        driver.insert_showing_rows([('site.com', today() * MINUTES_PER_DAY, banner_id)] * 3)
+        driver.rebuild_daily_showings()
+        # Nothing is committed before the end of the batch
+        assert count_rows(driver, 'showings') == 0
+    assert count_rows(driver, 'showings') == 3
+    assert driver.get_daily_showings() == {banner_id: {today(): 3}}
+
+
+def test_failed_batch_rolls_back_bulk_inserts(driver: AdvertisDriver):
+    with pytest.raises(RuntimeError):
+        with driver.batch():
+            banner_id = driver.insert_banner(make_banner())
+            driver.insert_showing_rows([('site.com', today() * MINUTES_PER_DAY, banner_id)])
+            with driver.batch():
+                driver.delete_showing(1)
+            raise RuntimeError
+    assert count_rows(driver, 'banners') == 0
+    assert count_rows(driver, 'showings') == 0
+    assert not driver._con.in_transaction
+
+
+def test_bulk_insert_keeps_the_rollups_up_to_date(driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    counters = dict(driver.iter_banner_changes())
+    day = today()
+    driver.insert_showing_rows([('a.com', day * MINUTES_PER_DAY, banner_id), ('b.com', day * MINUTES_PER_DAY + 5, banner_id)])
+    driver.insert_counted_showing_rows([('c.com', (day - 1) * MINUTES_PER_DAY, banner_id)], [(banner_id, day - 1, 1)])
+    assert driver.get_daily_showings_for_banner(banner_id) == {day - 1: 1, day: 2}
+    assert dict(driver.iter_banner_changes())[banner_id] > counters[banner_id]
+    # The rows inserted one by one are counted by the triggers again
+    driver.insert_showing(ShowingShortData('d.com', day * MINUTES_PER_DAY), banner_id)
+    assert driver.count_showings_for_day(banner_id, day) == 3
+
+
+def test_rollup_counts_the_shows_of_other_connections(db_file_name: str, driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    other = sqlite3.connect(db_file_name)
+    other.execute("INSERT INTO showings (site_name, ts, banner_id) VALUES ('other.com', ?, ?)",
+                  (today() * MINUTES_PER_DAY, banner_id))
+    other.commit()
+    other.close()
+    assert driver.count_showings_for_day(banner_id, today()) == 1
+
+
+def test_bulk_insert_does_not_change_the_schema(driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    schema_version = driver._read_con.execute("PRAGMA schema_version").fetchone()[0]
+    driver.insert_showing_rows([('a.com', today() * MINUTES_PER_DAY, banner_id)])
+    driver.insert_showing_rows([('b.com', today() * MINUTES_PER_DAY, banner_id)], rebuild_rollup=True)
+    driver.insert_counted_showing_rows([('c.com', today() * MINUTES_PER_DAY, banner_id)], [(banner_id, today(), 1)])
+    assert driver._read_con.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+    assert driver.count_showings_for_day(banner_id, today()) == 3
+
+
+def test_interrupted_bulk_insert_keeps_the_triggers(db_file_name: str, driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    # The process stops in the middle of the insert, after the triggers were suspended
+    code = f"""
+import os, sys
+sys.path.insert(0, {join(dirname(abspath(__file__)), '..')!r})
+from src.drivers.advertis_driver import *
+
+def rows():
+    for index in range(100):
+        if index == 50:
+            os._exit(1)
+        yield 'killed.com', {today() * MINUTES_PER_DAY}, {banner_id}
+
+AdvertisDriver({db_file_name!r}).insert_counted_showing_rows(rows(), [], chunk_size=10)
+"""
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 1
+    assert driver._read_con.execute("SELECT COUNT(*) FROM suspended_triggers").fetchone()[0] == 0
+    insert_other = sqlite3.connect(db_file_name)
+    insert_other.execute("INSERT INTO showings (site_name, ts, banner_id) VALUES ('other.com', ?, ?)",
+                         (today() * MINUTES_PER_DAY, banner_id))
+    insert_other.commit()
+    insert_other.close()
+    assert driver.get_daily_showings_for_banner(banner_id) == {today(): 1}
+
+
+def test_migration_of_the_text_show_times(db_file_name: str):
+    # Database of the first schema: the show times are "dd.MM.yyyy hh:mm" texts, user_version is 0
+    banner = make_banner()
+    old = sqlite3.connect(db_file_name)
+    old.executescript("""
+        CREATE TABLE "banners"("id" INTEGER NOT NULL UNIQUE, "name" TEXT NOT NULL, "company_name" TEXT NOT NULL,
+                               "date_start" TEXT NOT NULL, "date_end" TEXT NOT NULL, "min_showings" INTEGER NOT NULL,
+                               "max_showings" INTEGER NOT NULL, PRIMARY KEY("id" AUTOINCREMENT));
+        CREATE TABLE "showings"("id" INTEGER NOT NULL UNIQUE, "site_name" TEXT NOT NULL, "datetime" TEXT NOT NULL,
+                                "banner_id" INTEGER NOT NULL, PRIMARY KEY("id" AUTOINCREMENT));
+        """)
+    old.execute("""INSERT INTO banners (name, company_name, date_start, date_end, min_showings, max_showings)
+                VALUES (?, ?, ?, ?, ?, ?)""", (banner.name, banner.company_name, banner.date_start_str(),
+                                               banner.date_end_str(), banner.min_showings, banner.max_showings))
+    old.executemany("INSERT INTO showings (id, site_name, datetime, banner_id) VALUES (?, ?, ?, 1)",
+                    [(1, 'a.com', '15.01.2024 10:30'), (2, 'b.com', '15.01.2024 23:59'),
+                     (5, 'c.com', '16.01.2024 00:00'), (7, 'deleted.com', '16.01.2024 00:00')])
+    old.execute("DELETE FROM showings WHERE id = 7")
+    old.commit()
+    old.close()
+
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        day = iso_to_day('2024-01-15')
+        assert driver._read_con.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert driver.get_showings_for_banner(1) == [
+            Showing(1, 'a.com', day * MINUTES_PER_DAY + 10 * 60 + 30, 1),
+            Showing(2, 'b.com', day * MINUTES_PER_DAY + 23 * 60 + 59, 1),
+            Showing(5, 'c.com', (day + 1) * MINUTES_PER_DAY, 1)]
+        assert driver.get_daily_showings() == {1: {day: 2, day + 1: 1}}
+        # The ids of the deleted shows are not reused
+        assert driver.insert_showing(ShowingShortData('d.com', day * MINUTES_PER_DAY), 1) == 8
+        assert driver.get_daily_showings_for_banner(1) == {day: 3, day + 1: 1}
+    # The migrated database is opened without migrations
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        assert len(driver.get_showings_for_banner(1)) == 4
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import fields, replace
+
+from conftest import make_banner
+from src.drivers.aggregate_cache import *
+
+
+def assert_same_aggregates(aggregates: Aggregates, expected: Aggregates):
+    for array_field in fields(Aggregates):
+        assert np.array_equal(getattr(aggregates, array_field.name), getattr(expected, array_field.name)), \
+            array_field.name
+
+
+# Aggregates built from the database only (the cache of another directory is empty)
+def rebuilt_aggregates(driver: AdvertisDriver, tmp_path) -> Aggregates:
+    with driver.read_transaction():
+        return load_aggregates(driver, str(tmp_path / f'rebuilt_{len(os.listdir(tmp_path))}'))
+
+
+def insert_banners_with_showings(driver: AdvertisDriver) -> list[int]:
+    banner_ids = [driver.insert_banner(make_banner(f'Banner {number}')) for number in range(3)]
+    driver.insert_showing_rows([('a.com', (today() - day) * MINUTES_PER_DAY + banner_id, banner_id)
+                                for banner_id in banner_ids for day in range(banner_id + 1)])
+    return banner_ids
+
+
+def test_unchanged_database_is_read_from_the_cache(tmp_path, driver: AdvertisDriver):
+    insert_banners_with_showings(driver)
+    first = load_banners_with_aggregates(driver)[1]
+    assert os.path.exists(join(aggregates_dir(driver.get_db_file_name()), 'key.npy'))
+    second = load_banners_with_aggregates(driver)[1]
+    assert isinstance(second.days, np.memmap)
+    assert_same_aggregates(second, first)
+    assert_same_aggregates(second, rebuilt_aggregates(driver, tmp_path))
+
+
+def test_changes_of_other_connections_invalidate_the_changed_banners(tmp_path, db_file_name: str,
+                                                                     driver: AdvertisDriver):
+    banner_ids = insert_banners_with_showings(driver)
+    load_banners_with_aggregates(driver)
+    other = sqlite3.connect(db_file_name)
+    other.execute("INSERT INTO showings (site_name, ts, banner_id) VALUES ('other.com', ?, ?)",
+                  ((today() - 5) * MINUTES_PER_DAY, banner_ids[0]))
+    other.execute("DELETE FROM showings WHERE banner_id = ?", (banner_ids[2],))
+    other.commit()
+    other.close()
+    banners, aggregates = load_banners_with_aggregates(driver)
+    assert banners[0].day_counts == {today() - 5: 1, today() - 1: 1, today(): 1}
+    assert banners[1].day_counts == {today() - 2: 1, today() - 1: 1, today(): 1}
+    assert banners[2].day_counts == {}
+    assert_same_aggregates(aggregates, rebuilt_aggregates(driver, tmp_path))
+
+
+def test_changed_and_deleted_banners_invalidate_the_cache(tmp_path, driver: AdvertisDriver):
+    banner_ids = insert_banners_with_showings(driver)
+    banners = load_banners_with_aggregates(driver)[0]
+    driver.update_banner(replace(banners[1], date_start=today() - 20))
+    driver.delete_banner(banner_ids[0])
+    new_id = driver.insert_banner(make_banner('Banner 4'))
+    banners, aggregates = load_banners_with_aggregates(driver)
+    assert [banner.id for banner in banners] == [banner_ids[1], banner_ids[2], new_id]
+    assert banners[0].date_start == today() - 20
+    assert_same_aggregates(aggregates, rebuilt_aggregates(driver, tmp_path))
+
+
+def test_cache_of_a_replaced_database_is_not_used(tmp_path, db_file_name: str):
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        insert_banners_with_showings(driver)
+        load_banners_with_aggregates(driver)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file_name + suffix):
+            os.remove(db_file_name + suffix)
+    # The new database has the same banner ids and change counters, but other shows
+    with closing(AdvertisDriver(db_file_name)) as driver:
+        banner_ids = [driver.insert_banner(make_banner(f'Banner {number}')) for number in range(3)]
+        banners, aggregates = load_banners_with_aggregates(driver)
+        assert [banner.day_counts for banner in banners] == [{}, {}, {}]
+        assert aggregates.banner_ids.tolist() == banner_ids
+        assert_same_aggregates(aggregates, rebuilt_aggregates(driver, tmp_path))
+
+
+def test_failed_cache_write_is_logged(caplog, tmp_path, driver: AdvertisDriver):
+    insert_banners_with_showings(driver)
+    # The directory of the cache cannot be created
+    cache_file = tmp_path / 'not_a_directory'
+    cache_file.write_text('')
+    with caplog.at_level('WARNING'), driver.read_transaction():
+        aggregates = load_aggregates(driver, str(cache_file))
+    assert_same_aggregates(aggregates, rebuilt_aggregates(driver, tmp_path))
+    assert 'The cache of the aggregates was not written' in caplog.text
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sqlite3
+from http import HTTPStatus
+
+from conftest import make_banner
+from src.api_server import *
+
+
+# Responses of one server to the requests of /totals, the ETag of the previous response is sent
+# in If-None-Match when revalidate is True
+async def respond(db_file_name: str, *revalidate: bool, etag: str = '') -> list[tuple[HTTPStatus, bytes, str]]:
+    cache = AnalysisCache(db_file_name, check_interval=0)
+    try:
+        server = ApiServer(cache)
+        responses = []
+        for send_etag in revalidate:
+            responses.append(await server._respond('GET', '/totals', {'if-none-match': etag} if send_etag else {}))
+            etag = responses[-1][2] or etag
+        return responses
+    finally:
+        await cache.close()
+
+
+def test_unchanged_database_is_not_modified(db_file_name: str, driver: AdvertisDriver):
+    driver.insert_banner(make_banner())
+    (status, body, etag), (status_again, _, etag_again) = asyncio.run(respond(db_file_name, False, True))
+    assert status == HTTPStatus.OK and json.loads(body)
+    assert status_again == HTTPStatus.NOT_MODIFIED and etag_again == etag
+
+
+def test_restarted_server_does_not_repeat_the_etags(db_file_name: str, driver: AdvertisDriver):
+    driver.insert_banner(make_banner())
+    _, _, etag = asyncio.run(respond(db_file_name, False))[0]
+    # The database is changed while the server is stopped, the new server opens its connection
+    # with the same data version
+    driver.insert_banner(make_banner('Banner 2'))
+    status, body, new_etag = asyncio.run(respond(db_file_name, True, etag=etag))[0]
+    assert status == HTTPStatus.OK and new_etag != etag
+    assert json.loads(body)
+
+
+# Response of a server listening on a free port to the request (b'' - nothing is sent)
+async def send_request(db_file_name: str, request: bytes, idle_timeout: float = 5) -> bytes:
+    cache = AnalysisCache(db_file_name, check_interval=0)
+    server = await ApiServer(cache, idle_timeout).start('127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        server.close()
+        await server.wait_closed()
+        await cache.close()
+
+
+def test_malformed_content_length_is_a_bad_request(db_file_name: str, driver: AdvertisDriver):
+    response = asyncio.run(send_request(db_file_name, b'GET /totals HTTP/1.1\r\nContent-Length: abc\r\n\r\n'))
+    assert response.startswith(b'HTTP/1.1 400 ')
+    assert b'Content-Length' in response.partition(b'\r\n\r\n')[2]
+
+
+def test_idle_connection_is_closed(db_file_name: str, driver: AdvertisDriver):
+    assert asyncio.run(send_request(db_file_name, b'', idle_timeout=0.1)) == b''
+
+
+def test_database_is_opened_read_only(tmp_path, db_file_name: str, driver: AdvertisDriver):
+    driver.insert_banner(make_banner())
+    schema_version = driver._read_con.execute("PRAGMA schema_version").fetchone()[0]
+    assert asyncio.run(respond(db_file_name, False))[0][0] == HTTPStatus.OK
+    assert driver._read_con.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+    # Databases of another schema version and missing files are not changed or created
+    old = sqlite3.connect(tmp_path / 'old.db')
+    old.execute("CREATE TABLE banners (id INTEGER)")
+    old.close()
+    status, body, _ = asyncio.run(respond(str(tmp_path / 'old.db'), False))[0]
+    assert status == HTTPStatus.INTERNAL_SERVER_ERROR and b'schema version' in body
+    assert asyncio.run(respond(str(tmp_path / 'missing.db'), False))[0][0] == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert not os.path.exists(tmp_path / 'missing.db')
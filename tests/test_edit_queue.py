@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from conftest import make_banner
+from src.models.edit_queue import *
+
+
+@pytest.fixture(scope='module', autouse=True)
+def application():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    yield app
+
+
+@pytest.fixture
+def queue(driver: AdvertisDriver) -> EditQueue:
+    # The edits are written only by flush
+    return EditQueue(driver, flush_interval=60)
+
+
+def insert_other_showing(db_file_name: str, banner_id: int, uid: int = None):
+    other = sqlite3.connect(db_file_name)
+    other.execute("INSERT INTO showings (id, site_name, ts, banner_id) VALUES (?, 'other.com', ?, ?)",
+                  (uid, today() * MINUTES_PER_DAY, banner_id))
+    other.commit()
+    other.close()
+
+
+def test_flush_writes_the_queued_edits_in_order(driver: AdvertisDriver, queue: EditQueue):
+    banner_id = queue.insert_banner(make_banner())
+    first = queue.insert_showing(ShowingShortData('a.com', today() * MINUTES_PER_DAY), banner_id)
+    second = queue.insert_showing(ShowingShortData('b.com', today() * MINUTES_PER_DAY + 1), banner_id)
+    queue.update_showing(Showing(first, 'c.com', today() * MINUTES_PER_DAY + 2, banner_id))
+    queue.delete_showing(second)
+    assert driver.get_all_banners() == []
+    assert queue.flush()
+    assert queue.pending() == 0
+    assert [banner.id for banner in driver.get_all_banners()] == [banner_id]
+    assert driver.get_showings_for_banner(banner_id) == [Showing(first, 'c.com', today() * MINUTES_PER_DAY + 2,
+                                                                 banner_id)]
+
+
+def test_rows_of_a_concurrent_writer_do_not_take_the_queued_ids(db_file_name: str, driver: AdvertisDriver,
+                                                                 queue: EditQueue):
+    banner_id = driver.insert_banner(make_banner())
+    failures = []
+    queue.flush_failed.connect(failures.append)
+    uid = queue.insert_showing(ShowingShortData('queued.com', today() * MINUTES_PER_DAY), banner_id)
+    insert_other_showing(db_file_name, banner_id)
+    assert queue.flush()
+    assert failures == []
+    sites = {showing.id: showing.site_name for showing in driver.get_showings_for_banner(banner_id)}
+    assert sites[uid] == 'queued.com'
+    assert sorted(sites.values()) == ['other.com', 'queued.com']
+    assert driver.count_showings_for_day(banner_id, today()) == 2
+
+
+def test_failed_flush_keeps_the_edits(db_file_name: str, driver: AdvertisDriver, queue: EditQueue):
+    banner_id = driver.insert_banner(make_banner())
+    failures = []
+    queue.flush_failed.connect(failures.append)
+    uid = queue.insert_showing(ShowingShortData('queued.com', today() * MINUTES_PER_DAY), banner_id)
+    # The id is taken explicitly, so the queued insert fails
+    insert_other_showing(db_file_name, banner_id, uid)
+    assert not queue.flush()
+    assert len(failures) == 1 and 'UNIQUE' in failures[0]
+    assert queue.pending() == 1
+    driver.delete_showing(uid)
+    assert queue.flush()
+    assert [showing.site_name for showing in driver.get_showings_for_banner(banner_id)] == ['queued.com']
+
+
+def test_ids_are_reserved_by_blocks(db_file_name: str, driver: AdvertisDriver, queue: EditQueue):
+    banner_id = driver.insert_banner(make_banner())
+    uids = [queue.insert_showing(ShowingShortData(f'{number}.com', today() * MINUTES_PER_DAY), banner_id)
+            for number in range(3)]
+    assert uids == list(range(uids[0], uids[0] + 3))
+    sequence = "SELECT seq FROM sqlite_sequence WHERE name = 'showings'"
+    assert driver._read_con.execute(sequence).fetchone()[0] == uids[0] + ID_BLOCK_SIZE - 1
+    insert_other_showing(db_file_name, banner_id)
+    assert queue.flush()
+    assert max(showing.id for showing in driver.get_showings_for_banner(banner_id)) == uids[0] + ID_BLOCK_SIZE
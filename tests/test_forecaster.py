@@ -0,0 +1,45 @@
+import pytest
+from PyQt5.QtCore import QCoreApplication
+
+from conftest import make_banner
+from src.models.banner_editor import BannerEditor
+from src.models.forecaster import *
+
+
+@pytest.fixture(scope='module', autouse=True)
+def application():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    yield app
+
+
+@pytest.fixture
+def banners_and_aggregates(db_file_name: str, driver: AdvertisDriver) -> tuple[list[Banner], Aggregates]:
+    banner_id = driver.insert_banner(make_banner())
+    driver.insert_showing_rows([('a.com', (today() - day) * MINUTES_PER_DAY, banner_id) for day in range(1, 8)])
+    # The banners are loaded by the task of the main window from the database of the editor
+    return BannerEditor.load_banners(db_file_name)
+
+
+def test_forecast_is_calculated_from_the_captured_arguments(banners_and_aggregates):
+    banners, aggregates = banners_and_aggregates
+    forecaster = Forecaster()
+    forecaster.set_aggregates(aggregates)
+    arguments = forecaster.forecast_arguments(banners)
+    forecast = Forecaster.calc_forecast(*arguments)
+    # The calculation does not change the model, the result is applied by set_forecast
+    assert forecaster.rowCount() == 0 and forecaster._week_profile_key is None
+    forecaster.set_forecast(forecast)
+    assert forecaster.rowCount() == 1
+    assert forecaster._week_profile_key == (banners[0].date_start, today())
+    assert forecaster.get_forecast_for_banner(0)[0][0] == today()
+
+
+def test_week_profile_of_a_forecast_started_before_an_invalidation_is_not_kept(banners_and_aggregates):
+    banners, aggregates = banners_and_aggregates
+    forecaster = Forecaster()
+    forecaster.set_aggregates(aggregates)
+    arguments = forecaster.forecast_arguments(banners)
+    forecaster.invalidate_week_profile()
+    forecaster.set_forecast(Forecaster.calc_forecast(*arguments))
+    assert forecaster.rowCount() == 1
+    assert forecaster._week_profile_key is None
@@ -0,0 +1,30 @@
+import csv
+import io
+import sqlite3
+
+from conftest import make_banner
+from src.models.showing_export import *
+
+
+def test_export_reads_the_banners_and_the_shows_of_one_state(monkeypatch, db_file_name: str,
+                                                             driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    driver.insert_showing_rows([('a.com', today() * MINUTES_PER_DAY + minute, banner_id) for minute in range(3)])
+    read_banner_rows = driver.iter_banner_rows
+
+    # Another connection adds a banner with a show after the banners are read
+    def iter_banner_rows(showing_filter=None):
+        rows = list(read_banner_rows(showing_filter))
+        other = sqlite3.connect(db_file_name)
+        other.execute("""INSERT INTO banners (name, company_name, date_start, date_end, min_showings, max_showings)
+                      SELECT 'Banner 2', company_name, date_start, date_end, min_showings, max_showings FROM banners""")
+        other.execute("INSERT INTO showings (site_name, ts, banner_id) VALUES ('b.com', ?, last_insert_rowid())",
+                      (today() * MINUTES_PER_DAY,))
+        other.commit()
+        other.close()
+        return iter(rows)
+
+    monkeypatch.setattr(driver, 'iter_banner_rows', iter_banner_rows)
+    rows = list(csv.DictReader(io.StringIO(''.join(export_showing_blocks(driver, 'csv')))))
+    assert [(row['name'], row['site_name']) for row in rows] == [('Banner 1', 'a.com')] * 3
+    assert driver.count_showings_for_day(banner_id + 1, today()) == 1
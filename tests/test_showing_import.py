@@ -0,0 +1,90 @@
+import csv
+import json
+
+import pytest
+
+from conftest import make_banner
+from src.drivers.parallel_import import *
+
+
+def time_text(day: int, minute: int = 0) -> str:
+    return minutes_to_iso(day * MINUTES_PER_DAY + minute)
+
+
+# Rows of the imported file with the expected rejection reasons (None - the row is accepted)
+def import_rows(banner_id: int) -> list[tuple[dict, str]]:
+    day = today()
+    return [({'site_name': 'a.com', 'time': time_text(day, 60), 'banner_id': banner_id}, None),
+            ({'site_name': 'b.com', 'time': time_text(day, 61).replace(' ', 'T') + ':30', 'banner_id': banner_id}, None),
+            ({'site_name': '', 'time': time_text(day), 'banner_id': banner_id}, 'invalid_site'),
+            ({'site_name': 'c.com', 'time': day_to_iso(day), 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': day_to_iso(day)[:4], 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day) + 'Z', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day) + '+02:00', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day) + ':00.5', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day) + ':61', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day)[:11] + '24:00', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': 'yesterday', 'banner_id': banner_id}, 'invalid_time'),
+            ({'site_name': 'c.com', 'time': time_text(day), 'banner_id': 'one'}, 'invalid_banner_id'),
+            ({'site_name': 'c.com', 'time': time_text(day), 'banner_id': banner_id + 100}, 'unknown_banner'),
+            ({'site_name': 'c.com', 'time': time_text(day + 30), 'banner_id': banner_id}, 'outside_period'),
+            ({'site_name': 'd.com', 'time': time_text(day, 62), 'banner_id': banner_id}, None),
+            ({'site_name': 'e.com', 'time': time_text(day, 63), 'banner_id': banner_id}, 'max_shows_reached')]
+
+
+def write_csv(file_name: str, rows: list[dict]):
+    with open(file_name, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=IMPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_jsonl(file_name: str, rows: list[dict]):
+    with open(file_name, 'w', encoding='utf-8') as file:
+        for row in rows:
+            file.write(json.dumps(row) + '\n')
+
+
+def read_rejects(file_name: str) -> list[tuple[int, str]]:
+    with open(file_name, newline='', encoding='utf-8') as file:
+        return [(int(row['line']), row['reason']) for row in csv.DictReader(file)]
+
+
+@pytest.mark.parametrize('input_format', IMPORT_FORMATS)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_invalid_rows_are_rejected_with_their_reasons(tmp_path, driver: AdvertisDriver, input_format: str,
+                                                      workers: int):
+    banner_id = driver.insert_banner(make_banner(max_showings=4))
+    # One show of the day is in the database already
+    driver.insert_showing(ShowingShortData('old.com', today() * MINUTES_PER_DAY), banner_id)
+    rows = import_rows(banner_id)
+    file_name = str(tmp_path / f'impressions.{input_format}')
+    (write_csv if input_format == 'csv' else write_jsonl)(file_name, [row for row, _ in rows])
+    rejects_file_name = str(tmp_path / 'rejects.csv')
+    if workers == 1:
+        stats = ShowingImporter(driver, chunk_size=5).import_file(file_name, None, rejects_file_name)
+    else:
+        stats = ParallelImporter(driver, workers, part_size=200).import_files([file_name], None,
+                                                                               [rejects_file_name])[0]
+
+    # The lines of the CSV rows are counted after the header
+    first_line = 2 if input_format == 'csv' else 1
+    assert read_rejects(rejects_file_name) == [(index + first_line, reason) for index, (_, reason) in enumerate(rows)
+                                               if reason is not None]
+    assert stats.rows == len(rows)
+    assert stats.accepted == sum(reason is None for _, reason in rows)
+    assert sorted(showing.site_name for showing in driver.get_showings_for_banner(banner_id)) == \
+           ['a.com', 'b.com', 'd.com', 'old.com']
+    assert driver.count_showings_for_day(banner_id, today()) == 4
+    assert min(stats.stage_seconds.values()) >= 0
+
+
+def test_malformed_csv_rows_are_rejected(tmp_path, driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    file_name = str(tmp_path / 'impressions.csv')
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.write(f'site_name,time,banner_id\na.com,{time_text(today())},{banner_id}\nb.com,{time_text(today())}\n')
+    rejects_file_name = str(tmp_path / 'rejects.csv')
+    stats = ShowingImporter(driver).import_file(file_name, None, rejects_file_name)
+    assert read_rejects(rejects_file_name) == [(3, 'malformed')]
+    assert (stats.rows, stats.accepted) == (2, 1)
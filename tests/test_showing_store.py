@@ -0,0 +1,65 @@
+from random import Random
+
+import pytest
+from PyQt5.QtCore import QCoreApplication, QModelIndex
+
+from conftest import make_banner
+from src.models.showing_editor import *
+from src.models.showing_store import *
+
+
+@pytest.fixture(scope='module', autouse=True)
+def application():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    yield app
+
+
+def test_store_behaves_as_a_list_of_the_shows():
+    random = Random(1)
+    sites = SiteTable()
+    store = ShowingStore(7, sites=sites)
+    expected = []
+    for uid in range(500):
+        showing = Showing(uid, f'site{random.randrange(5)}.com', random.randrange(10 ** 8), 7)
+        operation = random.randrange(5)
+        if operation == 0 and expected:
+            index = random.randrange(-len(expected), len(expected))
+            assert store.pop(index) == expected.pop(index)
+        elif operation == 1 and expected:
+            index = random.randrange(len(expected))
+            del store[index]
+            del expected[index]
+        elif operation == 2 and expected:
+            index = random.randrange(len(expected))
+            store[index] = expected[index] = showing
+        elif operation == 3:
+            index = random.randrange(len(expected) + 1)
+            store.insert(index, showing)
+            expected.insert(index, showing)
+        else:
+            store.extend([showing] * 3)
+            expected.extend([showing] * 3)
+    assert list(store) == expected
+    assert [store.site_name(index) for index in range(len(store))] == [showing.site_name for showing in expected]
+    assert len(sites) == 5
+    with pytest.raises(IndexError):
+        store[len(expected)]
+
+
+def test_editor_keeps_the_loaded_pages_in_order(driver: AdvertisDriver):
+    banner_id = driver.insert_banner(make_banner())
+    day = today()
+    driver.insert_showing_rows([(f'site{number % 3}.com', day * MINUTES_PER_DAY + number * 2, banner_id)
+                                for number in range(10)])
+    editor = ShowingEditor(driver, page_size=4)
+    editor.init_showings(banner_id)
+    assert editor.rowCount() == 4 and editor.canFetchMore(QModelIndex())
+    editor.fetchMore(QModelIndex())
+    assert editor.rowCount() == 8
+    uid = driver.insert_showing(ShowingShortData('new.com', day * MINUTES_PER_DAY + 3), banner_id)
+    editor.showing_added(Showing(uid, 'new.com', day * MINUTES_PER_DAY + 3, banner_id))
+    assert editor.get_showing(2) == Showing(uid, 'new.com', day * MINUTES_PER_DAY + 3, banner_id)
+    assert editor.data(editor.index(2, 0)) == 'new.com'
+    editor.showing_replaced(2, Showing(uid, 'new.com', day * MINUTES_PER_DAY + 13, banner_id))
+    assert [editor.get_showing(row).ts - day * MINUTES_PER_DAY for row in range(editor.rowCount())] == \
+           [0, 2, 4, 6, 8, 10, 12, 13, 14]